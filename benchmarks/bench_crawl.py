@@ -0,0 +1,169 @@
+"""
+Measure end-to-end crawl throughput of Runner against a synthetic site.
+
+Starts the synthetic site (benchmarks/synthetic_site.py) in a child
+process and crawls it from page 0 with a Runner whose HTTP client is
+routed to that site and whose storage keeps page bodies in memory, so
+no S3 is involved. Reports pages per second, peak RSS and time per
+stage taken from the crawler's own metrics. Needs a reachable Postgres
+configured through the usual POSTGRES_* settings; run from the
+repository root so the migrations are found. With ``--frontier sqlite``
+the crawl is kept in a temporary SQLite file instead and needs no
+database server.
+
+    PYTHONPATH=src python benchmarks/bench_crawl.py --pages 2000 --hosts 20 --fan-out 20
+    PYTHONPATH=src python benchmarks/bench_crawl.py --pages 2000 --frontier sqlite
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import resource
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import asdict
+from typing import Optional
+
+import app.db as db
+from app import metrics
+from app.config import settings
+from app.runner import Runner
+from app.storage import StoredCallback, object_key
+
+from synthetic_site import SiteSpec, routed_client, start_site
+
+
+class MemoryStorage:
+    """In-process stand-in for Storage that keeps bodies in a dict."""
+
+    def __init__(self):
+        self.objects = {}
+        self.stats = defaultdict(int)
+        self._on_stored: Optional[StoredCallback] = None
+
+    async def start(self, on_stored: Optional[StoredCallback] = None) -> None:
+        self._on_stored = on_stored
+
+    async def submit(self, url_id: int, url: str, content: bytes, digest: Optional[str] = None):
+        key = object_key(digest or hashlib.sha256(content).hexdigest())
+        if key in self.objects:
+            self.stats["deduplicated"] += 1
+        else:
+            self.objects[key] = content
+            self.stats["uploaded"] += 1
+            self.stats["stored_bytes"] += len(content)
+        if self._on_stored:
+            await self._on_stored(url_id, key)
+
+    async def flush(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+def _max_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _stages(snapshot: metrics.Snapshot) -> dict:
+    """Total and mean time per stage from the crawler's histograms."""
+    stages = {}
+    for name, family in snapshot.items():
+        if family["type"] != "histogram":
+            continue
+        for sample in family["samples"]:
+            if not sample["count"]:
+                continue
+            stage = name.removeprefix("crawler_").removesuffix("_seconds")
+            if sample["labels"]:
+                stage += ":" + ",".join(sample["labels"].values())
+            stages[stage] = {
+                "count": sample["count"],
+                "seconds": round(sample["sum"], 4),
+                "mean_milliseconds": round(sample["sum"] / sample["count"] * 1000, 3),
+            }
+    return stages
+
+
+async def crawl(spec: SiteSpec, port: int) -> dict:
+    run_id = f"bench-crawl-{uuid.uuid4().hex[:8]}"
+    runner = Runner(run_id, spec.url(0))
+    await runner.http_client.aclose()
+    runner.http_client = routed_client(port)
+    runner.robots_cache.client = runner.http_client
+    # The site's hosts only exist inside the routed client
+    runner.dns_cache = None
+    runner.storage = MemoryStorage()
+
+    rss_before = _max_rss_mb()
+    started = time.perf_counter()
+    try:
+        await runner.start()
+        elapsed = time.perf_counter() - started
+    finally:
+        if settings.frontier == "postgres":
+            async with db.get_connection() as conn:
+                await conn.execute("DELETE FROM crawl_runs WHERE id = $1", run_id)
+
+    processed = runner.stats["fetched"] + runner.stats["unchanged"] + runner.stats["errors"]
+    return {
+        "site": asdict(spec),
+        "frontier": settings.frontier,
+        "max_concurrency": settings.max_concurrency,
+        "parse_workers": settings.parse_workers,
+        "pages": processed,
+        **runner.stats,
+        "seconds": round(elapsed, 3),
+        "pages_per_second": round(processed / elapsed, 1),
+        "max_rss_megabytes": _max_rss_mb(),
+        "max_rss_growth_megabytes": round(_max_rss_mb() - rss_before, 1),
+        "stages": _stages(metrics.REGISTRY.snapshot()),
+    }
+
+
+async def _run(spec: SiteSpec, port: int) -> dict:
+    if settings.frontier != "postgres":
+        return await crawl(spec, port)
+    try:
+        async with db.get_connection() as conn:
+            await db.init_db(conn)
+        return await crawl(spec, port)
+    finally:
+        await db.close_pool()
+
+
+def main(
+    spec: SiteSpec, concurrency: int = 64, crawl_delay: float = 0.0, frontier: str = "postgres"
+) -> dict:
+    settings.frontier = frontier
+    settings.max_concurrency = concurrency
+    settings.default_crawl_delay = crawl_delay
+    settings.follow_external_links = True  # the site's hosts link to each other
+    settings.checkpoint_interval = 0
+    port, site = start_site(spec)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            settings.sqlite_path = f"{tmp}/crawler.db"
+            return asyncio.run(_run(spec, port))
+    finally:
+        site.terminate()
+        site.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    for field, value in asdict(SiteSpec()).items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=type(value), default=value)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--crawl-delay", type=float, default=0.0)
+    parser.add_argument("--frontier", choices=["postgres", "sqlite"], default="postgres")
+    args = vars(parser.parse_args())
+    options = args.pop("concurrency"), args.pop("crawl_delay"), args.pop("frontier")
+    print(json.dumps(main(SiteSpec(**args), *options), indent=2))
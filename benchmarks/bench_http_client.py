@@ -0,0 +1,94 @@
+"""
+Compare a client per request with the shared, pooled client.
+
+Starts a local HTTP/1.1 keep-alive server, fetches the same pages with
+both strategies and reports wall time and the number of TCP connections
+the server accepted. Every new connection is a handshake the crawler has
+to pay for; over TLS each one also costs a TLS handshake.
+
+    PYTHONPATH=src python benchmarks/bench_http_client.py --requests 500
+"""
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+from app.http_client import create_client
+
+BODY = b"<html><body>" + b"<a href='/x'>x</a>" * 50 + b"</body></html>"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+class _CountingServer(ThreadingHTTPServer):
+    daemon_threads = True
+    connections = 0
+
+    def get_request(self):
+        request = super().get_request()
+        self.connections += 1
+        return request
+
+
+async def _per_request(urls):
+    for url in urls:
+        async with httpx.AsyncClient() as client:
+            (await client.get(url)).raise_for_status()
+
+
+async def _shared(urls):
+    client = create_client()
+    try:
+        for url in urls:
+            (await client.get(url)).raise_for_status()
+    finally:
+        await client.aclose()
+
+
+async def main(requests: int) -> dict:
+    server = _CountingServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    urls = [f"{base}/page/{i}" for i in range(requests)]
+
+    results = {}
+    try:
+        for name, strategy in (("per_request_client", _per_request), ("shared_client", _shared)):
+            server.connections = 0
+            started = time.perf_counter()
+            await strategy(urls)
+            elapsed = time.perf_counter() - started
+            results[name] = {
+                "requests": requests,
+                "seconds": round(elapsed, 4),
+                "requests_per_second": round(requests / elapsed, 1),
+                "connections": server.connections,
+            }
+    finally:
+        server.shutdown()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main(args.requests)), indent=2))
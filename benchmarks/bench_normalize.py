@@ -0,0 +1,68 @@
+"""
+Measure normalize_url throughput before and after memoization.
+
+Builds a workload shaped like a crawl: every page repeats the same
+navigation links and adds its own, some with already-sorted query
+strings and some unsorted. Reports URLs per second for the original
+implementation, the new one with a cold cache, and the new one with a
+warm cache, plus the cache hit rate.
+
+    PYTHONPATH=src python benchmarks/bench_normalize.py --pages 500
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+from app.parser import normalize_cache_stats, normalize_url
+
+# The reference normalizer lives with the tests that check against it
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "tests"))
+from normalize_reference import normalize_url_reference  # noqa: E402
+
+
+def workload(pages: int, links: int = 200, nav: int = 60):
+    rng = random.Random(0)
+    nav_links = [f"http://example.com/section/{i}/" for i in range(nav)]
+    urls = []
+    for page in range(pages):
+        urls += nav_links
+        for i in range(links - nav):
+            if rng.random() < 0.5:
+                query = f"?a={rng.randint(1, 9)}&page={page}"
+            else:
+                query = f"?sort=desc&id={i}&page={page}"
+            urls.append(f"HTTP://Example.com:80/article/{page}/{i}/{query}#top")
+    return urls
+
+
+def _rate(fn, urls) -> float:
+    started = time.perf_counter()
+    for url in urls:
+        fn(url)
+    return len(urls) / (time.perf_counter() - started)
+
+
+def main(pages: int) -> dict:
+    urls = workload(pages)
+    normalize_url.cache_clear()
+    results = {
+        "urls": len(urls),
+        "reference_urls_per_second": round(_rate(normalize_url_reference, urls)),
+        "cold_cache_urls_per_second": round(_rate(normalize_url, urls)),
+    }
+    cold_stats = normalize_cache_stats()
+    results["warm_cache_urls_per_second"] = round(_rate(normalize_url, urls))
+    results["cold_hit_rate"] = round(cold_stats["hit_rate"], 3)
+    results["identical"] = all(normalize_url(u) == normalize_url_reference(u) for u in urls)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pages", type=int, default=500)
+    args = parser.parse_args()
+    print(json.dumps(main(args.pages), indent=2))
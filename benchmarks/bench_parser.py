@@ -0,0 +1,84 @@
+"""
+Compare the link extraction engines over a fixture corpus.
+
+The corpus is every HTML file under tests/fixtures plus synthetic pages
+shaped like real ones (navigation, body text, scripts and a few hundred
+links). Each engine extracts links from every page; the script checks
+that both return identical sets and reports pages and MB per second.
+
+    PYTHONPATH=src python benchmarks/bench_parser.py --pages 200
+"""
+
+import argparse
+import json
+import random
+import time
+from pathlib import Path
+
+from app.parser import LINK_EXTRACTORS, parse_and_extract_links
+
+FIXTURES = Path(__file__).resolve().parents[1] / "tests" / "fixtures"
+
+
+def synthetic_page(seed: int, links: int = 300) -> str:
+    rng = random.Random(seed)
+    nav = "".join(f'<li><a href="/section/{i}/">Section {i}</a></li>' for i in range(40))
+    body = []
+    for i in range(links):
+        query = f"?page={rng.randint(1, 50)}&sort=asc" if rng.random() < 0.3 else ""
+        href = rng.choice(
+            [
+                f"/article/{seed}-{i}{query}",
+                f"https://ext{i % 17}.example.org/p/{i}",
+                f"rel/{i}.html",
+            ]
+        )
+        body.append(
+            f'<div class="card c{i}"><p>Lorem ipsum dolor sit amet &amp; more {i}.</p>'
+            f'<a class="link" href="{href}" title="Item {i}">Item {i}</a>'
+            f'<img src="/img/{i}.png" alt="image {i}"></div>'
+        )
+    return (
+        "<!DOCTYPE html><html><head><title>Synthetic</title>"
+        "<script>var x = '<a href=\"/not-a-link\">';</script></head><body>"
+        f"<nav><ul>{nav}</ul></nav>{''.join(body)}<footer>Footer</footer></body></html>"
+    )
+
+
+def corpus(pages: int):
+    docs = [
+        (f"http://localhost:8000/{p.name}", p.read_text()) for p in sorted(FIXTURES.glob("*.html"))
+    ]
+    docs += [(f"http://bench.example.com/page/{i}", synthetic_page(i)) for i in range(pages)]
+    return docs
+
+
+def main(pages: int, repeat: int) -> dict:
+    docs = corpus(pages)
+    total_bytes = sum(len(html.encode()) for _, html in docs)
+    results = {"documents": len(docs), "megabytes": round(total_bytes / 1e6, 2)}
+    outputs = {}
+    for engine in LINK_EXTRACTORS:
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            outputs[engine] = [
+                parse_and_extract_links(html, url, engine=engine) for url, html in docs
+            ]
+            best = min(best, time.perf_counter() - started)
+        results[engine] = {
+            "seconds": round(best, 4),
+            "pages_per_second": round(len(docs) / best, 1),
+            "megabytes_per_second": round(total_bytes / 1e6 / best, 2),
+        }
+    results["identical"] = outputs["fast"] == outputs["bs4"]
+    results["speedup"] = round(results["bs4"]["seconds"] / results["fast"]["seconds"], 2)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(main(args.pages, args.repeat), indent=2))
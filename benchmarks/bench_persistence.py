@@ -0,0 +1,147 @@
+"""
+Measure database round trips per page for link and status bookkeeping.
+
+Replays the writes of a crawl (one status update plus N discovered
+links per page) against Postgres, once with the per-link statements the
+runner used to issue and once through the batched Persistence layer,
+and reports round trips and wall time per page. Needs a reachable
+Postgres configured through the usual POSTGRES_* settings.
+
+    PYTHONPATH=src python benchmarks/bench_persistence.py --pages 200 --links 300
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import asyncpg
+
+import app.db as db
+from app.config import settings
+from app.frontier import PostgresFrontier
+from app.persistence import Persistence
+from app.queue import enqueue_if_new
+
+NAV_LINKS = 50  # links repeated on every page, like a site's navigation
+
+
+def _page_links(prefix: str, page: int, links: int):
+    nav = [f"http://{prefix}.bench/nav/{i}" for i in range(NAV_LINKS)]
+    own = [f"http://{prefix}.bench/p{page}/{i}" for i in range(links - NAV_LINKS)]
+    return [(url, url, f"{prefix}.bench", True) for url in nav + own]
+
+
+async def _create_run(conn, run_id: str, prefix: str, pages: int) -> list:
+    await conn.execute(
+        "INSERT INTO crawl_runs (id, seed_domain) VALUES ($1, $2)", run_id, f"{prefix}.bench"
+    )
+    rows = await conn.fetch(
+        """
+        INSERT INTO urls (url, normalized_url, domain, crawl_run_id)
+        SELECT u, u, $2, $1
+        FROM unnest($3::text[]) AS u
+        RETURNING id
+        """,
+        run_id,
+        f"{prefix}.bench",
+        [f"http://{prefix}.bench/page/{i}" for i in range(pages)],
+    )
+    return [r["id"] for r in rows]
+
+
+async def _per_statement(run_id, prefix, page_ids, links):
+    async with db.get_connection() as conn:
+        for page, url_id in enumerate(page_ids):
+            await conn.execute(
+                """
+                UPDATE urls
+                SET status = 'fetched', http_status = $2, fetch_attempts = fetch_attempts + 1,
+                    content_type = $3, content_size = $4, last_seen = now()
+                WHERE id = $1
+                """,
+                url_id,
+                200,
+                "text/html",
+                1024,
+            )
+            for url, normalized, domain, _ in _page_links(prefix, page, links):
+                link_id = await conn.fetchval(
+                    """
+                    INSERT INTO urls (url, normalized_url, domain, crawl_run_id)
+                    VALUES ($1, $2, $3, $4)
+                    ON CONFLICT (crawl_run_id, normalized_url) DO UPDATE
+                    SET last_seen = now()
+                    RETURNING id
+                    """,
+                    url,
+                    normalized,
+                    domain,
+                    run_id,
+                )
+                await enqueue_if_new(conn, link_id, run_id)
+
+
+async def _batched(run_id, prefix, page_ids, links):
+    persistence = Persistence(run_id, PostgresFrontier())
+    for page, url_id in enumerate(page_ids):
+        await persistence.record_fetched(url_id, 200, "text/html", 1024)
+        await persistence.add_links(_page_links(prefix, page, links))
+    await persistence.close()
+
+
+async def main(pages: int, links: int) -> dict:
+    round_trips = 0
+
+    def count(record):
+        nonlocal round_trips
+        round_trips += 1
+
+    async def init(conn):
+        conn.add_query_logger(count)
+
+    db._pool = await asyncpg.create_pool(
+        settings.get_postgres_dsn(),
+        min_size=1,
+        max_size=settings.db_pool_max_size,
+        init=init,
+    )
+    async with db.get_connection() as conn:
+        await db.init_db(conn)
+
+    results = {}
+    run_ids = []
+    try:
+        for name, strategy in (("per_statement", _per_statement), ("batched", _batched)):
+            prefix = f"{name}-{uuid.uuid4().hex[:8]}"
+            run_id = f"bench-{prefix}"
+            run_ids.append(run_id)
+            async with db.get_connection() as conn:
+                page_ids = await _create_run(conn, run_id, prefix, pages)
+
+            round_trips = 0
+            started = time.perf_counter()
+            await strategy(run_id, prefix, page_ids, links)
+            elapsed = time.perf_counter() - started
+            results[name] = {
+                "pages": pages,
+                "links_per_page": links,
+                "round_trips": round_trips,
+                "round_trips_per_page": round(round_trips / pages, 2),
+                "seconds": round(elapsed, 3),
+                "pages_per_second": round(pages / elapsed, 1),
+            }
+    finally:
+        async with db.get_connection() as conn:
+            await conn.execute("DELETE FROM crawl_runs WHERE id = ANY($1::text[])", run_ids)
+        await db._pool.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--links", type=int, default=300)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main(args.pages, args.links)), indent=2))
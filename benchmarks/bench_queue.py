@@ -0,0 +1,120 @@
+"""
+Measure the queue SQL the crawler runs for every page.
+
+Queues URLs spread over many hosts for one run, then drains the queue
+the way crawlers do: lease a batch per host, heartbeat the leases and
+ack the URLs, rescanning the queued hosts along the way. Reports
+microseconds per statement and URLs per second for each step. Needs a
+reachable Postgres configured through the usual POSTGRES_* settings;
+run from the repository root so the migrations are found.
+
+    PYTHONPATH=src python benchmarks/bench_queue.py --urls 20000 --hosts 200
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from collections import defaultdict
+
+import app.db as db
+from app.queue import ack, get_queued_domains, heartbeat, lease_batch
+
+OWNER = "bench-queue"
+
+
+async def _create_run(conn, run_id: str, urls: int, hosts: int) -> None:
+    await conn.execute(
+        "INSERT INTO crawl_runs (id, seed_domain) VALUES ($1, $2)", run_id, "h0.bench"
+    )
+    await conn.execute(
+        """
+        WITH inserted AS (
+            INSERT INTO urls (url, normalized_url, domain, crawl_run_id)
+            SELECT 'http://' || domain || '/' || i, 'http://' || domain || '/' || i, domain, $1
+            FROM generate_series(0, $2::int - 1) AS i,
+                 LATERAL (SELECT 'h' || (i % $3::int) || '.bench' AS domain) AS d
+            RETURNING id, domain
+        )
+        INSERT INTO queue (url_id, crawl_run_id, domain, priority, enqueued_at, next_fetch_at)
+        SELECT id, $1, domain, 0, now(), now()
+        FROM inserted
+        """,
+        run_id,
+        urls,
+        hosts,
+    )
+
+
+def _timing(timings, step: str, started: float, rows: int) -> None:
+    entry = timings[step]
+    entry["statements"] += 1
+    entry["rows"] += rows
+    entry["seconds"] += time.perf_counter() - started
+
+
+async def drain(conn, run_id: str, batch_size: int) -> dict:
+    timings = defaultdict(lambda: {"statements": 0, "rows": 0, "seconds": 0.0})
+    while True:
+        started = time.perf_counter()
+        domains = await get_queued_domains(conn, run_id)
+        _timing(timings, "queued_domains", started, len(domains))
+        if not domains:
+            break
+        for domain, _ in domains:
+            started = time.perf_counter()
+            batch = await lease_batch(conn, run_id, domain, OWNER, batch_size, 60)
+            _timing(timings, "lease_batch", started, len(batch))
+            url_ids = [item.url_id for item in batch]
+
+            started = time.perf_counter()
+            await heartbeat(conn, OWNER, url_ids, 60)
+            _timing(timings, "heartbeat", started, len(url_ids))
+
+            started = time.perf_counter()
+            await ack(conn, OWNER, url_ids)
+            _timing(timings, "ack", started, len(url_ids))
+
+    return {
+        step: {
+            "statements": t["statements"],
+            "microseconds_per_statement": round(t["seconds"] / t["statements"] * 1e6, 1),
+            "rows_per_second": round(t["rows"] / t["seconds"], 1) if t["seconds"] else None,
+        }
+        for step, t in timings.items()
+    }
+
+
+async def _main(urls: int, hosts: int, batch_size: int) -> dict:
+    run_id = f"bench-queue-{uuid.uuid4().hex[:8]}"
+    try:
+        async with db.get_connection() as conn:
+            await db.init_db(conn)
+            started = time.perf_counter()
+            await _create_run(conn, run_id, urls, hosts)
+            loaded = time.perf_counter() - started
+            results = {
+                "urls": urls,
+                "hosts": hosts,
+                "batch_size": batch_size,
+                "load_seconds": round(loaded, 3),
+                **await drain(conn, run_id, batch_size),
+            }
+            await conn.execute("DELETE FROM crawl_runs WHERE id = $1", run_id)
+        return results
+    finally:
+        await db.close_pool()
+
+
+def main(urls: int = 20000, hosts: int = 200, batch_size: int = 10) -> dict:
+    return asyncio.run(_main(urls, hosts, batch_size))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--urls", type=int, default=20000)
+    parser.add_argument("--hosts", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=10)
+    args = parser.parse_args()
+    print(json.dumps(main(args.urls, args.hosts, args.batch_size), indent=2))
@@ -0,0 +1,54 @@
+"""
+Measure host scheduler overhead as the number of domains grows.
+
+Loads the scheduler with N hosts that each have a few queued URLs, then
+drives it the way the runner does: take the next ready host, release it
+with no delay, until everything is consumed. Reports the mean cost of a
+next_host/release pair for each host count, which should stay roughly
+flat (heap operations are logarithmic, finish detection is O(1)).
+
+    PYTHONPATH=src python benchmarks/bench_scheduler.py --hosts 1000 10000 100000 300000
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from app.scheduler import HostScheduler
+
+
+async def drain(hosts: int, urls_per_host: int) -> dict:
+    scheduler = HostScheduler()
+    started = time.perf_counter()
+    for i in range(hosts):
+        scheduler.add(f"host{i}.example.com", urls_per_host)
+    loaded = time.perf_counter()
+
+    operations = 0
+    while True:
+        host = await scheduler.next_host()
+        if host is None:
+            break
+        scheduler.release(host)
+        operations += 1
+    finished = time.perf_counter()
+
+    return {
+        "hosts": hosts,
+        "urls": operations,
+        "add_microseconds_per_host": round((loaded - started) / hosts * 1e6, 3),
+        "microseconds_per_fetch": round((finished - loaded) / operations * 1e6, 3),
+    }
+
+
+def main(host_counts, urls_per_host: int) -> list:
+    return [asyncio.run(drain(hosts, urls_per_host)) for hosts in host_counts]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--hosts", type=int, nargs="+", default=[1000, 10000, 100000, 300000])
+    parser.add_argument("--urls-per-host", type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(main(args.hosts, args.urls_per_host), indent=2))
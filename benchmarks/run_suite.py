@@ -0,0 +1,150 @@
+"""
+Run the benchmark suite and write the results as one JSON document.
+
+Runs the link extraction, normalization and scheduler microbenchmarks,
+then the queue SQL and end-to-end crawl benchmarks, which are recorded
+as skipped when Postgres is not reachable, and the end-to-end crawl on
+the SQLite frontier. The output carries the git
+commit, Python version and machine, so results from two versions can
+be compared; with ``--compare`` the run fails if any rate or timing is
+worse than the baseline by more than ``--tolerance``.
+
+    PYTHONPATH=src python benchmarks/run_suite.py --out bench.json
+    PYTHONPATH=src python benchmarks/run_suite.py --out new.json --compare bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Tuple
+
+import bench_crawl
+import bench_normalize
+import bench_parser
+import bench_queue
+import bench_scheduler
+from synthetic_site import SiteSpec
+
+# name -> (run it, full size or with --quick; needs Postgres)
+SUITE: Dict[str, Tuple[Callable[[bool], object], bool]] = {
+    "parser": (lambda quick: bench_parser.main(50 if quick else 200, 3), False),
+    "normalize": (lambda quick: bench_normalize.main(100 if quick else 500), False),
+    "scheduler": (
+        lambda quick: bench_scheduler.main([1000, 10000] if quick else [1000, 100000], 3),
+        False,
+    ),
+    "queue": (lambda quick: bench_queue.main(2000 if quick else 20000, 200), True),
+    "crawl": (
+        lambda quick: bench_crawl.main(
+            SiteSpec(pages=300 if quick else 3000, hosts=20, error_rate=0.01, slow_rate=0.01)
+        ),
+        True,
+    ),
+    "crawl_sqlite": (
+        lambda quick: bench_crawl.main(
+            SiteSpec(pages=300 if quick else 3000, hosts=20, error_rate=0.01, slow_rate=0.01),
+            frontier="sqlite",
+        ),
+        False,
+    ),
+}
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(names: List[str], quick: bool) -> dict:
+    results = {
+        "metadata": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "quick": quick,
+        },
+        "benchmarks": {},
+    }
+    for name in names:
+        bench, needs_db = SUITE[name]
+        started = time.perf_counter()
+        try:
+            outcome = bench(quick)
+        except (OSError, ConnectionError) as e:
+            if not needs_db:
+                raise
+            outcome = {"skipped": f"Postgres not available: {e}"}
+        print(f"{name}: {time.perf_counter() - started:.1f}s", file=sys.stderr)
+        results["benchmarks"][name] = outcome
+    return results
+
+
+def _leaves(value, path: str = "") -> Iterator[Tuple[str, float]]:
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _leaves(item, f"{path}.{key}" if path else key)
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            yield from _leaves(item, f"{path}[{i}]")
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield path, float(value)
+
+
+def _direction(path: str) -> int:
+    """1 if higher is better, -1 if lower is better, 0 if not a measurement."""
+    leaf = path.rsplit(".", 1)[-1]
+    if leaf.endswith("per_second") or leaf == "speedup":
+        return 1
+    if "seconds" in leaf or leaf.startswith("max_rss"):
+        return -1
+    return 0
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> List[dict]:
+    """Measurements worse than the baseline by more than ``tolerance`` (a fraction)."""
+    before = dict(_leaves(baseline.get("benchmarks", {})))
+    regressions = []
+    for path, value in _leaves(current.get("benchmarks", {})):
+        direction = _direction(path)
+        old = before.get(path)
+        if not direction or not old:
+            continue
+        change = (value - old) / old * direction
+        if change < -tolerance:
+            regressions.append(
+                {"metric": path, "baseline": old, "current": value, "change": round(change, 3)}
+            )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--out", type=Path, required=True)
+    parser.add_argument("--only", nargs="+", choices=list(SUITE), default=list(SUITE))
+    parser.add_argument("--quick", action="store_true", help="smaller workloads, for CI")
+    parser.add_argument("--compare", type=Path, help="baseline results to check against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = run(args.only, args.quick)
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        results["regressions"] = compare(baseline, results, args.tolerance)
+        results["baseline_commit"] = baseline.get("metadata", {}).get("commit")
+    args.out.write_text(json.dumps(results, indent=2, default=str))
+    print(f"Results written to {args.out}", file=sys.stderr)
+    if results.get("regressions"):
+        print(json.dumps(results["regressions"], indent=2), file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,176 @@
+"""
+Synthetic web site for crawl benchmarks.
+
+Serves a deterministic link graph spread over many virtual hosts from one
+local HTTP server running in its own process, so serving pages does not
+compete with the crawler for the GIL. Page ``n`` lives on host
+``site{n % hosts}.bench`` at ``/p/{n}`` and links to page ``n + 1`` (so
+the whole graph is reachable from page 0) plus ``fan_out - 1`` pages
+picked by a seeded RNG. A fraction of pages answer 500 or respond slowly.
+
+The crawler reaches the virtual hosts through ``routed_client()``, whose
+transport sends every request to the local server and keeps the
+original Host header.
+
+    PYTHONPATH=src python benchmarks/synthetic_site.py --pages 1000 --port 8765
+"""
+
+import argparse
+import multiprocessing
+import random
+import time
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+import httpx
+
+from app.config import settings
+
+FILLER = b"<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod.</p>"
+
+
+@dataclass
+class SiteSpec:
+    pages: int = 2000
+    hosts: int = 20
+    fan_out: int = 20  # links per page
+    page_size: int = 16 * 1024  # bytes, padded with filler text
+    latency: float = 0.0  # seconds before every response
+    error_rate: float = 0.0  # fraction of pages answering 500
+    slow_rate: float = 0.0  # fraction of pages taking slow_latency
+    slow_latency: float = 1.0
+    seed: int = 0
+
+    def host(self, page: int) -> str:
+        return f"site{page % self.hosts}.bench"
+
+    def url(self, page: int) -> str:
+        return f"http://{self.host(page)}/p/{page}"
+
+    def kind(self, page: int) -> str:
+        """'error', 'slow' or 'ok', fixed per page."""
+        roll = random.Random(f"{self.seed}:kind:{page}").random()
+        if roll < self.error_rate:
+            return "error"
+        if roll < self.error_rate + self.slow_rate:
+            return "slow"
+        return "ok"
+
+    def links(self, page: int) -> list:
+        rng = random.Random(f"{self.seed}:links:{page}")
+        targets = [(page + 1) % self.pages]
+        targets += [rng.randrange(self.pages) for _ in range(self.fan_out - 1)]
+        return targets
+
+    def render(self, page: int) -> bytes:
+        anchors = "".join(
+            f'<li><a href="{self.url(target)}">Page {target}</a></li>'
+            for target in self.links(page)
+        )
+        html = (
+            f"<!DOCTYPE html><html><head><title>Page {page}</title></head>"
+            f"<body><h1>Page {page}</h1><ul>{anchors}</ul>"
+        ).encode()
+        padding = max(0, self.page_size - len(html) - len(b"</body></html>"))
+        filler = (FILLER * (padding // len(FILLER) + 1))[:padding]
+        return html + filler + b"</body></html>"
+
+
+def _handler(spec: SiteSpec):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            if spec.latency:
+                time.sleep(spec.latency)
+            if self.path == "/robots.txt":
+                self._send(404, b"")
+                return
+            try:
+                page = int(self.path.rsplit("/", 1)[-1])
+            except ValueError:
+                self._send(404, b"")
+                return
+            if not 0 <= page < spec.pages or spec.host(page) != self.headers.get("Host"):
+                self._send(404, b"")
+                return
+            kind = spec.kind(page)
+            if kind == "error":
+                self._send(500, b"error")
+                return
+            if kind == "slow":
+                time.sleep(spec.slow_latency)
+            self._send(200, spec.render(page))
+
+        def _send(self, status: int, body: bytes):
+            self.send_response(status)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(spec: SiteSpec, port: int, ready=None) -> None:
+    """Serve the site until the process is terminated."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), _handler(spec))
+    server.daemon_threads = True
+    server.request_queue_size = 1024
+    if ready is not None:
+        ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_site(spec: SiteSpec, port: int = 0) -> Tuple[int, multiprocessing.Process]:
+    """Start the site in a child process. Returns (port, process); terminate the process when done."""
+    context = multiprocessing.get_context("spawn")
+    ready = context.Queue()
+    process = context.Process(target=serve, args=(spec, port, ready), daemon=True)
+    process.start()
+    return ready.get(timeout=30), process
+
+
+class RoutingTransport(httpx.AsyncBaseTransport):
+    """Send every request to the local site, keeping its Host header."""
+
+    def __init__(self, port: int):
+        self._port = port
+        self._inner = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(
+                max_connections=settings.http_max_connections,
+                max_keepalive_connections=settings.http_max_connections,
+            )
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.url = request.url.copy_with(scheme="http", host="127.0.0.1", port=self._port)
+        return await self._inner.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
+
+
+def routed_client(port: int) -> httpx.AsyncClient:
+    """A client like http_client.create_client() that reaches the synthetic hosts."""
+    return httpx.AsyncClient(
+        transport=RoutingTransport(port),
+        timeout=httpx.Timeout(settings.read_timeout, connect=settings.connect_timeout),
+        headers={"User-Agent": settings.user_agent},
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    for field, value in asdict(SiteSpec()).items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=type(value), default=value)
+    parser.add_argument("--port", type=int, default=8765)
+    args = vars(parser.parse_args())
+    port = args.pop("port")
+    print(f"Serving {args['pages']} pages on http://127.0.0.1:{port} (Host: site0.bench ...)")
+    serve(SiteSpec(**args), port)
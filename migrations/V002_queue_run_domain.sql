@@ -0,0 +1,43 @@
+-- V002_queue_run_domain.sql
+-- Put the crawl run and host on queue rows so pops need no join on urls
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'queue' AND column_name = 'crawl_run_id'
+    ) THEN
+        ALTER TABLE queue ADD COLUMN crawl_run_id TEXT;
+        ALTER TABLE queue ADD COLUMN domain TEXT;
+
+        UPDATE queue q
+        SET crawl_run_id = u.crawl_run_id,
+            domain = u.domain
+        FROM urls u
+        WHERE u.id = q.url_id;
+
+        ALTER TABLE queue ALTER COLUMN crawl_run_id SET NOT NULL;
+        ALTER TABLE queue ALTER COLUMN domain SET NOT NULL;
+    END IF;
+END $$;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'queue_crawl_run_id_fkey') THEN
+        ALTER TABLE queue ADD CONSTRAINT queue_crawl_run_id_fkey
+            FOREIGN KEY (crawl_run_id) REFERENCES crawl_runs(id) ON DELETE CASCADE;
+    END IF;
+    -- A URL is queued at most once; keep the oldest row of any duplicates
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'queue_url_id_unique') THEN
+        DELETE FROM queue a
+        USING queue b
+        WHERE a.url_id = b.url_id
+          AND a.id > b.id;
+        ALTER TABLE queue ADD CONSTRAINT queue_url_id_unique UNIQUE (url_id);
+    END IF;
+END $$;
+
+-- Matches the pop order: one host of one run, highest priority, oldest first
+CREATE INDEX IF NOT EXISTS idx_queue_run_domain_order
+    ON queue (crawl_run_id, domain, priority DESC, enqueued_at)
+    INCLUDE (next_fetch_at);
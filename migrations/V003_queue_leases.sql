@@ -0,0 +1,10 @@
+-- V003_queue_leases.sql
+-- Lease queue rows to a crawler process instead of deleting them on pop
+
+ALTER TABLE queue ADD COLUMN IF NOT EXISTS lease_owner TEXT;
+ALTER TABLE queue ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP WITH TIME ZONE;
+
+-- Heartbeats and releases find a process's leases by owner
+CREATE INDEX IF NOT EXISTS idx_queue_lease_owner
+    ON queue (lease_owner)
+    WHERE lease_owner IS NOT NULL;
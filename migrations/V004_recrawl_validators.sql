@@ -0,0 +1,21 @@
+-- V004_recrawl_validators.sql
+-- Per-run URL identity and stored validators for conditional re-crawls
+
+ALTER TABLE urls ADD COLUMN IF NOT EXISTS etag TEXT;
+ALTER TABLE urls ADD COLUMN IF NOT EXISTS last_modified TEXT;
+ALTER TABLE urls ADD COLUMN IF NOT EXISTS content_hash TEXT;  -- hex SHA-256 of the body
+
+ALTER TABLE crawl_runs ADD COLUMN IF NOT EXISTS recrawl_of TEXT
+    REFERENCES crawl_runs(id) ON DELETE SET NULL;
+
+-- A URL is unique within a run, not globally, so later runs get their own rows
+ALTER TABLE urls DROP CONSTRAINT IF EXISTS urls_url_unique;
+ALTER TABLE urls DROP CONSTRAINT IF EXISTS urls_normalized_url_unique;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'urls_run_normalized_url_unique') THEN
+        ALTER TABLE urls ADD CONSTRAINT urls_run_normalized_url_unique
+            UNIQUE (crawl_run_id, normalized_url);
+    END IF;
+END $$;
@@ -0,0 +1,13 @@
+-- V005_crawl_checkpoints.sql
+-- Periodic snapshots of a crawler's in-memory state, so a crashed run resumes quickly
+
+CREATE TABLE IF NOT EXISTS crawl_checkpoints (
+    crawl_run_id TEXT NOT NULL REFERENCES crawl_runs(id) ON DELETE CASCADE,
+    shard INTEGER NOT NULL,  -- worker index, 0 for single-process runs
+    shard_count INTEGER NOT NULL,
+    max_url_id BIGINT NOT NULL,  -- every URL up to this id is in the seen filter
+    seen_filter BYTEA NOT NULL,
+    stats JSONB NOT NULL DEFAULT '{}',
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    PRIMARY KEY (crawl_run_id, shard)
+);
@@ -0,0 +1,4 @@
+-- V006_run_metrics.sql
+-- Counters and latency histograms of a finished run, for the run report
+
+ALTER TABLE crawl_runs ADD COLUMN IF NOT EXISTS metrics JSONB;
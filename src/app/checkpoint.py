@@ -0,0 +1,63 @@
+"""Checkpoints of a crawler's in-memory state for resuming a run."""
+
+import json
+from typing import Any, Dict, Optional
+
+import asyncpg
+
+
+async def save_checkpoint(
+    conn: asyncpg.Connection,
+    crawl_run_id: str,
+    shard: int,
+    shard_count: int,
+    max_url_id: int,
+    seen_filter: bytes,
+    stats: Dict[str, Any],
+) -> None:
+    """Replace a crawler's checkpoint for a run."""
+    await conn.execute(
+        """
+        INSERT INTO crawl_checkpoints
+            (crawl_run_id, shard, shard_count, max_url_id, seen_filter, stats)
+        VALUES ($1, $2, $3, $4, $5, $6::jsonb)
+        ON CONFLICT (crawl_run_id, shard) DO UPDATE SET
+            shard_count = EXCLUDED.shard_count,
+            max_url_id = EXCLUDED.max_url_id,
+            seen_filter = EXCLUDED.seen_filter,
+            stats = EXCLUDED.stats,
+            created_at = now()
+        """,
+        crawl_run_id,
+        shard,
+        shard_count,
+        max_url_id,
+        seen_filter,
+        json.dumps(stats),
+    )
+
+
+async def load_checkpoint(
+    conn: asyncpg.Connection, crawl_run_id: str, shard: int, shard_count: int
+) -> Optional[asyncpg.Record]:
+    """
+    A crawler's latest checkpoint for a run, or None.
+
+    Checkpoints taken with a different number of shards partition hosts
+    differently and are ignored.
+    """
+    return await conn.fetchrow(
+        """
+        SELECT max_url_id, seen_filter, stats::text AS stats, created_at
+        FROM crawl_checkpoints
+        WHERE crawl_run_id = $1 AND shard = $2 AND shard_count = $3
+        """,
+        crawl_run_id,
+        shard,
+        shard_count,
+    )
+
+
+async def delete_checkpoints(conn: asyncpg.Connection, crawl_run_id: str) -> None:
+    """Drop a finished run's checkpoints."""
+    await conn.execute("DELETE FROM crawl_checkpoints WHERE crawl_run_id = $1", crawl_run_id)
@@ -1,6 +1,6 @@
 """Configuration loading from environment variables."""
 import os
-from pydantic import PostgresDsn, HttpUrl
+from pydantic import Field, PostgresDsn, HttpUrl
 from pydantic_settings import BaseSettings
 
 
@@ -12,19 +12,97 @@ class Settings(BaseSettings):
     postgres_user: str = "crawler"
     postgres_password: str = "crawler"
     postgres_db: str = "crawler"
+    frontier: str = "postgres"  # postgres, or sqlite for one-process crawls without a server
+    sqlite_path: str = "crawler.db"  # database file of the sqlite frontier
 
     # MinIO / S3
     minio_endpoint: HttpUrl = HttpUrl("http://localhost:9000")
     minio_access_key: str = "minioadmin"
     minio_secret_key: str = "minioadmin"
     minio_bucket: str = "crawler"
+    storage_upload_concurrency: int = 8  # uploads in flight
+    storage_queue_size: int = 100  # pages waiting for upload before the crawl blocks
+    storage_compression: str = "gzip"  # gzip, zstd (needs zstandard) or none
+    storage_compression_level: int = 6
+    storage_known_keys: int = 100_000  # stored bodies remembered to skip uploading them again
+    storage_backend: str = "objects"  # objects (one object per page) or warc (WARC segments)
+    warc_target: str = "local"  # local (kept in warc_dir) or s3 (multipart upload to the bucket)
+    warc_dir: str = "warc"  # where segments are written, or spooled before upload
+    warc_prefix: str = "warc"  # key prefix of segments
+    warc_segment_size_mb: int = 256  # seal a segment once it reaches this size
+    warc_segment_max_seconds: float = 300.0  # ... or this age; its pages are acked when sealed
+    warc_part_size_mb: int = 64  # multipart upload part size, at least 5
 
     # Crawler behavior
     default_crawl_delay: float = 1.0  # seconds
     max_body_size: int = 2 * 1024 * 1024  # 2MB
+    fetch_chunk_size: int = 64 * 1024  # bytes read per chunk while streaming
+    link_extractor: str = "fast"  # fast (streaming tokenizer) or bs4
+    normalize_cache_size: int = 100_000  # memoized normalize_url results per process
+
+    # Page processing pool (0 workers parses on the event loop)
+    parse_workers: int = Field(default_factory=lambda: max(1, (os.cpu_count() or 2) - 1))
+    parse_batch_size: int = 8  # pages per pool task
+    parse_batch_linger: float = 0.005  # seconds to wait for a batch to fill
+    parse_max_pending: int = 256  # pages queued for the pool before callers block
     user_agent: str = "ModularWebCrawler/0.1.0"
     connect_timeout: float = 10.0  # seconds
     read_timeout: float = 30.0  # seconds
+    max_concurrency: int = 16  # pages in flight across all hosts
+    follow_external_links: bool = False  # enqueue links to other domains too
+    seen_filter_memory_mb: int = 64  # budget for the in-memory seen-URL filter
+    seen_filter_fp_rate: float = 0.0001  # target false-positive rate once it turns lossy
+    seen_filter_recent_urls: int = 50_000  # recent URLs kept exactly to confirm lossy hits
+    queue_pop_batch_size: int = 10  # queued URLs leased per host in one statement
+    queue_lease_seconds: float = 120.0  # how long a leased URL stays hidden from other crawlers
+    queue_heartbeat_interval: float = 30.0  # seconds between lease renewals
+    queue_poll_interval: float = 1.0  # seconds to wait for URLs leased elsewhere
+    progress_interval: float = 5.0  # seconds between progress reports in multi-process runs
+    checkpoint_interval: float = 300.0  # seconds between crawler state checkpoints, 0 disables
+    metrics_host: str = "127.0.0.1"
+    metrics_port: int = 0  # serve Prometheus metrics at /metrics on this port, 0 disables
+
+    # robots.txt
+    robots_ttl: float = 24 * 3600.0  # seconds before robots.txt is refetched
+    robots_error_ttl: float = 600.0  # seconds to hold a host whose robots.txt failed
+    robots_timeout: float = 10.0  # seconds
+    robots_max_concurrent_fetches: int = 16
+
+    # Per-host rate control
+    rate_control: bool = True  # adapt each host's delay to its latency and throttling
+    rate_min_delay: float = 0.25  # seconds between fetches of a fast, healthy host at best
+    rate_max_delay: float = 120.0  # seconds between fetches of a host at worst
+    rate_increase: float = 0.05  # pages/s added to a host's rate per fast, healthy response
+    rate_backoff_factor: float = 2.0  # delay multiplier on a slow, failed or throttled response
+    rate_slow_seconds: float = 2.0  # responses whose headers take longer count as slow
+    retry_after_max: float = 3600.0  # seconds of Retry-After honoured at most
+
+    # Retries of transient failures (timeouts, DNS, resets, 429/502/503/504)
+    max_fetch_attempts: int = 5  # fetches of a URL before a transient failure is final
+    retry_base_delay: float = 10.0  # seconds before the first retry, doubling for each next one
+    retry_max_delay: float = 600.0  # seconds before a retry at most
+
+    # DNS
+    dns_resolver: str = "system"  # system (getaddrinfo in a thread) or aiodns (needs the dns extra)
+    dns_cache_size: int = 10_000  # hosts kept in the in-process DNS cache, 0 disables it
+    dns_ttl: float = 300.0  # seconds an answer is kept at most, or when its TTL is unknown
+    dns_min_ttl: float = 30.0  # seconds an answer is kept at least, whatever its TTL
+    dns_error_ttl: float = 60.0  # seconds a failed lookup is cached
+    dns_timeout: float = 5.0  # seconds
+    dns_max_concurrent_lookups: int = 32
+
+    # HTTP client
+    http2: bool = False  # requires httpx[http2]
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 50
+    http_max_connections_per_host: int = 2
+    http_keepalive_expiry: float = 30.0  # seconds
+
+    # Database pool
+    db_pool_min_size: int = 2
+    db_pool_max_size: int = 20
+    db_batch_size: int = 1000  # buffered rows that trigger a flush
+    db_flush_interval: float = 0.5  # seconds between background flushes
 
     def get_postgres_dsn(self) -> str:
         """Get PostgreSQL DSN, either from env or construct from components."""
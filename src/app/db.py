@@ -1,6 +1,7 @@
 """Database connection and query helpers."""
 import asyncpg
 import contextlib
+from pathlib import Path
 from typing import AsyncGenerator
 
 from .config import settings
@@ -13,10 +14,22 @@ async def get_pool() -> asyncpg.Pool:
     """Create and return a connection pool."""
     global _pool
     if _pool is None:
-        _pool = await asyncpg.create_pool(settings.get_postgres_dsn())
+        _pool = await asyncpg.create_pool(
+            settings.get_postgres_dsn(),
+            min_size=settings.db_pool_min_size,
+            max_size=settings.db_pool_max_size,
+        )
     return _pool
 
 
+async def close_pool() -> None:
+    """Close the connection pool, if one was created."""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
 @contextlib.asynccontextmanager
 async def get_connection() -> AsyncGenerator[asyncpg.Connection, None]:
     """Get a database connection from the pool."""
@@ -26,8 +39,7 @@ async def get_connection() -> AsyncGenerator[asyncpg.Connection, None]:
 
 
 async def init_db(conn: asyncpg.Connection) -> None:
-    """Initialize database schema."""
-    migration_path = "migrations/V001_init.sql"
-    with open(migration_path) as f:
-        sql = f.read()
-    await conn.execute(sql)
\ No newline at end of file
+    """Initialize database schema by applying every migration in order."""
+    for migration_path in sorted(Path("migrations").glob("V*.sql")):
+        sql = migration_path.read_text()
+        await conn.execute(sql)
\ No newline at end of file
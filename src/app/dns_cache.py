@@ -0,0 +1,215 @@
+"""In-process DNS cache for the shared HTTP client."""
+
+import asyncio
+import ipaddress
+import socket
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpcore
+import httpx
+import structlog
+
+from . import metrics
+from .config import settings
+
+try:
+    import aiodns
+except ImportError:  # optional, install the `dns` extra
+    aiodns = None
+
+logger = structlog.get_logger()
+
+# Resolves a host name to (addresses, TTL in seconds or None if unknown)
+Resolver = Callable[[str], Awaitable[Tuple[List[str], Optional[float]]]]
+
+
+def _unique(addresses: Iterable[str]) -> List[str]:
+    return list(dict.fromkeys(addresses))
+
+
+async def system_resolve(host: str) -> Tuple[List[str], Optional[float]]:
+    """Resolve with getaddrinfo in the loop's thread pool; it does not report TTLs."""
+    infos = await asyncio.get_running_loop().getaddrinfo(host, None, type=socket.SOCK_STREAM)
+    return _unique(info[4][0] for info in infos), None
+
+
+class AiodnsResolver:
+    """Resolve A and AAAA records with c-ares, without a thread, honouring their TTLs."""
+
+    def __init__(self):
+        self._resolver = aiodns.DNSResolver(timeout=settings.dns_timeout)
+
+    async def __call__(self, host: str) -> Tuple[List[str], Optional[float]]:
+        answers = await asyncio.gather(
+            self._resolver.query(host, "A"),
+            self._resolver.query(host, "AAAA"),
+            return_exceptions=True,
+        )
+        records = [r for answer in answers if not isinstance(answer, Exception) for r in answer]
+        if not records:
+            raise socket.gaierror(socket.EAI_NONAME, f"{host} has no addresses")
+        return _unique(r.host for r in records), min(r.ttl for r in records)
+
+
+def create_resolver() -> Resolver:
+    """The resolver chosen by ``dns_resolver``, falling back to the system one without aiodns."""
+    if settings.dns_resolver == "aiodns":
+        if aiodns is not None:
+            return AiodnsResolver()
+        logger.warning("aiodns_unavailable", reason="install the dns extra")
+    return system_resolve
+
+
+def _is_ip(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+
+class DnsCache:
+    """
+    Resolved addresses per host, kept for their TTL.
+
+    Answers are kept for the record TTL, bounded by ``dns_min_ttl`` and
+    ``dns_ttl``, or for ``dns_ttl`` when the resolver does not report
+    one. Concurrent lookups of a host share one resolution; failures and
+    timeouts are cached for ``dns_error_ttl``, so a dead domain is not
+    asked again for every URL. Past ``dns_cache_size`` hosts the least
+    recently used are dropped.
+    """
+
+    def __init__(self, resolver: Optional[Resolver] = None):
+        self._resolver = resolver or create_resolver()
+        # host -> (addresses, or None after a failure, expires_at, error)
+        self._cache: "OrderedDict[str, Tuple[Optional[List[str]], float, str]]" = OrderedDict()
+        self._resolving: Dict[str, asyncio.Task] = {}
+        self._slots = asyncio.Semaphore(settings.dns_max_concurrent_lookups)
+        self.stats = {"hits": 0, "misses": 0, "failures": 0, "prefetched": 0}
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    async def resolve(self, host: str) -> List[str]:
+        """
+        Addresses of ``host``, from the cache while fresh.
+
+        Raises httpcore.ConnectError if the lookup failed, so the HTTP
+        client reports it like any other connection failure.
+        """
+        if _is_ip(host):
+            return [host]
+        host = host.lower()
+        entry = self._fresh(host)
+        if entry is not None:
+            self.stats["hits"] += 1
+            metrics.DNS_LOOKUPS.inc("hit")
+            addresses, _, error = entry
+            if addresses is None:
+                raise httpcore.ConnectError(error)
+            return addresses
+        self.stats["misses"] += 1
+        return await asyncio.shield(self._start_resolving(host))
+
+    def prefetch(self, domain: str) -> None:
+        """Resolve a newly discovered domain (a URL's netloc) in the background."""
+        host = urlsplit(f"//{domain}").hostname
+        if not host or _is_ip(host) or host in self._resolving or self._fresh(host):
+            return
+        self.stats["prefetched"] += 1
+        self._start_resolving(host)
+
+    def _fresh(self, host: str) -> Optional[Tuple[Optional[List[str]], float, str]]:
+        entry = self._cache.get(host)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            del self._cache[host]
+            return None
+        self._cache.move_to_end(host)
+        return entry
+
+    def _start_resolving(self, host: str) -> asyncio.Task:
+        task = self._resolving.get(host)
+        if task is None:
+            task = self._resolving[host] = asyncio.create_task(self._resolve(host))
+            task.add_done_callback(lambda t: self._resolved(host, t))
+        return task
+
+    def _resolved(self, host: str, task: asyncio.Task) -> None:
+        self._resolving.pop(host, None)
+        if not task.cancelled():
+            # Retrieved here so failed prefetches are not reported as unhandled
+            task.exception()
+
+    async def _resolve(self, host: str) -> List[str]:
+        started = time.perf_counter()
+        try:
+            async with self._slots:
+                addresses, ttl = await asyncio.wait_for(self._resolver(host), settings.dns_timeout)
+            if not addresses:
+                raise socket.gaierror(socket.EAI_NONAME, f"{host} has no addresses")
+        except (OSError, asyncio.TimeoutError) as e:
+            reason = str(e) or "timed out"
+            error = f"DNS lookup of {host} failed: {reason}"
+            self.stats["failures"] += 1
+            metrics.DNS_LOOKUPS.inc("failed")
+            logger.warning("dns_lookup_failed", host=host, error=reason)
+            self._store(host, None, settings.dns_error_ttl, error)
+            raise httpcore.ConnectError(error) from e
+        metrics.DNS_LOOKUPS.inc("resolved")
+        metrics.DNS_SECONDS.observe(time.perf_counter() - started)
+        if ttl is None:
+            ttl = settings.dns_ttl
+        self._store(host, addresses, min(max(ttl, settings.dns_min_ttl), settings.dns_ttl), "")
+        return addresses
+
+    def _store(self, host: str, addresses: Optional[List[str]], ttl: float, error: str) -> None:
+        self._cache[host] = (addresses, time.monotonic() + ttl, error)
+        self._cache.move_to_end(host)
+        while len(self._cache) > settings.dns_cache_size:
+            self._cache.popitem(last=False)
+
+
+class CachingNetworkBackend(httpcore.AsyncNetworkBackend):
+    """
+    httpcore network backend that connects to addresses from a DnsCache.
+
+    Each address is tried in turn until one accepts the connection.
+    TLS still verifies and sends SNI for the host name, which httpcore
+    takes from the request rather than from the address connected to.
+    """
+
+    def __init__(self, backend: httpcore.AsyncNetworkBackend, cache: DnsCache):
+        self._backend = backend
+        self._cache = cache
+
+    async def connect_tcp(
+        self, host, port, timeout=None, local_address=None, socket_options=None
+    ) -> httpcore.AsyncNetworkStream:
+        addresses = await self._cache.resolve(host)
+        for i, address in enumerate(addresses):
+            try:
+                return await self._backend.connect_tcp(
+                    address, port, timeout, local_address, socket_options
+                )
+            except httpcore.ConnectError:
+                if i == len(addresses) - 1:
+                    raise
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return await self._backend.connect_unix_socket(path, timeout, socket_options)
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+
+def install(transport: httpx.AsyncHTTPTransport, cache: DnsCache) -> None:
+    """Make a transport resolve host names for new connections through ``cache``."""
+    # httpx has no option for this; its connection pool holds the network backend
+    pool = transport._pool
+    pool._network_backend = CachingNetworkBackend(pool._network_backend, cache)
@@ -1,46 +1,202 @@
 """URL fetcher module."""
+import socket
+import ssl
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 import httpx
-from typing import Optional, Tuple
+from dataclasses import dataclass, field
+from typing import Optional, Tuple, Type
 import structlog
 
+from . import metrics
 from .config import settings
 
 logger = structlog.get_logger()
 
 
-async def fetch_url(url: str) -> Tuple[int, Optional[bytes], Optional[str]]:
+@dataclass
+class FetchResult:
+    """Outcome of fetching one URL."""
+    status_code: int  # 0 if no response was received
+    content: Optional[bytes] = None  # body, only for HTML within max_body_size
+    content_type: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    # Seconds until the response headers arrived, or until the request failed
+    seconds: float = field(default=0.0, compare=False)
+    retry_after: Optional[float] = None  # seconds asked for by a 429 or 503, if any
+    error: Optional[str] = None  # type of failure when no response was received
+    error_msg: Optional[str] = None
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status_code == 304
+
+    @property
+    def throttled(self) -> bool:
+        """True if the server asked the crawler to slow down."""
+        return self.status_code in (429, 503)
+
+
+def _caused_by(exc: BaseException, types: Tuple[Type[BaseException], ...]) -> bool:
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        if isinstance(exc, types):
+            return True
+        seen.add(id(exc))
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+def classify_error(exc: httpx.RequestError) -> str:
     """
-    Fetch a URL and return (status_code, content, content_type).
-    
+    Type of a failed request, as recorded in fetch_errors.
+
+    One of connect_timeout, read_timeout, timeout, dns, tls,
+    connection_refused, connect_error, connection_reset, protocol_error,
+    proxy_error, too_many_redirects, invalid_url, decoding_error or
+    request_error.
+    """
+    if isinstance(exc, httpx.ConnectTimeout):
+        return "connect_timeout"
+    if isinstance(exc, httpx.ReadTimeout):
+        return "read_timeout"
+    if isinstance(exc, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(exc, httpx.ConnectError):
+        # The DNS cache reports failed lookups as connection errors
+        if _caused_by(exc, (socket.gaierror,)) or "DNS lookup" in str(exc):
+            return "dns"
+        if _caused_by(exc, (ssl.SSLError,)):
+            return "tls"
+        if _caused_by(exc, (ConnectionRefusedError,)) or "refused" in str(exc).lower():
+            return "connection_refused"
+        return "connect_error"
+    if isinstance(exc, httpx.NetworkError):
+        return "connection_reset"
+    if isinstance(exc, httpx.ProtocolError):
+        return "protocol_error"
+    if isinstance(exc, httpx.ProxyError):
+        return "proxy_error"
+    if isinstance(exc, httpx.TooManyRedirects):
+        return "too_many_redirects"
+    if isinstance(exc, httpx.UnsupportedProtocol):
+        return "invalid_url"
+    if isinstance(exc, httpx.DecodingError):
+        return "decoding_error"
+    return "request_error"
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Seconds to wait from a Retry-After header, in seconds or as an HTTP date.
+
+    Returns None for a missing or malformed header; the wait is clamped
+    to ``retry_after_max``.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        seconds = float(value)
+    else:
+        try:
+            when = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        seconds = (when - datetime.now(timezone.utc)).total_seconds()
+    return min(max(seconds, 0.0), settings.retry_after_max)
+
+
+async def fetch_url(
+    url: str,
+    client: httpx.AsyncClient,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+) -> FetchResult:
+    """
+    Fetch a URL, conditionally if validators from an earlier fetch are given.
+
+    The body is streamed in chunks of ``fetch_chunk_size`` and the
+    download is abandoned as soon as the headers show a non-HTML type or
+    the body grows past ``max_body_size``, so memory per request stays
+    bounded however large the remote resource is. With ``etag`` or
+    ``last_modified`` the request carries If-None-Match/If-Modified-Since,
+    and a 304 is returned without any body.
+
     Args:
         url: The URL to fetch
+        client: Shared client from http_client.create_client()
+        etag: ETag from the previous fetch of this URL
+        last_modified: Last-Modified from the previous fetch of this URL
 
     Returns:
-        Tuple of (HTTP status code, content bytes if HTML, content type if HTML)
+        FetchResult with the status, the body and content type if HTML,
+        the response's validators, its latency and any Retry-After, or
+        status 0 and the type of error if no response was received
     """
+    started = time.perf_counter()
+    result = await _fetch(url, client, etag, last_modified)
+    metrics.FETCH_SECONDS.observe(time.perf_counter() - started)
+    metrics.FETCH_RESPONSES.inc(f"{result.status_code // 100}xx" if result.status_code else "error")
+    if result.error:
+        metrics.FETCH_ERRORS.inc(result.error)
+    if result.content:
+        metrics.FETCH_BYTES.inc(amount=len(result.content))
+    return result
+
+
+async def _fetch(
+    url: str, client: httpx.AsyncClient, etag: Optional[str], last_modified: Optional[str]
+) -> FetchResult:
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    started = time.perf_counter()
     try:
-        async with httpx.AsyncClient(
-            follow_redirects=True,
-            timeout=httpx.Timeout(
-                connect=settings.connect_timeout,
-                read=settings.read_timeout,
-            ),
-            headers={"User-Agent": settings.user_agent},
-        ) as client:
-            response = await client.get(url)
-            
+        async with client.stream("GET", url, headers=headers) as response:
+            result = FetchResult(
+                response.status_code,
+                etag=response.headers.get("etag"),
+                last_modified=response.headers.get("last-modified"),
+                seconds=time.perf_counter() - started,
+            )
+            if result.throttled:
+                result.retry_after = parse_retry_after(response.headers.get("retry-after"))
+            if result.not_modified:
+                return result
+
             content_type = response.headers.get("content-type", "").lower()
+            result.content_type = content_type
             if not content_type.startswith("text/html"):
                 logger.info("skipping_non_html", url=url, content_type=content_type)
-                return response.status_code, None, content_type
+                return result
+
+            declared_length = response.headers.get("content-length", "")
+            if declared_length.isdigit() and int(declared_length) > settings.max_body_size:
+                logger.warning("skipping_large_body", url=url, size=int(declared_length))
+                return result
 
-            content_length = len(response.content)
-            if content_length > settings.max_body_size:
-                logger.warning("skipping_large_body", url=url, size=content_length)
-                return response.status_code, None, content_type
+            body = bytearray()
+            async for chunk in response.aiter_bytes(settings.fetch_chunk_size):
+                body += chunk
+                if len(body) > settings.max_body_size:
+                    logger.warning("skipping_large_body", url=url, size=len(body))
+                    return result
 
-            return response.status_code, response.content, content_type
+            result.content = bytes(body)
+            return result
 
     except httpx.RequestError as e:
-        logger.error("fetch_failed", url=url, error=str(e))
-        return 0, None, None
\ No newline at end of file
+        error = classify_error(e)
+        error_msg = str(e) or type(e).__name__
+        logger.error("fetch_failed", url=url, error_type=error, error=error_msg)
+        return FetchResult(
+            0, seconds=time.perf_counter() - started, error=error, error_msg=error_msg
+        )
@@ -0,0 +1,353 @@
+"""Where a crawl's runs, URLs, queue and host state are kept."""
+
+import abc
+from typing import IO, Any, AsyncIterator, Dict, List, Mapping, Optional, Set, Tuple
+
+from . import metrics
+from .checkpoint import load_checkpoint, save_checkpoint
+from .config import settings
+from .db import get_connection
+from .models import QueueItem
+from .persistence import (
+    FetchedRow,
+    LinkRow,
+    RetryRow,
+    insert_links,
+    write_errors,
+    write_fetched,
+    write_retries,
+    write_stored_keys,
+)
+from .queue import (
+    ack,
+    count_leased,
+    create_run,
+    defer,
+    finish_run,
+    get_queued_domains,
+    heartbeat,
+    join_run,
+    lease_batch,
+    next_due,
+    reclaim_expired,
+    release_leases,
+    resume_run,
+)
+from .report import write_report
+
+
+class Frontier(abc.ABC):
+    """
+    The crawler's view of its bookkeeping.
+
+    The runner, Persistence and RobotsCache go through a frontier instead
+    of talking to a database, so the same crawl can be kept in Postgres
+    (PostgresFrontier, shared by any number of crawler processes) or in
+    a local SQLite file (SqliteFrontier, for one process on one machine).
+    """
+
+    async def close(self) -> None:
+        """Release what the frontier holds open."""
+
+    @abc.abstractmethod
+    async def create_run(
+        self, run_id: str, seed_url: str, recrawl_of: Optional[str] = None
+    ) -> None:
+        """Create a crawl run and queue its seed URL."""
+
+    @abc.abstractmethod
+    async def resume_run(self, run_id: str) -> None:
+        """Prepare a stopped run to be crawled again. Raises ValueError if it does not exist."""
+
+    @abc.abstractmethod
+    async def join_run(self, run_id: str) -> None:
+        """
+        Prepare to crawl a run alongside the crawlers already on it.
+
+        Raises ValueError if the run does not exist or has finished.
+        """
+
+    @abc.abstractmethod
+    async def finish_run(self, run_id: str, run_metrics: Optional[metrics.Snapshot] = None) -> None:
+        """Mark a crawl run finished and record its totals and metrics."""
+
+    @abc.abstractmethod
+    def iter_urls(self, run_id: str, since_id: int = 0) -> AsyncIterator[Tuple[str, str]]:
+        """(normalized url, domain) of each URL of a run with an id above ``since_id``."""
+
+    @abc.abstractmethod
+    async def known_urls(self, run_id: str, normalized_urls: List[str]) -> Set[str]:
+        """Those of the given normalized URLs that a run already has."""
+
+    @abc.abstractmethod
+    async def max_url_id(self) -> int:
+        """Highest URL id written so far, 0 if none."""
+
+    @abc.abstractmethod
+    async def load_checkpoint(
+        self, run_id: str, shard: int, shard_count: int
+    ) -> Optional[Mapping[str, Any]]:
+        """A crawler's latest checkpoint: max_url_id, seen_filter, stats (JSON) and created_at."""
+
+    @abc.abstractmethod
+    async def save_checkpoint(
+        self,
+        run_id: str,
+        shard: int,
+        shard_count: int,
+        max_url_id: int,
+        seen_filter: bytes,
+        stats: Dict[str, Any],
+    ) -> None:
+        """Replace a crawler's checkpoint for a run."""
+
+    @abc.abstractmethod
+    async def queued_domains(self, run_id: str) -> List[Tuple[str, int]]:
+        """Each domain with unleased queued URLs in a run and how many it has."""
+
+    @abc.abstractmethod
+    async def lease_batch(
+        self, run_id: str, domain: str, owner: str, limit: int, lease_seconds: float
+    ) -> List[QueueItem]:
+        """Lease up to ``limit`` due URLs for one domain of a run to ``owner``, in pop order."""
+
+    @abc.abstractmethod
+    async def next_due(self, run_id: str, domain: str) -> Optional[float]:
+        """
+        Seconds until the next unleased queued URL of a domain is due.
+
+        None if the domain has no such URL; zero or less if one is due now.
+        """
+
+    @abc.abstractmethod
+    async def count_leased(self, run_id: str, owner: Optional[str] = None) -> int:
+        """Number of URLs in a run currently leased, by any owner or only by ``owner``."""
+
+    @abc.abstractmethod
+    async def heartbeat(self, owner: str, url_ids: List[int], lease_seconds: float) -> int:
+        """Extend ``owner``'s leases on the given URLs. Returns the number still held."""
+
+    @abc.abstractmethod
+    async def reclaim_expired(self, run_id: str) -> List[str]:
+        """Clear expired leases in a run. Returns the domain of each reclaimed URL."""
+
+    @abc.abstractmethod
+    async def release_leases(self, owner: str) -> int:
+        """Hand every URL leased to ``owner`` back to the queue. Returns the number released."""
+
+    @abc.abstractmethod
+    async def get_url(self, url_id: int) -> Optional[Mapping[str, Any]]:
+        """A URL's row, with its url and validators."""
+
+    @abc.abstractmethod
+    async def write_batch(
+        self,
+        run_id: str,
+        owner: Optional[str],
+        links: List[LinkRow],
+        fetched: List[FetchedRow],
+        errors: List[Tuple[int, str, str]],
+        stored_keys: List[Tuple[int, str]],
+        acks: List[int],
+        retries: List[RetryRow],
+    ) -> Tuple[List[Tuple[int, str]], int]:
+        """
+        Write one flush of Persistence in a single transaction.
+
+        Retried URLs still leased to ``owner`` go back to the queue, due
+        after their delay. Returns the (url id, domain) of each newly
+        queued or retried URL and the number of acks that removed a URL
+        still leased to ``owner``.
+        """
+
+    @abc.abstractmethod
+    async def get_domains(self, domains: List[str]) -> List[Mapping[str, Any]]:
+        """
+        Stored robots.txt state of the given domains.
+
+        Each row has domain, robots_txt, crawl_delay_seconds and age, the
+        seconds since robots.txt was fetched or None if it never was.
+        """
+
+    @abc.abstractmethod
+    async def save_robots(self, domain: str, robots_txt: str) -> None:
+        """Record a freshly fetched robots.txt body."""
+
+    @abc.abstractmethod
+    async def save_crawl_delay(self, domain: str, delay: float) -> None:
+        """Record a domain's crawl delay."""
+
+    @abc.abstractmethod
+    async def write_report(self, run_id: str, out: IO[str], format: str = "json") -> bool:
+        """
+        Stream a run's report to ``out``, read as one consistent snapshot.
+
+        Returns False if the run does not exist.
+        """
+
+
+class PostgresFrontier(Frontier):
+    """
+    Frontier in Postgres, through the shared connection pool.
+
+    Wraps the queries of ``queue``, ``persistence`` and ``checkpoint``
+    unchanged; the pool is closed by whoever owns it, not by close().
+    """
+
+    async def create_run(self, run_id, seed_url, recrawl_of=None):
+        async with get_connection() as conn:
+            await create_run(conn, run_id, seed_url, recrawl_of)
+
+    async def resume_run(self, run_id):
+        async with get_connection() as conn:
+            await resume_run(conn, run_id)
+
+    async def join_run(self, run_id):
+        async with get_connection() as conn:
+            await join_run(conn, run_id)
+
+    async def finish_run(self, run_id, run_metrics=None):
+        async with get_connection() as conn:
+            await finish_run(conn, run_id, run_metrics)
+
+    async def iter_urls(self, run_id, since_id=0):
+        async with get_connection() as conn:
+            async with conn.transaction():
+                async for row in conn.cursor(
+                    """
+                    SELECT normalized_url, domain FROM urls
+                    WHERE crawl_run_id = $1 AND id > $2
+                    """,
+                    run_id,
+                    since_id,
+                    prefetch=10000,
+                ):
+                    yield row["normalized_url"], row["domain"]
+
+    async def known_urls(self, run_id, normalized_urls):
+        async with get_connection() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT normalized_url FROM urls
+                WHERE crawl_run_id = $1 AND normalized_url = ANY($2::text[])
+                """,
+                run_id,
+                normalized_urls,
+            )
+        return {row["normalized_url"] for row in rows}
+
+    async def max_url_id(self):
+        async with get_connection() as conn:
+            return await conn.fetchval("SELECT coalesce(max(id), 0) FROM urls")
+
+    async def load_checkpoint(self, run_id, shard, shard_count):
+        async with get_connection() as conn:
+            return await load_checkpoint(conn, run_id, shard, shard_count)
+
+    async def save_checkpoint(self, run_id, shard, shard_count, max_url_id, seen_filter, stats):
+        async with get_connection() as conn:
+            await save_checkpoint(conn, run_id, shard, shard_count, max_url_id, seen_filter, stats)
+
+    async def queued_domains(self, run_id):
+        async with get_connection() as conn:
+            return await get_queued_domains(conn, run_id)
+
+    async def lease_batch(self, run_id, domain, owner, limit, lease_seconds):
+        async with get_connection() as conn:
+            return await lease_batch(conn, run_id, domain, owner, limit, lease_seconds)
+
+    async def next_due(self, run_id, domain):
+        async with get_connection() as conn:
+            return await next_due(conn, run_id, domain)
+
+    async def count_leased(self, run_id, owner=None):
+        async with get_connection() as conn:
+            return await count_leased(conn, run_id, owner)
+
+    async def heartbeat(self, owner, url_ids, lease_seconds):
+        async with get_connection() as conn:
+            return await heartbeat(conn, owner, url_ids, lease_seconds)
+
+    async def reclaim_expired(self, run_id):
+        async with get_connection() as conn:
+            return await reclaim_expired(conn, run_id)
+
+    async def release_leases(self, owner):
+        async with get_connection() as conn:
+            return await release_leases(conn, owner)
+
+    async def get_url(self, url_id):
+        async with get_connection() as conn:
+            return await conn.fetchrow("SELECT * FROM urls WHERE id = $1", url_id)
+
+    async def write_batch(self, run_id, owner, links, fetched, errors, stored_keys, acks, retries):
+        acked = 0
+        async with get_connection() as conn:
+            async with conn.transaction():
+                queued = await insert_links(conn, run_id, links)
+                if fetched:
+                    await write_fetched(conn, fetched)
+                if errors:
+                    await write_errors(conn, errors)
+                if stored_keys:
+                    await write_stored_keys(conn, stored_keys)
+                if acks:
+                    acked = await ack(conn, owner, acks)
+                if retries:
+                    await write_retries(conn, retries)
+                    url_ids = [row[0] for row in retries]
+                    delays = [row[2] for row in retries]
+                    queued += await defer(conn, owner, url_ids, delays)
+        return queued, acked
+
+    async def get_domains(self, domains):
+        async with get_connection() as conn:
+            return await conn.fetch(
+                """
+                SELECT domain, robots_txt, crawl_delay_seconds,
+                       extract(epoch FROM now() - robots_fetched_at) AS age
+                FROM domains
+                WHERE domain = ANY($1::text[])
+                """,
+                domains,
+            )
+
+    async def save_robots(self, domain, robots_txt):
+        async with get_connection() as conn:
+            await conn.execute(
+                """
+                INSERT INTO domains (domain, robots_txt, robots_fetched_at)
+                VALUES ($1, $2, now())
+                ON CONFLICT (domain) DO UPDATE SET
+                    robots_txt = $2,
+                    robots_fetched_at = now()
+                """,
+                domain,
+                robots_txt,
+            )
+
+    async def save_crawl_delay(self, domain, delay):
+        async with get_connection() as conn:
+            await conn.execute(
+                """
+                INSERT INTO domains (domain, crawl_delay_seconds)
+                VALUES ($1, $2)
+                ON CONFLICT (domain) DO UPDATE SET
+                    crawl_delay_seconds = $2
+                """,
+                domain,
+                delay,
+            )
+
+    async def write_report(self, run_id, out, format="json"):
+        async with get_connection() as conn:
+            return await write_report(conn, run_id, out, format)
+
+
+def create_frontier() -> Frontier:
+    """The frontier chosen by ``frontier``."""
+    if settings.frontier == "sqlite":
+        from .sqlite_frontier import SqliteFrontier
+
+        return SqliteFrontier(settings.sqlite_path)
+    return PostgresFrontier()
@@ -0,0 +1,118 @@
+"""Shared HTTP client used by the fetcher and robots cache."""
+
+import asyncio
+from typing import Callable, Dict, Optional
+import httpx
+import structlog
+
+from . import dns_cache
+from .config import settings
+
+logger = structlog.get_logger()
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Response stream that frees its host slot once the body is closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+        self._released = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                self._release()
+
+
+class HostLimitedTransport(httpx.AsyncBaseTransport):
+    """
+    Transport that caps open connections per host.
+
+    httpx only limits connections for the whole pool, so a single host
+    could take every connection. Each request holds one of the host's
+    slots until its response body is closed.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, max_per_host: int):
+        self._transport = transport
+        self._max_per_host = max_per_host
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+        self._users: Dict[str, int] = {}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        slot = self._slots.get(host)
+        if slot is None:
+            slot = self._slots[host] = asyncio.Semaphore(self._max_per_host)
+        self._users[host] = self._users.get(host, 0) + 1
+
+        try:
+            await slot.acquire()
+        except BaseException:
+            self._forget(host)
+            raise
+
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            self._release(host)
+            raise
+        response.stream = _ReleasingStream(response.stream, lambda: self._release(host))
+        return response
+
+    def _release(self, host: str) -> None:
+        self._slots[host].release()
+        self._forget(host)
+
+    def _forget(self, host: str) -> None:
+        self._users[host] -= 1
+        if not self._users[host]:
+            # Drop idle hosts so the table stays small on wide crawls
+            del self._users[host]
+            del self._slots[host]
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def create_client(dns: Optional[dns_cache.DnsCache] = None) -> httpx.AsyncClient:
+    """
+    Create the long-lived client owned by a crawl run.
+
+    Connections are kept alive and reused across requests to the same
+    host, so only the first request to a host pays for the TCP and TLS
+    handshakes. With ``dns`` new connections take their addresses from
+    that cache instead of resolving the host every time. The caller is
+    responsible for closing the client.
+    """
+    http2 = settings.http2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("http2_unavailable", reason="install httpx[http2]")
+            http2 = False
+
+    limits = httpx.Limits(
+        max_connections=settings.http_max_connections,
+        max_keepalive_connections=settings.http_max_keepalive_connections,
+        keepalive_expiry=settings.http_keepalive_expiry,
+    )
+    http_transport = httpx.AsyncHTTPTransport(http2=http2, limits=limits)
+    if dns is not None:
+        dns_cache.install(http_transport, dns)
+    transport = HostLimitedTransport(http_transport, settings.http_max_connections_per_host)
+    return httpx.AsyncClient(
+        transport=transport,
+        follow_redirects=True,
+        timeout=httpx.Timeout(settings.read_timeout, connect=settings.connect_timeout),
+        headers={"User-Agent": settings.user_agent},
+    )
@@ -0,0 +1,322 @@
+"""Counters, gauges and latency histograms, exported in Prometheus text format."""
+
+import abc
+import bisect
+import contextlib
+import copy
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Upper bounds in seconds, from sub-millisecond DB calls to slow fetches
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+Snapshot = Dict[str, Dict[str, Any]]
+
+
+class Metric(abc.ABC):
+    """A named family of samples, one per combination of label values."""
+
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def _labels(self, values: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, values))
+
+    @abc.abstractmethod
+    def snapshot(self) -> Dict[str, Any]:
+        """Type, help text and current samples of this metric."""
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = defaultdict(float)
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] += amount
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "type": self.kind,
+            "help": self.help,
+            "samples": [
+                {"labels": self._labels(labels), "value": value}
+                for labels, value in dict(self._values).items()
+            ],
+        }
+
+
+class Gauge(Metric):
+    """A value that goes up and down, set directly or read from a function."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def set_function(self, function: Optional[Callable[[], float]]) -> None:
+        """Read the unlabelled value from ``function`` at export time."""
+        self._function = function
+
+    def snapshot(self) -> Dict[str, Any]:
+        values = dict(self._values)
+        if self._function is not None:
+            values[()] = float(self._function())
+        return {
+            "type": self.kind,
+            "help": self.help,
+            "samples": [
+                {"labels": self._labels(labels), "value": value} for labels, value in values.items()
+            ],
+        }
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values over fixed buckets.
+
+    An observation is a bisect and two additions, cheap enough for every
+    fetch, parse, upload and database call.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last is +Inf), sum]
+        self._values: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    @contextlib.contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        """Observe the duration of the ``with`` block."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "type": self.kind,
+            "help": self.help,
+            "buckets": list(self.buckets),
+            "samples": [
+                {
+                    "labels": self._labels(labels),
+                    "counts": list(counts),
+                    "sum": total,
+                    "count": sum(counts),
+                }
+                for labels, (counts, total) in dict(self._values).items()
+            ],
+        }
+
+
+class Registry:
+    """The metrics of one process."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self) -> Snapshot:
+        """Current values of every metric, as JSON-serializable data."""
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def render(self) -> str:
+        return render(self.snapshot())
+
+
+def merge(snapshots: Sequence[Snapshot]) -> Snapshot:
+    """Sum snapshots from several processes, sample by sample."""
+    merged: Snapshot = {}
+    for snapshot in snapshots:
+        for name, family in snapshot.items():
+            target = merged.get(name)
+            if target is None:
+                merged[name] = copy.deepcopy(family)
+                continue
+            index = {tuple(sorted(s["labels"].items())): s for s in target["samples"]}
+            for sample in family["samples"]:
+                existing = index.get(tuple(sorted(sample["labels"].items())))
+                if existing is None:
+                    target["samples"].append(copy.deepcopy(sample))
+                elif family["type"] == "histogram":
+                    existing["counts"] = [
+                        a + b for a, b in zip(existing["counts"], sample["counts"])
+                    ]
+                    existing["sum"] += sample["sum"]
+                    existing["count"] += sample["count"]
+                else:
+                    existing["value"] += sample["value"]
+    return merged
+
+
+def _format_labels(labels: Dict[str, str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels.items())
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def render(snapshot: Snapshot) -> str:
+    """Prometheus text exposition format of a snapshot."""
+    lines = []
+    for name, family in snapshot.items():
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        for sample in family["samples"]:
+            labels = sample["labels"]
+            if family["type"] != "histogram":
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(sample['value'])}")
+                continue
+            cumulative = 0
+            bounds = [str(bound) for bound in family["buckets"]] + ["+Inf"]
+            for bound, count in zip(bounds, sample["counts"]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, ('le', bound))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(sample['sum'])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {sample['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def start_server(host: str, port: int, source: Callable[[], str]) -> ThreadingHTTPServer:
+    """
+    Serve ``source()`` at /metrics from a background thread.
+
+    Call ``shutdown()`` on the returned server to stop it.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = source().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+REGISTRY = Registry()
+
+PAGES = REGISTRY.register(Counter("crawler_pages_total", "URLs processed, by outcome", ["outcome"]))
+FETCH_SECONDS = REGISTRY.register(
+    Histogram("crawler_fetch_seconds", "Time to fetch a URL, including the body")
+)
+FETCH_RESPONSES = REGISTRY.register(
+    Counter("crawler_fetch_responses_total", "Fetch results by status class", ["status"])
+)
+FETCH_ERRORS = REGISTRY.register(
+    Counter("crawler_fetch_errors_total", "Fetches without a response, by error type", ["type"])
+)
+FETCH_BYTES = REGISTRY.register(Counter("crawler_fetch_bytes_total", "HTML body bytes downloaded"))
+PARSE_SECONDS = REGISTRY.register(
+    Histogram("crawler_parse_seconds", "Time to parse and hash a page in a parse worker")
+)
+PARSE_WAIT_SECONDS = REGISTRY.register(
+    Histogram(
+        "crawler_parse_wait_seconds", "Time from handing a page to the parse pool to its result"
+    )
+)
+UPLOAD_SECONDS = REGISTRY.register(
+    Histogram("crawler_storage_upload_seconds", "Time to compress and upload a page body")
+)
+UPLOADS = REGISTRY.register(
+    Counter(
+        "crawler_storage_objects_total", "Page bodies handled by storage, by outcome", ["outcome"]
+    )
+)
+DB_SECONDS = REGISTRY.register(
+    Histogram("crawler_db_seconds", "Time spent in database operations", ["operation"])
+)
+HOST_WAIT_SECONDS = REGISTRY.register(
+    Histogram(
+        "crawler_host_wait_seconds",
+        "How long a host waited past its crawl delay for a fetch slot",
+    )
+)
+HOST_BACKOFFS = REGISTRY.register(
+    Counter(
+        "crawler_host_backoffs_total",
+        "Times a host's crawl delay was raised, by reason",
+        ["reason"],
+    )
+)
+DNS_LOOKUPS = REGISTRY.register(
+    Counter("crawler_dns_lookups_total", "Host name lookups by result", ["result"])
+)
+DNS_SECONDS = REGISTRY.register(
+    Histogram("crawler_dns_seconds", "Time to resolve a host name missing from the DNS cache")
+)
+QUEUE_DEPTH = REGISTRY.register(
+    Gauge("crawler_queue_depth", "Queued URLs known to the host scheduler")
+)
+HOSTS_PENDING = REGISTRY.register(Gauge("crawler_hosts_pending", "Hosts with queued URLs"))
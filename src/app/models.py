@@ -12,6 +12,7 @@ class CrawlRun(BaseModel):
     seed_domain: str
     total_fetched: int = 0
     total_discovered: int = 0
+    recrawl_of: Optional[str] = None
 
 
 class Url(BaseModel):
@@ -22,12 +23,15 @@ class Url(BaseModel):
     domain: str
     first_seen: datetime
     last_seen: datetime
-    status: str  # new, fetched, error
+    status: str  # new, fetched, unchanged, error
     http_status: Optional[int] = None
     fetch_attempts: int = 0
     content_type: Optional[str] = None
     content_size: Optional[int] = None
     stored_object_key: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
     crawl_run_id: str
 
 
@@ -35,9 +39,13 @@ class QueueItem(BaseModel):
     """Represents a URL in the crawl queue."""
     id: int
     url_id: int
+    crawl_run_id: str
+    domain: str
     priority: int = 0
     enqueued_at: datetime
     next_fetch_at: datetime
+    lease_owner: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
 
 
 class FetchError(BaseModel):
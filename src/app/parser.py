@@ -1,12 +1,30 @@
 """HTML parser and link extractor."""
+import functools
+import re
 from bs4 import BeautifulSoup
+from html.parser import HTMLParser
 from urllib.parse import urljoin, urlparse, urlunparse, parse_qs, urlencode
-from typing import List, Set
+from typing import Callable, Dict, List, Optional, Set
 import structlog
 
+from .config import settings
+
 logger = structlog.get_logger()
 
 
+# Query strings that parse_qs + urlencode reproduce unchanged: non-empty
+# key=value pairs made only of characters urlencode never escapes
+_SIMPLE_QUERY = re.compile(r"[\w.~-]+=[\w.~-]+(?:&[\w.~-]+=[\w.~-]+)*", re.ASCII)
+
+
+def _is_sorted_simple_query(query: str) -> bool:
+    if not _SIMPLE_QUERY.fullmatch(query):
+        return False
+    keys = [pair[: pair.index("=")] for pair in query.split("&")]
+    return all(a <= b for a, b in zip(keys, keys[1:]))
+
+
+@functools.lru_cache(maxsize=settings.normalize_cache_size)
 def normalize_url(url: str) -> str:
     """
     Normalize URL for consistent storage and comparison.
@@ -16,6 +34,9 @@ def normalize_url(url: str) -> str:
     - Remove fragments
     - Sort query parameters
     - Remove trailing slash for non-root paths
+
+    Results are memoized in a bounded LRU cache, since navigation links
+    repeat on every page; see normalize_cache_stats().
     """
     parsed = urlparse(url)
     
@@ -29,12 +50,14 @@ def normalize_url(url: str) -> str:
     elif netloc.endswith(":443") and scheme == "https":
         netloc = netloc[:-4]
     
-    # Sort query parameters
-    if parsed.query:
+    # Sort query parameters, skipping the re-encoding when already sorted
+    if not parsed.query:
+        query = ""
+    elif _is_sorted_simple_query(parsed.query):
+        query = parsed.query
+    else:
         params = parse_qs(parsed.query)
         query = urlencode(sorted(params.items()), doseq=True)
-    else:
-        query = ""
     
     # Remove trailing slash for non-root paths
     path = parsed.path
@@ -44,22 +67,80 @@ def normalize_url(url: str) -> str:
     return urlunparse((scheme, netloc, path, "", query, ""))
 
 
-def parse_and_extract_links(html: str, base_url: str) -> Set[str]:
+def normalize_cache_stats() -> Dict[str, float]:
+    """Hit, miss and size counters of the normalize_url cache in this process."""
+    info = normalize_url.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "size": info.currsize,
+        "max_size": info.maxsize,
+        "hit_rate": info.hits / lookups if lookups else 0.0,
+    }
+
+
+class _HrefCollector(HTMLParser):
+    """Streaming tokenizer that records <a href> values without building a tree."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.hrefs: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "a":
+            return
+        href = None
+        # The last duplicate attribute wins, as in BeautifulSoup
+        for name, value in attrs:
+            if name == "href":
+                href = "" if value is None else value
+        if href is not None:
+            self.hrefs.append(href)
+
+
+def _extract_hrefs_bs4(html: str) -> List[str]:
+    soup = BeautifulSoup(html, "html.parser")
+    return [a["href"] for a in soup.find_all("a", href=True)]
+
+
+def _extract_hrefs_fast(html: str) -> List[str]:
+    # No anchor tag can start without "<a" or "<A"
+    if "<a" not in html and "<A" not in html:
+        return []
+    collector = _HrefCollector()
+    collector.feed(html)
+    collector.close()
+    return collector.hrefs
+
+
+LINK_EXTRACTORS: Dict[str, Callable[[str], List[str]]] = {
+    "bs4": _extract_hrefs_bs4,
+    "fast": _extract_hrefs_fast,
+}
+
+
+def parse_and_extract_links(html: str, base_url: str, engine: Optional[str] = None) -> Set[str]:
     """
     Parse HTML and extract normalized links.
-    
+
+    The "fast" engine tokenizes the document with the same html.parser
+    tokenizer BeautifulSoup uses, but never builds a tree, so both engines
+    return identical link sets.
+
     Args:
         html: HTML content to parse
         base_url: Base URL for resolving relative links
+        engine: Key of LINK_EXTRACTORS, defaults to settings.link_extractor
 
     Returns:
         Set of normalized absolute URLs
     """
+    extract_hrefs = LINK_EXTRACTORS[engine or settings.link_extractor]
     urls = set()
     try:
-        soup = BeautifulSoup(html, "html.parser")
-        for a in soup.find_all("a", href=True):
-            href = a["href"].strip()
+        for href in extract_hrefs(html):
+            href = href.strip()
             
             # Skip javascript: and mailto: links
             if href.startswith(("javascript:", "mailto:", "tel:")):
@@ -0,0 +1,373 @@
+"""Batched persistence of discovered links and URL state."""
+
+import asyncio
+from typing import Callable, List, Optional, Tuple
+import asyncpg
+import structlog
+
+from . import metrics
+from .config import settings
+
+logger = structlog.get_logger()
+
+# (url, normalized_url, domain, enqueue)
+LinkRow = Tuple[str, str, str, bool]
+
+# Called with the domain of each newly queued URL after a flush
+QueuedCallback = Callable[[List[str]], None]
+
+# (url_id, status, http_status, content_type, content_size, etag, last_modified, content_hash)
+FetchedRow = Tuple[
+    int, str, int, Optional[str], Optional[int], Optional[str], Optional[str], Optional[str]
+]
+
+# (url_id, http_status or None, delay in seconds before the URL is due again,
+#  error_type and error_msg if no response was received)
+RetryRow = Tuple[int, Optional[int], float, Optional[str], Optional[str]]
+
+
+async def insert_links(
+    conn: asyncpg.Connection, crawl_run_id: str, links: List[LinkRow]
+) -> List[Tuple[int, str]]:
+    """
+    Insert discovered links and queue the new ones in one statement.
+
+    Links already in ``urls`` are left alone, so the many links a run
+    sees again cost no row writes; links seen for the first time are
+    queued when their ``enqueue`` flag is set. Returns the (url id,
+    domain) of each queued URL.
+    """
+    if not links:
+        return []
+    urls, normalized, domains, enqueue = zip(*links)
+    query = """
+    WITH input AS (
+        SELECT DISTINCT ON (normalized_url) url, normalized_url, domain, enqueue
+        FROM unnest($2::text[], $3::text[], $4::text[], $5::bool[])
+            AS t(url, normalized_url, domain, enqueue)
+        ORDER BY normalized_url, enqueue DESC
+    ),
+    inserted AS (
+        INSERT INTO urls (url, normalized_url, domain, crawl_run_id)
+        SELECT url, normalized_url, domain, $1 FROM input
+        ON CONFLICT (crawl_run_id, normalized_url) DO NOTHING
+        RETURNING id, normalized_url, domain
+    )
+    INSERT INTO queue (url_id, crawl_run_id, domain, priority, enqueued_at, next_fetch_at)
+    SELECT u.id, $1, u.domain, 0, now(), now()
+    FROM inserted u
+    JOIN input i ON i.normalized_url = u.normalized_url
+    WHERE i.enqueue
+    ON CONFLICT (url_id) DO NOTHING
+    RETURNING url_id, domain;
+    """
+    rows = await conn.fetch(
+        query, crawl_run_id, list(urls), list(normalized), list(domains), list(enqueue)
+    )
+    return [(row["url_id"], row["domain"]) for row in rows]
+
+
+async def write_fetched(conn: asyncpg.Connection, fetched: List[FetchedRow]) -> None:
+    """
+    Record fetch results, one UPDATE for the whole batch.
+
+    A page whose body changed loses its object key until the new body is stored.
+    """
+    columns = [list(column) for column in zip(*fetched)]
+    await conn.execute(
+        """
+        UPDATE urls AS u
+        SET status = t.status,
+            http_status = t.http_status,
+            fetch_attempts = u.fetch_attempts + 1,
+            content_type = coalesce(t.content_type, u.content_type),
+            content_size = coalesce(t.content_size, u.content_size),
+            etag = coalesce(t.etag, u.etag),
+            last_modified = coalesce(t.last_modified, u.last_modified),
+            content_hash = coalesce(t.content_hash, u.content_hash),
+            -- A changed body no longer matches the key copied from an earlier run
+            stored_object_key = CASE
+                WHEN coalesce(t.content_hash, u.content_hash) IS DISTINCT FROM u.content_hash
+                THEN NULL ELSE u.stored_object_key
+            END,
+            last_seen = now()
+        FROM unnest(
+            $1::int[], $2::text[], $3::int[], $4::text[], $5::int[],
+            $6::text[], $7::text[], $8::text[]
+        ) AS t(
+            id, status, http_status, content_type, content_size,
+            etag, last_modified, content_hash
+        )
+        WHERE u.id = t.id
+        """,
+        *columns,
+    )
+
+
+async def write_errors(conn: asyncpg.Connection, errors: List[Tuple[int, str, str]]) -> None:
+    """Mark failed URLs and add their fetch_errors rows."""
+    ids, error_types, error_msgs = zip(*errors)
+    await conn.execute(
+        """
+        UPDATE urls
+        SET status = 'error',
+            fetch_attempts = fetch_attempts + 1,
+            last_seen = now()
+        WHERE id = ANY($1::int[])
+        """,
+        list(ids),
+    )
+    await conn.execute(
+        """
+        INSERT INTO fetch_errors (url_id, error_type, error_msg)
+        SELECT * FROM unnest($1::int[], $2::text[], $3::text[])
+        """,
+        list(ids),
+        list(error_types),
+        list(error_msgs),
+    )
+
+
+async def write_stored_keys(conn: asyncpg.Connection, stored_keys: List[Tuple[int, str]]) -> None:
+    """Record the object keys of uploaded pages."""
+    ids, keys = zip(*stored_keys)
+    await conn.execute(
+        """
+        UPDATE urls AS u
+        SET stored_object_key = t.key
+        FROM unnest($1::int[], $2::text[]) AS t(id, key)
+        WHERE u.id = t.id
+        """,
+        list(ids),
+        list(keys),
+    )
+
+
+async def write_retries(conn: asyncpg.Connection, retries: List[RetryRow]) -> None:
+    """
+    Count the attempts of URLs put back in the queue and keep their last status.
+
+    Attempts that failed without a response also get their fetch_errors row.
+    """
+    ids, http_statuses, _, _, _ = zip(*retries)
+    await conn.execute(
+        """
+        UPDATE urls AS u
+        SET http_status = t.http_status,
+            fetch_attempts = u.fetch_attempts + 1,
+            last_seen = now()
+        FROM unnest($1::int[], $2::int[]) AS t(id, http_status)
+        WHERE u.id = t.id
+        """,
+        list(ids),
+        list(http_statuses),
+    )
+    failed = [(url_id, error_type, msg) for url_id, _, _, error_type, msg in retries if error_type]
+    if failed:
+        ids, error_types, error_msgs = zip(*failed)
+        await conn.execute(
+            """
+            INSERT INTO fetch_errors (url_id, error_type, error_msg)
+            SELECT * FROM unnest($1::int[], $2::text[], $3::text[])
+            """,
+            list(ids),
+            list(error_types),
+            list(error_msgs),
+        )
+
+
+class Persistence:
+    """
+    Write-behind buffer for the runner's URL bookkeeping.
+
+    Discovered links, fetch results, stored object keys, fetch errors,
+    retries and queue acks are buffered in memory and written in one transaction of
+    set-based statements, either when ``db_batch_size`` rows are pending
+    or every ``db_flush_interval`` seconds. A flush costs a handful of round trips
+    however many pages and links it covers. Rows go to ``frontier``, whose
+    ``write_batch`` runs each flush.
+    """
+
+    def __init__(self, crawl_run_id: str, frontier, lease_owner: Optional[str] = None):
+        self.crawl_run_id = crawl_run_id
+        self.lease_owner = lease_owner
+        self._frontier = frontier
+        self._links: List[LinkRow] = []
+        self._fetched: List[FetchedRow] = []
+        self._errors: List[Tuple[int, str, str]] = []
+        self._stored_keys: List[Tuple[int, str]] = []
+        self._acks: List[int] = []
+        self._retries: List[RetryRow] = []
+        self._lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        self._on_queued: Optional[QueuedCallback] = None
+
+    @property
+    def pending(self) -> int:
+        """Number of buffered rows."""
+        return (
+            len(self._links)
+            + len(self._fetched)
+            + len(self._errors)
+            + len(self._stored_keys)
+            + len(self._acks)
+            + len(self._retries)
+        )
+
+    def start(self, on_queued: Optional[QueuedCallback] = None) -> None:
+        """
+        Start the periodic background flush.
+
+        ``on_queued`` is called after each flush with the domains of the
+        URLs it added to the queue, including those put back for a retry.
+        """
+        self._on_queued = on_queued
+        self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def close(self) -> None:
+        """Stop the background flush and write out everything still buffered."""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+
+    async def add_links(self, links: List[LinkRow]) -> None:
+        """Buffer links discovered on a page."""
+        self._links.extend(links)
+        await self._maybe_flush()
+
+    async def record_fetched(
+        self,
+        url_id: int,
+        http_status: int,
+        content_type: Optional[str],
+        content_size: Optional[int],
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        content_hash: Optional[str] = None,
+    ) -> None:
+        """Buffer the result of a successful fetch and its validators."""
+        self._fetched.append(
+            (
+                url_id,
+                "fetched",
+                http_status,
+                content_type,
+                content_size,
+                etag,
+                last_modified,
+                content_hash,
+            )
+        )
+        await self._maybe_flush()
+
+    async def record_unchanged(
+        self,
+        url_id: int,
+        http_status: int,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> None:
+        """
+        Buffer a re-fetch that found the page unchanged.
+
+        The URL keeps the content type, size, hash and object key copied
+        from the earlier run; validators are updated when the server sent
+        new ones.
+        """
+        self._fetched.append(
+            (url_id, "unchanged", http_status, None, None, etag, last_modified, None)
+        )
+        await self._maybe_flush()
+
+    async def record_error(self, url_id: int, error_type: str, error_msg: str) -> None:
+        """Buffer a failed fetch and its fetch_errors row."""
+        self._errors.append((url_id, error_type, error_msg))
+        await self._maybe_flush()
+
+    async def record_stored_key(self, url_id: int, key: str) -> None:
+        """Buffer the object key of an uploaded page."""
+        self._stored_keys.append((url_id, key))
+        await self._maybe_flush()
+
+    async def ack(self, url_id: int) -> None:
+        """
+        Buffer the removal of a fully processed URL from the queue.
+
+        The ack is written in the same flush as, or a later one than, the
+        rows recorded for the URL before it, so a URL leaves the queue only
+        once its results are in the database.
+        """
+        self._acks.append(url_id)
+        await self._maybe_flush()
+
+    async def record_retry(
+        self,
+        url_id: int,
+        http_status: Optional[int],
+        delay: float,
+        error_type: Optional[str] = None,
+        error_msg: Optional[str] = None,
+    ) -> None:
+        """
+        Buffer putting a leased URL back in the queue, due again after ``delay`` seconds.
+
+        The attempt is counted like a fetch, and a failure without a
+        response gets its fetch_errors row, but the URL keeps its status
+        and stays queued instead of being acked.
+        """
+        self._retries.append((url_id, http_status, delay, error_type, error_msg))
+        await self._maybe_flush()
+
+    async def _maybe_flush(self) -> None:
+        if self.pending >= settings.db_batch_size:
+            await self.flush()
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(settings.db_flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("flush_failed", error=str(e))
+
+    async def flush(self) -> None:
+        """Write all buffered rows in a single transaction."""
+        async with self._lock:
+            links, self._links = self._links, []
+            fetched, self._fetched = self._fetched, []
+            errors, self._errors = self._errors, []
+            stored_keys, self._stored_keys = self._stored_keys, []
+            acks, self._acks = self._acks, []
+            retries, self._retries = self._retries, []
+            if not (links or fetched or errors or stored_keys or acks or retries):
+                return
+
+            try:
+                with metrics.DB_SECONDS.time("flush"):
+                    queued, acked = await self._frontier.write_batch(
+                        self.crawl_run_id,
+                        self.lease_owner,
+                        links,
+                        fetched,
+                        errors,
+                        stored_keys,
+                        acks,
+                        retries,
+                    )
+            except BaseException:
+                # Keep the rows for the next attempt
+                self._links[:0] = links
+                self._fetched[:0] = fetched
+                self._errors[:0] = errors
+                self._stored_keys[:0] = stored_keys
+                self._acks[:0] = acks
+                self._retries[:0] = retries
+                raise
+
+            if acked < len(acks):
+                # Leases that expired and were taken over elsewhere
+                logger.warning("leases_lost", count=len(acks) - acked)
+            if queued and self._on_queued:
+                self._on_queued([domain for _, domain in queued])
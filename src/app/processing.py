@@ -0,0 +1,135 @@
+"""CPU-heavy page processing, offloaded to a process pool."""
+
+import asyncio
+import hashlib
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+from urllib.parse import urlparse
+import structlog
+
+from . import metrics
+from .config import settings
+from .parser import parse_and_extract_links
+
+logger = structlog.get_logger()
+
+
+@dataclass
+class PageResult:
+    """Output of processing one HTML page."""
+
+    links: List[Tuple[str, str, str]]  # (url, normalized url, domain)
+    content_hash: str  # hex SHA-256 of the raw body
+    parse_seconds: float = 0.0  # time spent in process_page
+
+
+def process_page(content: bytes, url: str, engine: str) -> PageResult:
+    """Decode, parse and hash a page."""
+    started = time.perf_counter()
+    html = content.decode(errors="replace")
+    # The parser already normalizes, so the link is its own normalized form
+    links = [
+        (link, link, urlparse(link).netloc) for link in parse_and_extract_links(html, url, engine)
+    ]
+    return PageResult(
+        links=links,
+        content_hash=hashlib.sha256(content).hexdigest(),
+        parse_seconds=time.perf_counter() - started,
+    )
+
+
+def process_batch(pages: List[Tuple[bytes, str]], engine: str) -> List[PageResult]:
+    """Process several pages in one call, to amortize inter-process overhead."""
+    return [process_page(content, url, engine) for content, url in pages]
+
+
+class PagePool:
+    """
+    Process pool that keeps parsing off the event loop thread.
+
+    Pages are collected into batches of up to ``parse_batch_size`` (or
+    whatever arrived within ``parse_batch_linger`` seconds) and each batch
+    is one task for the pool. At most ``parse_max_pending`` pages wait for
+    a result at once; callers beyond that block, bounding memory. With
+    ``parse_workers`` set to 0 pages are processed inline.
+    """
+
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots = asyncio.Semaphore(settings.parse_max_pending)
+        self._batch: List[Tuple[bytes, str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def start(self) -> None:
+        """Start the worker processes."""
+        if settings.parse_workers > 0:
+            self._executor = ProcessPoolExecutor(
+                max_workers=settings.parse_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+
+    async def close(self) -> None:
+        """Flush the pending batch and shut the workers down."""
+        if self._batch:
+            self._submit_batch()
+        if self._executor is not None:
+            await asyncio.to_thread(self._executor.shutdown, wait=True)
+            self._executor = None
+
+    async def process(self, content: bytes, url: str) -> PageResult:
+        """Process a page in the pool and wait for its result."""
+        started = time.perf_counter()
+        page = await self._process(content, url)
+        metrics.PARSE_WAIT_SECONDS.observe(time.perf_counter() - started)
+        metrics.PARSE_SECONDS.observe(page.parse_seconds)
+        return page
+
+    async def _process(self, content: bytes, url: str) -> PageResult:
+        if self._executor is None:
+            return process_page(content, url, settings.link_extractor)
+
+        async with self._slots:
+            future = asyncio.get_running_loop().create_future()
+            self._batch.append((content, url, future))
+            if len(self._batch) >= settings.parse_batch_size:
+                self._submit_batch()
+            elif self._timer is None:
+                self._timer = asyncio.get_running_loop().call_later(
+                    settings.parse_batch_linger, self._submit_batch
+                )
+            return await future
+
+    def _submit_batch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+
+        pages = [(content, url) for content, url, _ in batch]
+        futures = [future for _, _, future in batch]
+        pool_future = asyncio.get_running_loop().run_in_executor(
+            self._executor, process_batch, pages, settings.link_extractor
+        )
+
+        def deliver(done: asyncio.Future) -> None:
+            if done.cancelled():
+                for future in futures:
+                    future.cancel()
+                return
+            error = done.exception()
+            if error is not None:
+                logger.error("page_batch_failed", pages=len(pages), error=str(error))
+            for i, future in enumerate(futures):
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(done.result()[i])
+
+        pool_future.add_done_callback(deliver)
@@ -1,55 +1,403 @@
-"""URL queue management."""
+"""Crawl runs and URL queue management."""
+import json
 from datetime import datetime, timezone
+from urllib.parse import urlparse
 import asyncpg
-from typing import Optional
+from typing import List, Optional, Tuple
+import structlog
 
+from . import metrics
+from .checkpoint import delete_checkpoints
 from .models import QueueItem
 from .db import get_connection
+from .parser import normalize_url
 
+logger = structlog.get_logger()
 
-async def enqueue_if_new(conn: asyncpg.Connection, url_id: int, crawl_run_id: str, priority: int = 0) -> Optional[int]:
+
+async def enqueue_if_new(
+    conn: asyncpg.Connection, url_id: int, crawl_run_id: str, priority: int = 0
+) -> Optional[int]:
     """Add URL to queue if not already present. Returns queue item ID if added."""
     query = """
-    INSERT INTO queue (url_id, priority, enqueued_at, next_fetch_at)
-    SELECT $1, $2, now(), now()
-    WHERE NOT EXISTS (
-        SELECT 1 FROM queue WHERE url_id = $1
-    )
+    INSERT INTO queue (url_id, crawl_run_id, domain, priority, enqueued_at, next_fetch_at)
+    SELECT id, $2, domain, $3, now(), now()
+    FROM urls
+    WHERE id = $1
+    ON CONFLICT (url_id) DO NOTHING
     RETURNING id;
     """
-    result = await conn.fetchval(query, url_id, priority)
+    result = await conn.fetchval(query, url_id, crawl_run_id, priority)
     return result
 
 
-async def pop_next(conn: asyncpg.Connection, domain: str) -> Optional[QueueItem]:
-    """Get next URL to fetch for a domain, respecting crawl delay."""
+async def copy_run_urls(conn: asyncpg.Connection, from_run_id: str, to_run_id: str) -> int:
+    """
+    Copy an earlier run's URLs into a new run for a re-crawl.
+
+    Validators, content hash, content type and object key are copied
+    with each URL. URLs the earlier run fetched or tried to fetch are
+    queued again; the rest are only carried over as discovered links.
+    Returns the number of URLs queued.
+    """
     query = """
-    WITH next_url AS (
-        SELECT q.id, q.url_id, q.priority, q.enqueued_at, q.next_fetch_at
-        FROM queue q
-        JOIN urls u ON u.id = q.url_id
-        WHERE u.domain = $1
-          AND q.next_fetch_at <= now()
-        ORDER BY q.priority DESC, q.enqueued_at ASC
-        LIMIT 1
+    WITH previous AS (
+        SELECT url, normalized_url, domain, content_type, content_size, stored_object_key,
+               etag, last_modified, content_hash,
+               status IN ('fetched', 'unchanged', 'error') AS refetch
+        FROM urls
+        WHERE crawl_run_id = $1
+    ),
+    copied AS (
+        INSERT INTO urls (
+            url, normalized_url, domain, crawl_run_id, content_type, content_size,
+            stored_object_key, etag, last_modified, content_hash
+        )
+        SELECT url, normalized_url, domain, $2, content_type, content_size,
+               stored_object_key, etag, last_modified, content_hash
+        FROM previous
+        ON CONFLICT (crawl_run_id, normalized_url) DO NOTHING
+        RETURNING id, normalized_url, domain
+    ),
+    queued AS (
+        INSERT INTO queue (url_id, crawl_run_id, domain, priority, enqueued_at, next_fetch_at)
+        SELECT c.id, $2, c.domain, 0, now(), now()
+        FROM copied c
+        JOIN previous p ON p.normalized_url = c.normalized_url
+        WHERE p.refetch
+        ON CONFLICT (url_id) DO NOTHING
+        RETURNING 1
+    )
+    SELECT count(*) FROM queued;
+    """
+    return await conn.fetchval(query, from_run_id, to_run_id)
+
+
+def _queue_item(row: asyncpg.Record) -> QueueItem:
+    return QueueItem(
+        id=row["id"],
+        url_id=row["url_id"],
+        crawl_run_id=row["crawl_run_id"],
+        domain=row["domain"],
+        priority=row["priority"],
+        enqueued_at=row["enqueued_at"],
+        next_fetch_at=row["next_fetch_at"],
+        lease_owner=row["lease_owner"],
+        lease_expires_at=row["lease_expires_at"],
+    )
+
+
+async def lease_batch(
+    conn: asyncpg.Connection,
+    crawl_run_id: str,
+    domain: str,
+    owner: str,
+    limit: int,
+    lease_seconds: float,
+) -> List[QueueItem]:
+    """
+    Lease up to ``limit`` due URLs for one domain of a run to ``owner``, in pop order.
+
+    Leased rows stay in the queue and are invisible to other owners until
+    they are acked, released, or the lease expires; an expired lease is
+    taken over like an unleased row. Rows another connection is leasing
+    are skipped rather than waited for.
+    """
+    query = """
+    WITH next_urls AS (
+        SELECT id
+        FROM queue
+        WHERE crawl_run_id = $1
+          AND domain = $2
+          AND next_fetch_at <= now()
+          AND (lease_expires_at IS NULL OR lease_expires_at < now())
+        ORDER BY priority DESC, enqueued_at ASC
+        LIMIT $4
         FOR UPDATE SKIP LOCKED
     )
-    DELETE FROM queue
-    WHERE id = (SELECT id FROM next_url)
-    RETURNING *;
-    """
-    row = await conn.fetchrow(query, domain)
-    if row:
-        return QueueItem(
-            id=row["id"],
-            url_id=row["url_id"],
-            priority=row["priority"],
-            enqueued_at=row["enqueued_at"],
-            next_fetch_at=row["next_fetch_at"],
+    UPDATE queue q
+    SET lease_owner = $3,
+        lease_expires_at = now() + make_interval(secs => $5)
+    FROM next_urls n
+    WHERE q.id = n.id
+    RETURNING q.*;
+    """
+    with metrics.DB_SECONDS.time("lease"):
+        rows = await conn.fetch(query, crawl_run_id, domain, owner, limit, float(lease_seconds))
+    items = [_queue_item(row) for row in rows]
+    # UPDATE ... RETURNING does not keep the CTE's order
+    items.sort(key=lambda item: (-item.priority, item.enqueued_at))
+    return items
+
+
+async def ack(conn: asyncpg.Connection, owner: str, url_ids: List[int]) -> int:
+    """Remove fully processed URLs still leased to ``owner``. Returns the number removed."""
+    result = await conn.execute(
+        "DELETE FROM queue WHERE url_id = ANY($1::int[]) AND lease_owner = $2",
+        url_ids,
+        owner,
+    )
+    return int(result.split()[-1])
+
+
+async def defer(
+    conn: asyncpg.Connection, owner: str, url_ids: List[int], delays: List[float]
+) -> List[Tuple[int, str]]:
+    """
+    Hand URLs still leased to ``owner`` back to the queue, each due after its delay.
+
+    Returns the (url id, domain) of each URL put back.
+    """
+    rows = await conn.fetch(
+        """
+        UPDATE queue AS q
+        SET next_fetch_at = now() + make_interval(secs => t.delay),
+            lease_owner = NULL,
+            lease_expires_at = NULL
+        FROM unnest($1::int[], $2::float8[]) AS t(url_id, delay)
+        WHERE q.url_id = t.url_id AND q.lease_owner = $3
+        RETURNING q.url_id, q.domain
+        """,
+        url_ids,
+        delays,
+        owner,
+    )
+    return [(row["url_id"], row["domain"]) for row in rows]
+
+
+async def next_due(conn: asyncpg.Connection, crawl_run_id: str, domain: str) -> Optional[float]:
+    """Seconds until a domain's next unleased queued URL is due, None if it has none."""
+    return await conn.fetchval(
+        """
+        SELECT extract(epoch FROM min(next_fetch_at) - now())::float8
+        FROM queue
+        WHERE crawl_run_id = $1
+          AND domain = $2
+          AND (lease_expires_at IS NULL OR lease_expires_at < now())
+        """,
+        crawl_run_id,
+        domain,
+    )
+
+
+async def heartbeat(
+    conn: asyncpg.Connection, owner: str, url_ids: List[int], lease_seconds: float
+) -> int:
+    """Extend ``owner``'s leases on the given URLs. Returns the number still held."""
+    with metrics.DB_SECONDS.time("heartbeat"):
+        result = await conn.execute(
+            """
+            UPDATE queue
+            SET lease_expires_at = now() + make_interval(secs => $3)
+            WHERE url_id = ANY($1::int[]) AND lease_owner = $2
+            """,
+            url_ids,
+            owner,
+            float(lease_seconds),
         )
-    return None
+    return int(result.split()[-1])
+
+
+async def release_leases(conn: asyncpg.Connection, owner: str) -> int:
+    """Hand every URL leased to ``owner`` back to the queue. Returns the number released."""
+    result = await conn.execute(
+        """
+        UPDATE queue
+        SET lease_owner = NULL, lease_expires_at = NULL
+        WHERE lease_owner = $1
+        """,
+        owner,
+    )
+    return int(result.split()[-1])
+
+
+async def requeue_unfinished(conn: asyncpg.Connection, crawl_run_id: str) -> Tuple[int, int]:
+    """
+    Prepare a stopped run's queue for resuming it.
+
+    Every lease in the run is cleared, since the crawlers holding them
+    are gone. URLs whose results were written before the crash but whose
+    ack was not are dropped from the queue instead of being fetched
+    again; an HTML page only counts as done once its body was stored.
+    Returns (released, dropped).
+    """
+    async with conn.transaction():
+        dropped = await conn.execute(
+            """
+            DELETE FROM queue q
+            USING urls u
+            WHERE q.crawl_run_id = $1
+              AND u.id = q.url_id
+              AND (
+                  u.status IN ('unchanged', 'error')
+                  OR (u.status = 'fetched'
+                      AND (u.content_hash IS NULL OR u.stored_object_key IS NOT NULL))
+              )
+            """,
+            crawl_run_id,
+        )
+        released = await conn.execute(
+            """
+            UPDATE queue
+            SET lease_owner = NULL, lease_expires_at = NULL
+            WHERE crawl_run_id = $1
+              AND lease_owner IS NOT NULL
+            """,
+            crawl_run_id,
+        )
+    return int(released.split()[-1]), int(dropped.split()[-1])
+
+
+async def reclaim_expired(conn: asyncpg.Connection, crawl_run_id: str) -> List[str]:
+    """Clear leases in a run that have expired. Returns the domain of each reclaimed URL."""
+    with metrics.DB_SECONDS.time("reclaim"):
+        rows = await conn.fetch(
+            """
+            UPDATE queue
+            SET lease_owner = NULL, lease_expires_at = NULL
+            WHERE crawl_run_id = $1
+              AND lease_owner IS NOT NULL
+              AND lease_expires_at < now()
+            RETURNING domain
+            """,
+            crawl_run_id,
+        )
+    return [row["domain"] for row in rows]
+
+
+async def count_leased(
+    conn: asyncpg.Connection, crawl_run_id: str, owner: Optional[str] = None
+) -> int:
+    """Number of URLs in a run currently leased, by any owner or only by ``owner``."""
+    return await conn.fetchval(
+        """
+        SELECT count(*)
+        FROM queue
+        WHERE crawl_run_id = $1
+          AND lease_owner = coalesce($2, lease_owner)
+          AND lease_expires_at >= now()
+        """,
+        crawl_run_id,
+        owner,
+    )
+
+
+async def get_queued_domains(conn: asyncpg.Connection, crawl_run_id: str) -> List[Tuple[str, int]]:
+    """Get each domain with unleased queued URLs in a run and how many it has."""
+    query = """
+    SELECT domain, count(*) AS queued
+    FROM queue
+    WHERE crawl_run_id = $1
+      AND (lease_expires_at IS NULL OR lease_expires_at < now())
+    GROUP BY domain;
+    """
+    with metrics.DB_SECONDS.time("queued_domains"):
+        rows = await conn.fetch(query, crawl_run_id)
+    return [(row["domain"], row["queued"]) for row in rows]
 
 
 async def get_queue_length(conn: asyncpg.Connection) -> int:
     """Get total number of URLs in queue."""
-    return await conn.fetchval("SELECT count(*) FROM queue;")
\ No newline at end of file
+    return await conn.fetchval("SELECT count(*) FROM queue;")
+
+
+async def create_run(conn, run_id: str, seed_url: str, recrawl_of: Optional[str] = None) -> None:
+    """
+    Create a crawl run and queue its seed URL.
+
+    A re-crawl of an earlier run also starts from every URL that run
+    knew, with its validators, so unchanged pages can be confirmed with
+    conditional requests instead of being downloaded and parsed again.
+    """
+    # Create crawl run
+    seed_domain = urlparse(seed_url).netloc
+    await conn.execute(
+        """
+        INSERT INTO crawl_runs (id, seed_domain, recrawl_of)
+        VALUES ($1, $2, $3)
+        """,
+        run_id,
+        seed_domain,
+        recrawl_of,
+    )
+
+    if recrawl_of is not None:
+        copied = await copy_run_urls(conn, recrawl_of, run_id)
+        logger.info("recrawl_seeded", run_id=run_id, recrawl_of=recrawl_of, queued=copied)
+
+    # Add seed URL, which a re-crawl may already have copied
+    url_id = await conn.fetchval(
+        """
+        INSERT INTO urls (url, normalized_url, domain, crawl_run_id)
+        VALUES ($1, $2, $3, $4)
+        ON CONFLICT (crawl_run_id, normalized_url) DO UPDATE
+        SET last_seen = now()
+        RETURNING id
+        """,
+        seed_url,
+        normalize_url(seed_url),
+        seed_domain,
+        run_id,
+    )
+    await enqueue_if_new(conn, url_id, run_id)
+
+
+async def resume_run(conn, run_id: str) -> None:
+    """
+    Prepare a stopped run to be crawled again from where it left off.
+
+    URLs leased by the crawlers that stopped go back to the queue, and
+    URLs they finished are not fetched again.
+    """
+    exists = await conn.fetchval("SELECT true FROM crawl_runs WHERE id = $1", run_id)
+    if not exists:
+        raise ValueError(f"Run {run_id} not found")
+    released, dropped = await requeue_unfinished(conn, run_id)
+    await conn.execute("UPDATE crawl_runs SET finished_at = NULL WHERE id = $1", run_id)
+    logger.info("run_resumed", run_id=run_id, leases_released=released, finished_dropped=dropped)
+
+
+async def join_run(conn, run_id: str) -> None:
+    """
+    Check that a run is still going before crawling it alongside its other crawlers.
+
+    Unlike resume_run, only expired leases are taken back; URLs leased by
+    crawlers still at work stay theirs.
+    """
+    row = await conn.fetchrow("SELECT finished_at FROM crawl_runs WHERE id = $1", run_id)
+    if row is None:
+        raise ValueError(f"Run {run_id} not found")
+    if row["finished_at"] is not None:
+        raise ValueError(f"Run {run_id} has finished; resume it to crawl it again")
+    reclaimed = await reclaim_expired(conn, run_id)
+    logger.info("run_joined", run_id=run_id, leases_reclaimed=len(reclaimed))
+
+
+async def finish_run(conn, run_id: str, run_metrics: Optional[metrics.Snapshot] = None) -> None:
+    """Mark a crawl run finished and record its totals and metrics."""
+    # Update crawl run stats
+    stats = await conn.fetchrow(
+        """
+        SELECT
+            count(*) FILTER (WHERE status IN ('fetched', 'unchanged')) as total_fetched,
+            count(*) as total_discovered
+        FROM urls
+        WHERE crawl_run_id = $1
+        """,
+        run_id,
+    )
+    await conn.execute(
+        """
+        UPDATE crawl_runs
+        SET finished_at = now(),
+            total_fetched = $1,
+            total_discovered = $2,
+            metrics = coalesce($4::jsonb, metrics)
+        WHERE id = $3
+        """,
+        stats["total_fetched"],
+        stats["total_discovered"],
+        run_id,
+        json.dumps(run_metrics) if run_metrics is not None else None,
+    )
+    await delete_checkpoints(conn, run_id)
@@ -0,0 +1,77 @@
+"""Adaptive per-host crawl delays."""
+
+from typing import Dict, Optional
+
+import structlog
+
+from . import metrics
+from .config import settings
+from .fetcher import FetchResult
+
+logger = structlog.get_logger()
+
+# Delay a host backs off from when it was being crawled without any
+MIN_BACKOFF_DELAY = 1.0
+
+
+def _backoff_reason(result: FetchResult) -> Optional[str]:
+    if result.throttled:
+        return "throttled"
+    if result.status_code == 0 or result.status_code >= 500:
+        return "error"
+    if result.seconds > settings.rate_slow_seconds:
+        return "slow"
+    return None
+
+
+class RateController:
+    """
+    Delay between fetches of each host, adapted to how the host responds.
+
+    Rates follow additive increase, multiplicative decrease: each fast,
+    healthy response adds ``rate_increase`` pages per second to a host's
+    rate, so its delay shrinks towards its floor, while a slow response,
+    a server error, a failed connection or a 429/503 multiplies the delay
+    by ``rate_backoff_factor``, up to ``rate_max_delay``. A Retry-After
+    holds the host for at least that long.
+
+    A host starts at its robots.txt Crawl-delay, which is also its floor,
+    or at ``default_crawl_delay`` with a floor of ``rate_min_delay``.
+    With ``rate_control`` off every host keeps its starting delay and only
+    Retry-After is honoured.
+    """
+
+    def __init__(self):
+        self._delays: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._delays)
+
+    def update(self, host: str, result: FetchResult, robots_delay: Optional[float]) -> float:
+        """Record a response from ``host`` and return the delay before its next fetch."""
+        if robots_delay is not None:
+            start = floor = robots_delay
+        else:
+            start = settings.default_crawl_delay
+            floor = min(start, settings.rate_min_delay)
+        retry_after = result.retry_after or 0.0
+        if not settings.rate_control:
+            return max(start, retry_after)
+
+        delay = max(self._delays.get(host, start), floor)
+        reason = _backoff_reason(result)
+        if reason is not None:
+            metrics.HOST_BACKOFFS.inc(reason)
+            delay = min(
+                max(delay, MIN_BACKOFF_DELAY) * settings.rate_backoff_factor,
+                max(settings.rate_max_delay, floor),
+            )
+            logger.info("host_backoff", host=host, reason=reason, delay=round(delay, 3))
+        elif delay > floor:
+            delay = max(1 / (1 / delay + settings.rate_increase), floor)
+        # Only hosts away from their starting delay take memory
+        if delay == start:
+            self._delays.pop(host, None)
+        else:
+            self._delays[host] = delay
+        return max(delay, retry_after)
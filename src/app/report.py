@@ -0,0 +1,189 @@
+"""Crawl run reports, streamed from the database to a file."""
+
+import gzip
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Any, AsyncIterator, Dict, Mapping, Optional
+
+import asyncpg
+
+# Rows fetched per round trip from the server-side cursors
+REPORT_PREFETCH = 5000
+
+PAGES_QUERY = """
+SELECT url, status, http_status, content_type, content_size, stored_object_key
+FROM urls
+WHERE crawl_run_id = $1
+ORDER BY id
+"""
+
+ERRORS_QUERY = """
+SELECT u.url, e.error_type, e.error_msg, e.occurred_at
+FROM fetch_errors e
+JOIN urls u ON u.id = e.url_id
+WHERE u.crawl_run_id = $1
+ORDER BY e.occurred_at
+"""
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, default=_default)
+
+
+class ReportWriter:
+    """
+    Writes a report incrementally, as one JSON document or as NDJSON.
+
+    JSON output has the run's fields and summary followed by ``pages``
+    and ``errors`` arrays. NDJSON output has one ``{"type": "run"}``
+    line, then one line per page and per error, tagged with their type.
+    Rows are written as they arrive, so memory use does not depend on
+    the size of the run.
+    """
+
+    def __init__(self, out: IO[str], format: str = "json"):
+        if format not in ("json", "ndjson"):
+            raise ValueError(f"unknown report format {format!r}")
+        self._out = out
+        self._format = format
+        self._sections = 0
+
+    def header(self, fields: Dict[str, Any]) -> None:
+        if self._format == "ndjson":
+            self._out.write(_dumps({"type": "run", **fields}) + "\n")
+        else:
+            self._out.write(_dumps(fields)[:-1])
+
+    async def section(self, name: str, kind: str, rows: AsyncIterator[Dict[str, Any]]) -> int:
+        """
+        Write rows as the ``name`` array (JSON) or as ``kind`` lines (NDJSON).
+
+        Returns the number of rows written.
+        """
+        count = 0
+        if self._format == "ndjson":
+            async for row in rows:
+                self._out.write(_dumps({"type": kind, **row}) + "\n")
+                count += 1
+            return count
+
+        self._out.write(f', "{name}": [')
+        async for row in rows:
+            self._out.write(("," if count else "") + "\n  " + _dumps(row))
+            count += 1
+        self._out.write("\n]" if count else "]")
+        return count
+
+    def close(self) -> None:
+        if self._format == "json":
+            self._out.write("}\n")
+
+
+def open_output(path: Path, compress: Optional[bool] = None) -> IO[str]:
+    """Open a report file for writing, gzip-compressed if asked or if it ends in .gz."""
+    if compress is None:
+        compress = path.suffix == ".gz"
+    if compress:
+        return gzip.open(path, "wt", encoding="utf-8", compresslevel=6)
+    return path.open("w", encoding="utf-8")
+
+
+def run_fields(run: Mapping[str, Any], summary: Dict[str, Any]) -> Dict[str, Any]:
+    """The report header: a run's row, its summary and its saved metrics."""
+    return {
+        "run_id": run["id"],
+        "seed_domain": run["seed_domain"],
+        "started_at": run["started_at"],
+        "finished_at": run["finished_at"],
+        "total_fetched": run["total_fetched"],
+        "total_discovered": run["total_discovered"],
+        "summary": summary,
+        "metrics": json.loads(run["metrics"]) if run["metrics"] else None,
+    }
+
+
+async def summarize(conn: asyncpg.Connection, run_id: str) -> Dict[str, Any]:
+    """Aggregate statistics of a run, computed in the database."""
+    totals = await conn.fetchrow(
+        """
+        SELECT count(*) AS urls,
+               count(DISTINCT domain) AS domains,
+               coalesce(sum(content_size), 0) AS content_bytes,
+               count(stored_object_key) AS stored
+        FROM urls
+        WHERE crawl_run_id = $1
+        """,
+        run_id,
+    )
+    by_status = await conn.fetch(
+        """
+        SELECT status, count(*) AS count
+        FROM urls
+        WHERE crawl_run_id = $1
+        GROUP BY status
+        ORDER BY status
+        """,
+        run_id,
+    )
+    by_http_status = await conn.fetch(
+        """
+        SELECT http_status, count(*) AS count
+        FROM urls
+        WHERE crawl_run_id = $1 AND http_status IS NOT NULL
+        GROUP BY http_status
+        ORDER BY http_status
+        """,
+        run_id,
+    )
+    by_error = await conn.fetch(
+        """
+        SELECT e.error_type, count(*) AS count
+        FROM fetch_errors e
+        JOIN urls u ON u.id = e.url_id
+        WHERE u.crawl_run_id = $1
+        GROUP BY e.error_type
+        ORDER BY e.error_type
+        """,
+        run_id,
+    )
+    return {
+        **dict(totals),
+        "by_status": {row["status"]: row["count"] for row in by_status},
+        "by_http_status": {str(row["http_status"]): row["count"] for row in by_http_status},
+        "errors_by_type": {row["error_type"]: row["count"] for row in by_error},
+    }
+
+
+async def _rows(conn: asyncpg.Connection, query: str, run_id: str) -> AsyncIterator[Dict[str, Any]]:
+    async for row in conn.cursor(query, run_id, prefetch=REPORT_PREFETCH):
+        yield dict(row)
+
+
+async def write_report(
+    conn: asyncpg.Connection, run_id: str, out: IO[str], format: str = "json"
+) -> bool:
+    """
+    Stream a run's report to ``out``. Returns False if the run does not exist.
+
+    Pages and errors are read through server-side cursors inside one
+    read-only transaction, so the report is a consistent snapshot even
+    while the run is still crawling.
+    """
+    async with conn.transaction(isolation="repeatable_read", readonly=True):
+        run = await conn.fetchrow("SELECT * FROM crawl_runs WHERE id = $1", run_id)
+        if not run:
+            return False
+
+        writer = ReportWriter(out, format)
+        writer.header(run_fields(run, await summarize(conn, run_id)))
+        await writer.section("pages", "page", _rows(conn, PAGES_QUERY, run_id))
+        await writer.section("errors", "error", _rows(conn, ERRORS_QUERY, run_id))
+        writer.close()
+    return True
@@ -0,0 +1,42 @@
+"""Which failed fetches are retried, and when."""
+
+import random
+
+from .config import settings
+from .fetcher import FetchResult
+
+# Failures that may well succeed on a later attempt
+TRANSIENT_ERRORS = frozenset(
+    {
+        "connect_timeout",
+        "read_timeout",
+        "timeout",
+        "dns",
+        "connection_refused",
+        "connect_error",
+        "connection_reset",
+        "protocol_error",
+        "proxy_error",
+    }
+)
+# Throttling, and gateways that could not reach the server
+TRANSIENT_STATUSES = frozenset({429, 502, 503, 504})
+
+
+def is_transient(result: FetchResult) -> bool:
+    """True if a fetch failed in a way worth retrying later."""
+    if result.status_code == 0:
+        return result.error in TRANSIENT_ERRORS
+    return result.status_code in TRANSIENT_STATUSES
+
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Seconds before retrying a URL whose ``attempt``-th fetch failed.
+
+    Exponential from ``retry_base_delay``, capped at ``retry_max_delay``,
+    with the upper half jittered so URLs that failed together, say when
+    a host went down, do not all come back at once.
+    """
+    ceiling = min(settings.retry_base_delay * 2 ** (attempt - 1), settings.retry_max_delay)
+    return ceiling / 2 + random.uniform(0, ceiling / 2)
@@ -1,197 +1,606 @@
 """Main crawler runner."""
 import asyncio
+import json
+import os
+import socket
+import time
+import uuid
 from datetime import datetime, timezone
-from urllib.parse import urlparse
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
 import structlog
 
+from . import metrics
 from .config import settings
-from .db import get_connection
-from .models import CrawlRun, Url, FetchError
-from .queue import enqueue_if_new, pop_next
+from .frontier import create_frontier
+from .models import CrawlRun, Url, FetchError, QueueItem
+from .persistence import LinkRow, Persistence
+from .processing import PagePool
+from .scheduler import HostScheduler
+from .seen import SeenFilter
+from .supervisor import ShardLink
 from .url_checker import RobotsCache
 from .fetcher import fetch_url
-from .parser import parse_and_extract_links, normalize_url
-from .storage import Storage
+from .dns_cache import DnsCache
+from .http_client import create_client
+from .parser import normalize_cache_stats
+from .rate_control import RateController
+from .retry import backoff_delay, is_transient
+from .storage import create_storage
 
 logger = structlog.get_logger()
 
 
 class Runner:
-    def __init__(self, run_id: str, seed_url: str):
-        """Initialize crawler run."""
+    def __init__(
+        self,
+        run_id: str,
+        seed_url: Optional[str],
+        shard: Optional[ShardLink] = None,
+        recrawl_of: Optional[str] = None,
+        resume: bool = False,
+        join: bool = False,
+    ):
+        """
+        Initialize crawler run.
+
+        With ``recrawl_of`` the run re-crawls an earlier run, refetching
+        its pages conditionally. With ``resume`` an existing run that
+        stopped is continued instead of a new one being created. With
+        ``join`` the runner crawls a run that other crawlers are still
+        working on, sharing its queue through leases; it neither loads
+        nor saves checkpoints, which belong to the run's first crawler.
+
+        With a ``shard`` the runner is one worker of a Supervisor: the run
+        already exists, only the shard's hosts are crawled, and links to
+        other hosts are sent to the shards that own them.
+        """
         self.run_id = run_id
         self.seed_url = seed_url
-        self.robots_cache = RobotsCache()
-        self.storage = Storage()
-        self.visited_urls = set()
-        
+        self.shard = shard
+        self.recrawl_of = recrawl_of
+        self.resume = resume
+        self.join = join
+        if join and settings.frontier != "postgres":
+            raise ValueError("Joining a run needs FRONTIER=postgres")
+        self.frontier = create_frontier()
+        self.dns_cache = DnsCache() if settings.dns_cache_size else None
+        self.http_client = create_client(self.dns_cache)
+        self.robots_cache = RobotsCache(self.http_client, self.frontier)
+        self.storage = create_storage()
+        # Identifies this process's queue leases
+        self.lease_owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.persistence = Persistence(run_id, self.frontier, self.lease_owner)
+        self.page_pool = PagePool()
+        self.seen_urls = SeenFilter(
+            settings.seen_filter_memory_mb * 1024 * 1024,
+            settings.seen_filter_fp_rate,
+            settings.seen_filter_recent_urls,
+        )
+        self.scheduler = HostScheduler()
+        self.rate_controller = RateController()
+        # URLs leased from the queue per host and not yet fetched
+        self._popped: Dict[str, Deque[QueueItem]] = {}
+        # URL ids leased and not yet acked, kept alive by the heartbeat
+        self._leased: Set[int] = set()
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._reporter: Optional[asyncio.Task] = None
+        self._checkpointer: Optional[asyncio.Task] = None
+        self._metrics_server = None
+        self._idle = False
+        self.stats = {"fetched": 0, "unchanged": 0, "errors": 0, "retried": 0, "links": 0}
+        self._concurrency = asyncio.Semaphore(settings.max_concurrency)
+
     async def start(self):
         """Start crawl run."""
-        async with get_connection() as conn:
-            # Initialize storage
-            await self.storage.ensure_bucket()
-            
-            # Create crawl run
-            seed_domain = urlparse(self.seed_url).netloc
-            await conn.execute(
-                """
-                INSERT INTO crawl_runs (id, seed_domain)
-                VALUES ($1, $2)
-                """,
-                self.run_id,
-                seed_domain,
+        try:
+            await self._run()
+        finally:
+            for task in (self._heartbeat, self._reporter, self._checkpointer):
+                if task is not None:
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+            if self.shard is not None:
+                await self.shard.close()
+            await self.page_pool.close()
+            await self.storage.close()
+            await self.persistence.close()
+            await self._release_leases()
+            await self.frontier.close()
+            await self.http_client.aclose()
+            if self._metrics_server is not None:
+                self._metrics_server.shutdown()
+                self._metrics_server.server_close()
+
+    async def _run(self):
+        """Create the run, crawl until the queue is drained and record stats."""
+        # Initialize storage
+        await self.storage.start(on_stored=self._on_stored)
+
+        metrics.QUEUE_DEPTH.set_function(lambda: self.scheduler.pending)
+        metrics.HOSTS_PENDING.set_function(lambda: len(self.scheduler))
+        # A supervisor serves the metrics of all its workers
+        if settings.metrics_port and self.shard is None:
+            self._metrics_server = metrics.start_server(
+                settings.metrics_host, settings.metrics_port, metrics.REGISTRY.render
             )
-            
-            # Add seed URL
-            url_id = await conn.fetchval(
-                """
-                INSERT INTO urls (url, normalized_url, domain, crawl_run_id)
-                VALUES ($1, $2, $3, $4)
-                RETURNING id
-                """,
-                self.seed_url,
-                normalize_url(self.seed_url),
-                seed_domain,
-                self.run_id,
+
+        if self.shard is None:
+            if self.resume:
+                await self.frontier.resume_run(self.run_id)
+            elif self.join:
+                await self.frontier.join_run(self.run_id)
+            else:
+                await self.frontier.create_run(self.run_id, self.seed_url, self.recrawl_of)
+
+        await self._restore()
+        hosts = []
+        for domain, queued in await self.frontier.queued_domains(self.run_id):
+            if self._owns(domain):
+                self.scheduler.add(domain, queued)
+                hosts.append(domain)
+        await self.robots_cache.warm(hosts)
+
+        # Main crawl loop
+        self.persistence.start(on_queued=self.scheduler.add_many)
+        self.page_pool.start()
+        self._heartbeat = asyncio.create_task(self._renew_leases())
+        if settings.checkpoint_interval > 0 and not self.join:
+            self._checkpointer = asyncio.create_task(self._checkpoint_periodically())
+        if self.shard is not None:
+            self.shard.start(
+                on_links=self._add_links,
+                on_hosts=self.scheduler.add_many,
+                on_message=self._set_busy,
             )
-            await enqueue_if_new(conn, url_id, self.run_id)
-            
-            # Main crawl loop
-            while True:
-                # Get next URL for each domain respecting robots
-                domains = await conn.fetch(
-                    "SELECT DISTINCT domain FROM urls WHERE crawl_run_id = $1",
-                    self.run_id,
-                )
-                
-                if not domains:
-                    break
-                    
-                for row in domains:
-                    domain = row["domain"]
-                    
-                    # Check robots.txt and crawl delay
-                    crawl_delay = await self.robots_cache.get_crawl_delay(domain, conn)
-                    
-                    # Get next URL for this domain
-                    queue_item = await pop_next(conn, domain)
-                    if not queue_item:
-                        continue
-                        
-                    # Get URL details
-                    url_row = await conn.fetchrow(
-                        "SELECT * FROM urls WHERE id = $1",
-                        queue_item.url_id,
-                    )
-                    url = url_row["url"]
-                    
-                    # Check if allowed by robots.txt
-                    if not await self.robots_cache.allowed_to_fetch(domain, url, conn):
-                        logger.info("skipping_robots_disallowed", url=url)
-                        continue
-                    
-                    # Fetch URL
-                    status_code, content, content_type = await fetch_url(url)
-                    
-                    # Record fetch attempt
-                    if status_code == 0:
-                        # Error
-                        await conn.execute(
-                            """
-                            UPDATE urls
-                            SET status = 'error',
-                                fetch_attempts = fetch_attempts + 1,
-                                last_seen = now()
-                            WHERE id = $1
-                            """,
-                            queue_item.url_id,
-                        )
-                        await conn.execute(
-                            """
-                            INSERT INTO fetch_errors (url_id, error_type, error_msg)
-                            VALUES ($1, $2, $3)
-                            """,
-                            queue_item.url_id,
-                            "connection_error",
-                            "Failed to connect",
-                        )
+            self._reporter = asyncio.create_task(self._report_progress())
+        await self._crawl()
+
+        # Let pending uploads finish, then write out buffered URL state
+        await self.page_pool.close()
+        await self.storage.close()
+        await self.persistence.close()
+        logger.info("seen_filter_stats", **self.seen_urls.stats())
+        logger.info("normalize_cache_stats", **normalize_cache_stats())
+        if self.dns_cache is not None:
+            logger.info("dns_cache_stats", hosts=len(self.dns_cache), **self.dns_cache.stats)
+
+        if self.shard is None:
+            await self.frontier.finish_run(self.run_id, metrics.REGISTRY.snapshot())
+
+    async def _restore(self) -> None:
+        """
+        Rebuild the seen filter, from the latest checkpoint if there is one.
+
+        Only URLs added after the checkpoint are read from the database,
+        which keeps resuming a large run fast.
+        """
+        since_id = 0
+        checkpoint = None
+        if not self.join:
+            checkpoint = await self.frontier.load_checkpoint(self.run_id, *self._shard_key())
+        if checkpoint is not None:
+            self.seen_urls = await asyncio.to_thread(
+                SeenFilter.from_bytes, checkpoint["seen_filter"], settings.seen_filter_recent_urls
+            )
+            self.stats.update(json.loads(checkpoint["stats"]))
+            since_id = checkpoint["max_url_id"]
+            logger.info(
+                "checkpoint_loaded",
+                run_id=self.run_id,
+                max_url_id=since_id,
+                taken_at=checkpoint["created_at"].isoformat(),
+            )
+        await self._warm_seen_urls(since_id)
+
+    async def _warm_seen_urls(self, since_id: int = 0) -> None:
+        """Load the run's known URLs on hosts this runner crawls into the seen filter."""
+        async for normalized_url, domain in self.frontier.iter_urls(self.run_id, since_id):
+            if self._owns(domain):
+                self.seen_urls.add(normalized_url)
+
+    def _owns(self, domain: str) -> bool:
+        """True if this runner crawls ``domain``."""
+        return self.shard is None or self.shard.owns(domain)
+
+    def _shard_key(self) -> Tuple[int, int]:
+        """(index, count) of this runner's shard; (0, 1) when running alone."""
+        if self.shard is None:
+            return 0, 1
+        return self.shard.index, self.shard.count
+
+    async def _checkpoint_periodically(self) -> None:
+        """Save a checkpoint every ``checkpoint_interval`` seconds."""
+        while True:
+            await asyncio.sleep(settings.checkpoint_interval)
+            try:
+                await self._checkpoint()
+            except Exception as e:
+                logger.error("checkpoint_failed", error=str(e))
+
+    async def _checkpoint(self) -> None:
+        """
+        Save the seen filter and stats so a resumed run can skip rebuilding them.
+
+        The highest URL id is read first: every URL row up to it was added
+        to the filter before being written. Buffered links are flushed
+        after the snapshot, so the checkpoint never claims a URL the
+        database does not have.
+        """
+        started = time.monotonic()
+        max_url_id = await self.frontier.max_url_id()
+        snapshot = self.seen_urls.copy()
+        stats = dict(self.stats)
+        await self.persistence.flush()
+        seen_filter = await asyncio.to_thread(snapshot.to_bytes)
+        await self.frontier.save_checkpoint(
+            self.run_id, *self._shard_key(), max_url_id, seen_filter, stats
+        )
+        logger.info(
+            "checkpoint_saved",
+            max_url_id=max_url_id,
+            size=len(seen_filter),
+            seconds=round(time.monotonic() - started, 3),
+        )
+
+    async def _report_progress(self) -> None:
+        """Send progress to the supervisor periodically."""
+        while True:
+            self._send_progress()
+            await asyncio.sleep(settings.progress_interval)
+
+    def _send_progress(self) -> None:
+        # Buffered links and queued URLs are work, even before the crawl loop sees them
+        idle = self._idle and not self.persistence.pending and not self.scheduler.pending
+        self.shard.report(
+            idle,
+            queued=self.scheduler.pending,
+            leased=len(self._leased),
+            metrics=metrics.REGISTRY.snapshot(),
+            **self.stats,
+        )
+
+    def _set_busy(self) -> None:
+        """Tell the supervisor at once that an idle shard has work again."""
+        if self._idle:
+            self._idle = False
+            self._send_progress()
+
+    async def _crawl(self) -> None:
+        """
+        Fetch from whichever host the scheduler says is ready next.
+
+        Each host has at most one fetch in flight and becomes ready again
+        once its crawl delay has passed, so a slow or delayed host only
+        holds back itself. The number of pages in flight across all hosts
+        is bounded by ``max_concurrency``. The crawl ends when the
+        scheduler has no queued URLs left, no buffered links remain and
+        the run's queue is empty, including URLs leased by other crawlers.
+        As a shard of a Supervisor run, an idle runner instead waits for
+        links from other shards until the supervisor stops it.
+        """
+        tasks: Set[asyncio.Task] = set()
+        errors: List[BaseException] = []
+
+        def reap(task: asyncio.Task) -> None:
+            tasks.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                errors.append(task.exception())
+
+        try:
+            while not errors:
+                if self.scheduler.finished:
+                    # Store the last pages so they are acked, then write out
+                    # buffered links, which may hold the only queued URLs left
+                    await self.storage.flush()
+                    await self.persistence.flush()
+                    if self.scheduler.finished and not await self._resync():
+                        if self.shard is None:
+                            break
+                        self._idle = True
+                        self._send_progress()
+                        if not await self.shard.wait_for_work(settings.queue_poll_interval):
+                            break
+                        self._set_busy()
                         continue
-                    
-                    # Store HTML content if available
-                    stored_key = None
-                    if content:
-                        stored_key = await self.storage.store_html(
-                            self.run_id,
-                            url,
-                            content,
-                        )
-                    
-                    # Update URL record
-                    await conn.execute(
-                        """
-                        UPDATE urls
-                        SET status = 'fetched',
-                            http_status = $1,
-                            fetch_attempts = fetch_attempts + 1,
-                            content_type = $2,
-                            content_size = $3,
-                            stored_object_key = $4,
-                            last_seen = now()
-                        WHERE id = $1
-                        """,
-                        queue_item.url_id,
-                        status_code,
-                        content_type,
-                        len(content) if content else None,
-                        stored_key,
+
+                await self._concurrency.acquire()
+                domain = await self.scheduler.next_host()
+                if domain is None:
+                    self._concurrency.release()
+                    continue
+                task = asyncio.create_task(self._crawl_host(domain))
+                tasks.add(task)
+                task.add_done_callback(reap)
+            if errors:
+                raise errors[0]
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _crawl_host(self, domain: str) -> None:
+        """Fetch one queued URL for a domain and hand the host back to the scheduler."""
+        delay = 0.0
+        popped = False
+        due_in = None
+        try:
+            # Check robots.txt and record its crawl delay
+            await self.robots_cache.get_crawl_delay(domain)
+
+            # Get next URL for this domain
+            queue_item = await self._next_item(domain)
+            if not queue_item:
+                # URLs put back for a retry keep the host scheduled until they are due
+                due_in = await self.frontier.next_due(self.run_id, domain)
+                return
+            popped = True
+
+            # Wait as long as this host's responses ask for before its next fetch
+            delay = await self._process(domain, queue_item) or 0.0
+        finally:
+            if due_in is not None:
+                # Not before the poll interval, in case the URL is leased again elsewhere
+                self.scheduler.postpone(domain, max(due_in, settings.queue_poll_interval))
+            else:
+                self.scheduler.release(domain, delay, fetched=popped)
+            self._concurrency.release()
+
+    async def _resync(self) -> bool:
+        """
+        Load URLs queued by other crawlers into the scheduler.
+
+        Returns False once the run's queue is empty. While other owners
+        (or uploads still in flight here) hold leases on the remaining
+        URLs, waits ``queue_poll_interval`` for them to be acked or expire.
+        """
+        # A shard only waits for its own leases; other shards' hosts are not its concern
+        owner = self.lease_owner if self.shard is not None else None
+        queued = [
+            (domain, count)
+            for domain, count in await self.frontier.queued_domains(self.run_id)
+            if self._owns(domain)
+        ]
+        leased = 0 if queued else await self.frontier.count_leased(self.run_id, owner)
+        for domain, count in queued:
+            self.scheduler.add(domain, count)
+        if leased:
+            await asyncio.sleep(settings.queue_poll_interval)
+        return bool(queued or leased)
+
+    async def _renew_leases(self) -> None:
+        """Extend this process's leases and take over URLs whose leases expired."""
+        while True:
+            await asyncio.sleep(settings.queue_heartbeat_interval)
+            try:
+                if self._leased:
+                    held = await self.frontier.heartbeat(
+                        self.lease_owner, list(self._leased), settings.queue_lease_seconds
                     )
-                    
-                    # Parse links if HTML content available
-                    if content and content_type and "text/html" in content_type.lower():
-                        links = parse_and_extract_links(content.decode(), url)
-                        for link in links:
-                            link_domain = urlparse(link).netloc
-                            # Add URL if new
-                            link_id = await conn.fetchval(
-                                """
-                                INSERT INTO urls (url, normalized_url, domain, crawl_run_id)
-                                VALUES ($1, $2, $3, $4)
-                                ON CONFLICT (normalized_url) DO UPDATE
-                                SET last_seen = now()
-                                RETURNING id
-                                """,
-                                link,
-                                normalize_url(link),
-                                link_domain,
-                                self.run_id,
-                            )
-                            # Add to queue if same domain
-                            if link_domain == domain:
-                                await enqueue_if_new(conn, link_id, self.run_id)
-                    
-                    # Respect crawl delay
-                    await asyncio.sleep(crawl_delay)
-            
-            # Update crawl run stats
-            stats = await conn.fetchrow(
-                """
-                SELECT
-                    count(*) FILTER (WHERE status = 'fetched') as total_fetched,
-                    count(*) as total_discovered
-                FROM urls
-                WHERE crawl_run_id = $1
-                """,
+                    if held < len(self._leased):
+                        logger.warning("leases_lost", count=len(self._leased) - held)
+                reclaimed = await self.frontier.reclaim_expired(self.run_id)
+                if reclaimed:
+                    logger.info("leases_reclaimed", count=len(reclaimed))
+                    if self.shard is not None:
+                        reclaimed = self.shard.route_hosts(reclaimed)
+                    self.scheduler.add_many(reclaimed)
+            except Exception as e:
+                logger.error("lease_heartbeat_failed", error=str(e))
+
+    async def _release_leases(self) -> None:
+        """Hand URLs this process leased but did not finish back to the queue."""
+        try:
+            released = await self.frontier.release_leases(self.lease_owner)
+            if released:
+                logger.info("leases_released", count=released)
+        except Exception as e:
+            logger.error("lease_release_failed", error=str(e))
+        self._leased.clear()
+        self._popped.clear()
+
+    async def _ack(self, url_id: int) -> None:
+        """Remove a fully processed URL from the queue."""
+        self._leased.discard(url_id)
+        await self.persistence.ack(url_id)
+
+    async def _on_stored(self, url_id: int, key: Optional[str]) -> None:
+        """Record an uploaded page's object key; the page is then fully processed."""
+        try:
+            if key:
+                await self.persistence.record_stored_key(url_id, key)
+        finally:
+            await self._ack(url_id)
+
+    async def _next_item(self, domain: str) -> Optional[QueueItem]:
+        """Next URL for a domain, leasing a batch from the queue when none are left."""
+        items = self._popped.get(domain)
+        if not items:
+            batch = await self.frontier.lease_batch(
                 self.run_id,
+                domain,
+                self.lease_owner,
+                settings.queue_pop_batch_size,
+                settings.queue_lease_seconds,
             )
-            await conn.execute(
-                """
-                UPDATE crawl_runs
-                SET finished_at = now(),
-                    total_fetched = $1,
-                    total_discovered = $2
-                WHERE id = $3
-                """,
-                stats["total_fetched"],
-                stats["total_discovered"],
-                self.run_id,
-            )
\ No newline at end of file
+            if not batch:
+                self._popped.pop(domain, None)
+                return None
+            self._leased.update(item.url_id for item in batch)
+            items = self._popped[domain] = deque(batch)
+        item = items.popleft()
+        if not items:
+            del self._popped[domain]
+        return item
+
+    async def _add_links(self, links: List[LinkRow]) -> None:
+        """Buffer discovered links on hosts this runner crawls, dropping known ones."""
+        new_links = []
+        probably_seen = []
+        for link in links:
+            added = self.seen_urls.add(link[1])
+            if added:
+                new_links.append(link)
+            elif added is None:
+                probably_seen.append(link)
+        if probably_seen:
+            # Bloom hits are confirmed in one query; a link still buffered
+            # here is not found, and the urls table's unique key drops it
+            known = await self.frontier.known_urls(
+                self.run_id, [normalized for _, normalized, _, _ in probably_seen]
+            )
+            new_links.extend(link for link in probably_seen if link[1] not in known)
+
+        for _, _, link_domain, enqueue in new_links:
+            if enqueue:
+                # Have the address and robots.txt ready by the time the host is crawled
+                if self.dns_cache is not None:
+                    self.dns_cache.prefetch(link_domain)
+                self.robots_cache.prefetch(link_domain)
+        self.stats["links"] += len(new_links)
+        await self.persistence.add_links(new_links)
+
+    async def _retry(
+        self,
+        url_id: int,
+        http_status: Optional[int],
+        delay: float,
+        error_type: Optional[str],
+        error_msg: Optional[str],
+    ) -> None:
+        """Put a leased URL back in the queue, due again after ``delay`` seconds."""
+        self._leased.discard(url_id)
+        await self.persistence.record_retry(url_id, http_status, delay, error_type, error_msg)
+        self.stats["retried"] += 1
+        metrics.PAGES.inc("retried")
+
+    async def _process(self, domain: str, queue_item: QueueItem) -> Optional[float]:
+        """
+        Fetch, store and parse one URL.
+
+        Returns the delay before the host's next fetch, or None if no
+        request was made. The URL is acked once its results are recorded;
+        for HTML pages, only after the body has been uploaded. After a
+        transient failure the URL is put back in the queue instead, due
+        after an exponential backoff and at least the host's delay, until
+        it has been tried ``max_fetch_attempts`` times; nothing waits for
+        it meanwhile. So is a URL whose host's robots.txt could not be
+        fetched, due when the host's robots.txt is tried again.
+        """
+        # Get URL details
+        url_row = await self.frontier.get_url(queue_item.url_id)
+        url = url_row["url"]
+        attempt = url_row["fetch_attempts"] + 1
+
+        # Check if allowed by robots.txt
+        rules = await self.robots_cache.get_rules(domain)
+        if rules.unavailable:
+            error_msg = "robots.txt could not be fetched"
+            if attempt < settings.max_fetch_attempts:
+                retry_in = max(self.robots_cache.expires_in(domain), settings.queue_poll_interval)
+                logger.info(
+                    "robots_unavailable_retry",
+                    url=url,
+                    attempt=attempt,
+                    retry_in=round(retry_in, 3),
+                )
+                await self._retry(
+                    queue_item.url_id, None, retry_in, "robots_unavailable", error_msg
+                )
+                return retry_in
+            await self.persistence.record_error(queue_item.url_id, "robots_unavailable", error_msg)
+            self.stats["errors"] += 1
+            metrics.PAGES.inc("error")
+            await self._ack(queue_item.url_id)
+            return None
+        if not rules.can_fetch(url):
+            logger.info("skipping_robots_disallowed", url=url)
+            metrics.PAGES.inc("disallowed")
+            await self._ack(queue_item.url_id)
+            return None
+
+        # Fetch URL, conditionally if an earlier run left validators
+        result = await fetch_url(
+            url, self.http_client, etag=url_row["etag"], last_modified=url_row["last_modified"]
+        )
+        content, content_type = result.content, result.content_type
+        delay = self.rate_controller.update(domain, result, rules.crawl_delay)
+
+        if is_transient(result) and attempt < settings.max_fetch_attempts:
+            retry_in = max(delay, backoff_delay(attempt))
+            logger.info(
+                "fetch_retry_scheduled",
+                url=url,
+                status=result.status_code,
+                error_type=result.error,
+                attempt=attempt,
+                retry_in=round(retry_in, 3),
+            )
+            await self._retry(
+                queue_item.url_id,
+                result.status_code or None,
+                retry_in,
+                result.error,
+                result.error_msg,
+            )
+            return delay
+
+        # Record fetch attempt
+        if result.status_code == 0:
+            await self.persistence.record_error(queue_item.url_id, result.error, result.error_msg)
+            self.stats["errors"] += 1
+            metrics.PAGES.inc("error")
+            await self._ack(queue_item.url_id)
+            return delay
+
+        is_html = bool(content and content_type and "text/html" in content_type.lower())
+        # Parsed, and hashed, in the process pool rather than on the event loop
+        page = None
+        if is_html and not result.not_modified:
+            page = await self.page_pool.process(content, url)
+        # A 304, or the same body as last time from a server without validators
+        if result.not_modified or (
+            page is not None and page.content_hash == url_row["content_hash"]
+        ):
+            await self.persistence.record_unchanged(
+                queue_item.url_id, result.status_code, result.etag, result.last_modified
+            )
+            self.stats["unchanged"] += 1
+            metrics.PAGES.inc("unchanged")
+            await self._ack(queue_item.url_id)
+            return delay
+
+        await self.persistence.record_fetched(
+            queue_item.url_id,
+            result.status_code,
+            content_type,
+            len(content) if content else None,
+            result.etag,
+            result.last_modified,
+            page.content_hash if page else None,
+        )
+        self.stats["fetched"] += 1
+        metrics.PAGES.inc("fetched")
+
+        # Links were parsed in the process pool if HTML content available
+        if page is not None:
+            # Queue new links if same domain
+            links = [
+                (
+                    link,
+                    normalized,
+                    link_domain,
+                    link_domain == domain or settings.follow_external_links,
+                )
+                for link, normalized, link_domain in page.links
+            ]
+            if self.shard is not None:
+                links = self.shard.route_links(links)
+            await self._add_links(links)
+
+            # Hand HTML content to the upload stage, which acks the URL when done
+            await self.storage.submit(queue_item.url_id, url, content, page.content_hash)
+        else:
+            await self._ack(queue_item.url_id)
+
+        return delay
@@ -0,0 +1,115 @@
+"""In-memory scheduling of hosts with queued URLs."""
+
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from . import metrics
+
+
+class HostScheduler:
+    """
+    Min-heap of hosts with pending work, keyed on when each may be fetched next.
+
+    A host is in the heap only while it has queued URLs and no fetch in
+    flight, so ``next_host()`` hands out each host to one fetch at a time
+    and never returns a host with nothing to do. Pending counts are kept
+    per host and in total, which makes ``finished`` O(1); heap operations
+    are O(log hosts) and nothing scans the full set of hosts.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, str]] = []  # (ready_at, seq, host)
+        self._pending: Dict[str, int] = {}
+        self._in_flight: Set[str] = set()
+        self._total = 0
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+
+    def __len__(self) -> int:
+        """Number of hosts with pending work."""
+        return len(self._pending)
+
+    @property
+    def pending(self) -> int:
+        """Number of queued URLs across all hosts."""
+        return self._total
+
+    @property
+    def finished(self) -> bool:
+        """True when no host has queued URLs and no fetch is in flight."""
+        return self._total == 0 and not self._in_flight
+
+    def add(self, host: str, count: int = 1) -> None:
+        """Record ``count`` newly queued URLs for a host."""
+        if count <= 0:
+            return
+        known = host in self._pending
+        self._pending[host] = self._pending.get(host, 0) + count
+        self._total += count
+        if not known and host not in self._in_flight:
+            self._push(host, time.monotonic())
+
+    def add_many(self, hosts: Iterable[str]) -> None:
+        """Record one newly queued URL per entry in ``hosts``."""
+        for host in hosts:
+            self.add(host)
+
+    async def next_host(self) -> Optional[str]:
+        """
+        Wait for the next host whose delay has passed and mark it in flight.
+
+        Returns None once the scheduler is finished.
+        """
+        while True:
+            if self.finished:
+                return None
+            timeout = None
+            if self._heap:
+                ready_at, _, host = self._heap[0]
+                timeout = ready_at - time.monotonic()
+                if timeout <= 0:
+                    metrics.HOST_WAIT_SECONDS.observe(-timeout)
+                    heapq.heappop(self._heap)
+                    self._in_flight.add(host)
+                    return host
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self, host: str, delay: float = 0.0, fetched: bool = True) -> None:
+        """
+        Finish a fetch handed out by ``next_host()``.
+
+        ``fetched`` consumes one of the host's queued URLs; pass False
+        when the host turned out to have nothing to fetch, which drops
+        it. A host with URLs left becomes ready again after ``delay``.
+        """
+        self._in_flight.discard(host)
+        remaining = self._pending.get(host, 0) - 1 if fetched else 0
+        if remaining > 0:
+            self._total -= 1
+            self._pending[host] = remaining
+            self._push(host, time.monotonic() + delay)
+        else:
+            self._total -= self._pending.pop(host, 0)
+        self._wakeup.set()
+
+    def postpone(self, host: str, delay: float) -> None:
+        """
+        Finish a fetch handed out by ``next_host()`` that found no URL due yet.
+
+        The host keeps its queued URLs and becomes ready again after ``delay``.
+        """
+        self._in_flight.discard(host)
+        if self._pending.get(host):
+            self._push(host, time.monotonic() + delay)
+        self._wakeup.set()
+
+    def _push(self, host: str, ready_at: float) -> None:
+        heapq.heappush(self._heap, (ready_at, next(self._seq), host))
+        self._wakeup.set()
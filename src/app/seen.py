@@ -0,0 +1,220 @@
+"""Memory-bounded filter of URLs already known to a crawl run."""
+
+import hashlib
+import math
+import struct
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+
+# Approximate cost of one fingerprint in a Python set (int object plus slot)
+_EXACT_ENTRY_BYTES = 72
+# ... and in an OrderedDict, which also links its entries
+_RECENT_ENTRY_BYTES = 150
+
+# Serialized header: version, mode, memory budget, fp rate, num_bits, num_hashes, count
+_HEADER = struct.Struct("<BBQdQII")
+_VERSION = 1
+
+
+def _fingerprint(url: str) -> int:
+    """128-bit hash of a normalized URL."""
+    return int.from_bytes(hashlib.blake2b(url.encode(), digest_size=16).digest(), "little")
+
+
+class BloomFilter:
+    """Bloom filter over 128-bit fingerprints using double hashing."""
+
+    def __init__(self, num_bits: int, num_hashes: int):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.count = 0
+        self._bits = bytearray((num_bits + 7) // 8)
+
+    def _positions(self, fingerprint: int):
+        h1 = fingerprint & 0xFFFFFFFFFFFFFFFF
+        h2 = (fingerprint >> 64) | 1
+        m = self.num_bits
+        return [(h1 + i * h2) % m for i in range(self.num_hashes)]
+
+    def __contains__(self, fingerprint: int) -> bool:
+        bits = self._bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(fingerprint))
+
+    def add(self, fingerprint: int) -> bool:
+        """Add a fingerprint. Returns True if it was not (probably) present."""
+        bits = self._bits
+        added = False
+        for p in self._positions(fingerprint):
+            mask = 1 << (p & 7)
+            if not bits[p >> 3] & mask:
+                bits[p >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self._bits)
+
+    def false_positive_rate(self) -> float:
+        """Estimated probability that an unseen URL is reported as seen."""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+
+class SeenFilter:
+    """
+    Set of normalized URLs already known to a run, within a memory budget.
+
+    URLs are tracked exactly, as 128-bit fingerprints in a set, until that
+    set would outgrow ``memory_bytes``. The fingerprints are then moved
+    into a Bloom filter of the same size whose number of hash functions
+    is chosen for ``fp_rate``, and the ``recent_size`` most recently seen
+    fingerprints are also kept exactly, in at most a quarter of the
+    budget, which the Bloom filter shrinks to make room for. A Bloom hit
+    on a URL that is not among the recent ones may be a false positive,
+    so add() leaves it to the caller to confirm against the urls table.
+    """
+
+    def __init__(self, memory_bytes: int, fp_rate: float, recent_size: int = 50_000):
+        self.memory_budget = memory_bytes
+        self.fp_rate = fp_rate
+        self.recent_size = min(recent_size, memory_bytes // 4 // _RECENT_ENTRY_BYTES)
+        self._exact: Optional[Set[int]] = set()
+        self._bloom: Optional[BloomFilter] = None
+        self._recent: "OrderedDict[int, None]" = OrderedDict()
+        self.unconfirmed = 0  # Bloom hits left to the caller to confirm
+
+    def __contains__(self, url: str) -> bool:
+        fingerprint = _fingerprint(url)
+        if self._exact is not None:
+            return fingerprint in self._exact
+        return fingerprint in self._bloom
+
+    def __len__(self) -> int:
+        if self._exact is not None:
+            return len(self._exact)
+        return self._bloom.count
+
+    def add(self, url: str) -> Optional[bool]:
+        """
+        Mark a URL as seen.
+
+        Returns True if the URL is new and False if it was certainly seen
+        before. In Bloom mode a URL the filter reports as seen but that is
+        not among the recently seen ones returns None: it was probably
+        seen, and is treated as new unless an exact source confirms it.
+        """
+        fingerprint = _fingerprint(url)
+        if self._exact is None:
+            recent = self._recent
+            if fingerprint in recent:
+                recent.move_to_end(fingerprint)
+                return False
+            recent[fingerprint] = None
+            if len(recent) > self.recent_size:
+                recent.popitem(last=False)
+            if not self._bloom.add(fingerprint):
+                self.unconfirmed += 1
+                return None
+            return True
+
+        if fingerprint in self._exact:
+            return False
+        self._exact.add(fingerprint)
+        if len(self._exact) * _EXACT_ENTRY_BYTES > self.memory_budget:
+            self._switch_to_bloom()
+        return True
+
+    def _switch_to_bloom(self) -> None:
+        recent_bytes = self.recent_size * _RECENT_ENTRY_BYTES
+        num_bits = max((self.memory_budget - recent_bytes) * 8, 64)
+        num_hashes = max(1, round(-math.log2(self.fp_rate)))
+        self._bloom = BloomFilter(num_bits, num_hashes)
+        for fingerprint in self._exact:
+            self._bloom.add(fingerprint)
+            if len(self._recent) < self.recent_size:
+                self._recent[fingerprint] = None
+        self._exact = None
+
+    def copy(self) -> "SeenFilter":
+        """Independent copy, cheap enough to take on the event loop."""
+        clone = SeenFilter(self.memory_budget, self.fp_rate, self.recent_size)
+        if self._exact is not None:
+            clone._exact = set(self._exact)
+        else:
+            clone._exact = None
+            clone._recent = OrderedDict(self._recent)
+            clone._bloom = BloomFilter(self._bloom.num_bits, self._bloom.num_hashes)
+            clone._bloom.count = self._bloom.count
+            clone._bloom._bits = bytearray(self._bloom._bits)
+        return clone
+
+    def to_bytes(self) -> bytes:
+        """Serialize the filter, compressed, for a checkpoint."""
+        if self._exact is not None:
+            header = _HEADER.pack(
+                _VERSION, 0, self.memory_budget, self.fp_rate, 0, 0, len(self._exact)
+            )
+            payload = b"".join(fp.to_bytes(16, "little") for fp in self._exact)
+        else:
+            bloom = self._bloom
+            header = _HEADER.pack(
+                _VERSION,
+                1,
+                self.memory_budget,
+                self.fp_rate,
+                bloom.num_bits,
+                bloom.num_hashes,
+                bloom.count,
+            )
+            payload = bytes(bloom._bits)
+        return zlib.compress(header + payload, 1)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, recent_size: int = 50_000) -> "SeenFilter":
+        """
+        Restore a filter serialized by to_bytes().
+
+        The recent set is not serialized; it refills as URLs are seen.
+        """
+        data = zlib.decompress(data)
+        version, mode, memory_budget, fp_rate, num_bits, num_hashes, count = _HEADER.unpack_from(
+            data
+        )
+        if version != _VERSION:
+            raise ValueError(f"unsupported seen filter version {version}")
+        payload = memoryview(data)[_HEADER.size :]
+        seen = cls(memory_budget, fp_rate, recent_size)
+        if mode == 0:
+            seen._exact = {
+                int.from_bytes(payload[i : i + 16], "little") for i in range(0, count * 16, 16)
+            }
+        else:
+            seen._exact = None
+            seen._bloom = BloomFilter(num_bits, num_hashes)
+            seen._bloom.count = count
+            seen._bloom._bits = bytearray(payload)
+        return seen
+
+    def stats(self) -> Dict[str, object]:
+        """Size, mode, memory use and estimated false-positive rate."""
+        if self._exact is not None:
+            return {
+                "mode": "exact",
+                "urls": len(self._exact),
+                "memory_bytes": len(self._exact) * _EXACT_ENTRY_BYTES,
+                "false_positive_rate": 0.0,
+            }
+        return {
+            "mode": "bloom",
+            "urls": self._bloom.count,
+            "memory_bytes": self._bloom.memory_bytes + len(self._recent) * _RECENT_ENTRY_BYTES,
+            "false_positive_rate": self._bloom.false_positive_rate(),
+            "recent_urls": len(self._recent),
+            "unconfirmed_hits": self.unconfirmed,
+            "capacity_at_target_rate": int(
+                self._bloom.num_bits * math.log(2) ** 2 / -math.log(self.fp_rate)
+            ),
+        }
@@ -0,0 +1,760 @@
+"""Frontier in a local SQLite file, for single-process crawls without Postgres."""
+
+import asyncio
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Mapping, Optional, TypeVar
+from urllib.parse import urlparse
+
+import structlog
+
+from .frontier import Frontier
+from .models import QueueItem
+from .parser import normalize_url
+from .report import REPORT_PREFETCH, ReportWriter, run_fields
+
+logger = structlog.get_logger()
+
+T = TypeVar("T")
+
+# URLs read per statement when warming the seen filter
+ITER_BATCH_SIZE = 10000
+
+# Same tables as the Postgres migrations, with times as Unix seconds
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS crawl_runs (
+    id TEXT PRIMARY KEY,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    seed_domain TEXT NOT NULL,
+    total_fetched INTEGER NOT NULL DEFAULT 0,
+    total_discovered INTEGER NOT NULL DEFAULT 0,
+    recrawl_of TEXT,
+    metrics TEXT
+);
+
+CREATE TABLE IF NOT EXISTS urls (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL,
+    normalized_url TEXT NOT NULL,
+    domain TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'new',
+    http_status INTEGER,
+    fetch_attempts INTEGER NOT NULL DEFAULT 0,
+    content_type TEXT,
+    content_size INTEGER,
+    stored_object_key TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT,
+    crawl_run_id TEXT NOT NULL REFERENCES crawl_runs(id) ON DELETE CASCADE,
+    UNIQUE (crawl_run_id, normalized_url)
+);
+
+CREATE TABLE IF NOT EXISTS queue (
+    id INTEGER PRIMARY KEY,
+    url_id INTEGER NOT NULL UNIQUE REFERENCES urls(id) ON DELETE CASCADE,
+    crawl_run_id TEXT NOT NULL,
+    domain TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    enqueued_at REAL NOT NULL,
+    next_fetch_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_expires_at REAL
+);
+
+CREATE INDEX IF NOT EXISTS idx_queue_run_domain_order
+    ON queue (crawl_run_id, domain, priority DESC, enqueued_at);
+CREATE INDEX IF NOT EXISTS idx_queue_lease_owner ON queue (lease_owner);
+
+CREATE TABLE IF NOT EXISTS fetch_errors (
+    id INTEGER PRIMARY KEY,
+    url_id INTEGER NOT NULL REFERENCES urls(id) ON DELETE CASCADE,
+    occurred_at REAL NOT NULL,
+    error_type TEXT NOT NULL,
+    error_msg TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS domains (
+    domain TEXT PRIMARY KEY,
+    robots_txt TEXT,
+    robots_fetched_at REAL,
+    crawl_delay_seconds REAL NOT NULL DEFAULT 1.0
+);
+
+CREATE TABLE IF NOT EXISTS crawl_checkpoints (
+    crawl_run_id TEXT NOT NULL REFERENCES crawl_runs(id) ON DELETE CASCADE,
+    shard INTEGER NOT NULL,
+    shard_count INTEGER NOT NULL,
+    max_url_id INTEGER NOT NULL,
+    seen_filter BLOB NOT NULL,
+    stats TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (crawl_run_id, shard)
+);
+"""
+
+# Report rows, in the order and with the columns of the Postgres report
+REPORT_PAGES = """
+SELECT url, status, http_status, content_type, content_size, stored_object_key
+FROM urls
+WHERE crawl_run_id = ?
+ORDER BY id
+"""
+
+REPORT_ERRORS = """
+SELECT u.url, e.error_type, e.error_msg, e.occurred_at
+FROM fetch_errors e
+JOIN urls u ON u.id = e.url_id
+WHERE u.crawl_run_id = ?
+ORDER BY e.occurred_at
+"""
+
+# Rows that say a queued URL was finished before its ack was written
+FINISHED = """
+status IN ('unchanged', 'error')
+OR (status = 'fetched' AND (content_hash IS NULL OR stored_object_key IS NOT NULL))
+"""
+
+
+def _datetime(seconds: Optional[float]) -> Optional[datetime]:
+    return None if seconds is None else datetime.fromtimestamp(seconds, timezone.utc)
+
+
+def _queue_item(row: Mapping[str, Any]) -> QueueItem:
+    return QueueItem(
+        id=row["id"],
+        url_id=row["url_id"],
+        crawl_run_id=row["crawl_run_id"],
+        domain=row["domain"],
+        priority=row["priority"],
+        enqueued_at=_datetime(row["enqueued_at"]),
+        next_fetch_at=_datetime(row["next_fetch_at"]),
+        lease_owner=row["lease_owner"],
+        lease_expires_at=_datetime(row["lease_expires_at"]),
+    )
+
+
+class SqliteFrontier(Frontier):
+    """
+    Frontier kept in one SQLite database file.
+
+    There is no server and no network round trip: statements run
+    in-process on a single connection, in WAL mode, from one worker
+    thread so the event loop never blocks on disk. A Persistence flush is
+    one transaction of ``executemany`` statements. Only one crawler
+    process may use a file at a time, so runs with several workers need
+    Postgres. Leases work as they do in Postgres, so resuming a run that
+    stopped hands its leased URLs back the same way.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-frontier")
+        self._db: Optional[sqlite3.Connection] = None
+
+    async def _call(self, fn: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: fn(self._connect(), *args))
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode = WAL")
+            # Durable at checkpoints of the WAL; a crash loses at most the last flushes
+            db.execute("PRAGMA synchronous = NORMAL")
+            db.execute("PRAGMA foreign_keys = ON")
+            db.executescript(SCHEMA)
+            self._db = db
+        return self._db
+
+    async def close(self):
+        if self._db is not None:
+            db, self._db = self._db, None
+            await asyncio.get_running_loop().run_in_executor(self._executor, db.close)
+        self._executor.shutdown(wait=True)
+
+    async def create_run(self, run_id, seed_url, recrawl_of=None):
+        copied = await self._call(self._create_run, run_id, seed_url, recrawl_of)
+        if recrawl_of is not None:
+            logger.info("recrawl_seeded", run_id=run_id, recrawl_of=recrawl_of, queued=copied)
+
+    @staticmethod
+    def _create_run(db, run_id, seed_url, recrawl_of):
+        now = time.time()
+        seed_domain = urlparse(seed_url).netloc
+        copied = 0
+        with db:
+            db.execute(
+                """
+                INSERT INTO crawl_runs (id, started_at, seed_domain, recrawl_of)
+                VALUES (?, ?, ?, ?)
+                """,
+                (run_id, now, seed_domain, recrawl_of),
+            )
+            if recrawl_of is not None:
+                db.execute(
+                    """
+                    INSERT INTO urls (
+                        url, normalized_url, domain, crawl_run_id, first_seen, last_seen,
+                        content_type, content_size, stored_object_key,
+                        etag, last_modified, content_hash
+                    )
+                    SELECT url, normalized_url, domain, ?2, ?3, ?3,
+                           content_type, content_size, stored_object_key,
+                           etag, last_modified, content_hash
+                    FROM urls
+                    WHERE crawl_run_id = ?1
+                    """,
+                    (recrawl_of, run_id, now),
+                )
+                copied = db.execute(
+                    """
+                    INSERT INTO queue
+                        (url_id, crawl_run_id, domain, priority, enqueued_at, next_fetch_at)
+                    SELECT n.id, ?2, n.domain, 0, ?3, ?3
+                    FROM urls n
+                    JOIN urls p ON p.crawl_run_id = ?1 AND p.normalized_url = n.normalized_url
+                    WHERE n.crawl_run_id = ?2
+                      AND p.status IN ('fetched', 'unchanged', 'error')
+                    """,
+                    (recrawl_of, run_id, now),
+                ).rowcount
+
+            # Add seed URL, which a re-crawl may already have copied
+            url_id = db.execute(
+                """
+                INSERT INTO urls (url, normalized_url, domain, crawl_run_id, first_seen, last_seen)
+                VALUES (?1, ?2, ?3, ?4, ?5, ?5)
+                ON CONFLICT (crawl_run_id, normalized_url) DO UPDATE
+                SET last_seen = excluded.last_seen
+                RETURNING id
+                """,
+                (seed_url, normalize_url(seed_url), seed_domain, run_id, now),
+            ).fetchone()[0]
+            db.execute(
+                """
+                INSERT INTO queue
+                    (url_id, crawl_run_id, domain, priority, enqueued_at, next_fetch_at)
+                SELECT id, ?2, domain, 0, ?3, ?3 FROM urls WHERE id = ?1
+                ON CONFLICT (url_id) DO NOTHING
+                """,
+                (url_id, run_id, now),
+            )
+        return copied
+
+    async def resume_run(self, run_id):
+        released, dropped = await self._call(self._resume_run, run_id)
+        logger.info(
+            "run_resumed", run_id=run_id, leases_released=released, finished_dropped=dropped
+        )
+
+    @staticmethod
+    def _resume_run(db, run_id):
+        with db:
+            exists = db.execute("SELECT 1 FROM crawl_runs WHERE id = ?", (run_id,)).fetchone()
+            if not exists:
+                raise ValueError(f"Run {run_id} not found")
+            dropped = db.execute(
+                f"""
+                DELETE FROM queue
+                WHERE crawl_run_id = ?
+                  AND url_id IN (SELECT id FROM urls WHERE crawl_run_id = ? AND ({FINISHED}))
+                """,
+                (run_id, run_id),
+            ).rowcount
+            released = db.execute(
+                """
+                UPDATE queue
+                SET lease_owner = NULL, lease_expires_at = NULL
+                WHERE crawl_run_id = ? AND lease_owner IS NOT NULL
+                """,
+                (run_id,),
+            ).rowcount
+            db.execute("UPDATE crawl_runs SET finished_at = NULL WHERE id = ?", (run_id,))
+        return released, dropped
+
+    async def join_run(self, run_id):
+        row = await self._call(
+            lambda db: db.execute(
+                "SELECT finished_at FROM crawl_runs WHERE id = ?", (run_id,)
+            ).fetchone()
+        )
+        if row is None:
+            raise ValueError(f"Run {run_id} not found")
+        if row["finished_at"] is not None:
+            raise ValueError(f"Run {run_id} has finished; resume it to crawl it again")
+        reclaimed = await self.reclaim_expired(run_id)
+        logger.info("run_joined", run_id=run_id, leases_reclaimed=len(reclaimed))
+
+    async def finish_run(self, run_id, run_metrics=None):
+        encoded = json.dumps(run_metrics) if run_metrics is not None else None
+        await self._call(self._finish_run, run_id, encoded)
+
+    @staticmethod
+    def _finish_run(db, run_id, encoded_metrics):
+        with db:
+            db.execute(
+                """
+                UPDATE crawl_runs
+                SET finished_at = ?2,
+                    total_fetched = (
+                        SELECT count(*) FROM urls
+                        WHERE crawl_run_id = ?1 AND status IN ('fetched', 'unchanged')
+                    ),
+                    total_discovered = (SELECT count(*) FROM urls WHERE crawl_run_id = ?1),
+                    metrics = coalesce(?3, metrics)
+                WHERE id = ?1
+                """,
+                (run_id, time.time(), encoded_metrics),
+            )
+            db.execute("DELETE FROM crawl_checkpoints WHERE crawl_run_id = ?", (run_id,))
+
+    async def iter_urls(self, run_id, since_id=0):
+        while True:
+            rows = await self._call(self._url_batch, run_id, since_id)
+            for _, normalized_url, domain in rows:
+                yield normalized_url, domain
+            if len(rows) < ITER_BATCH_SIZE:
+                return
+            since_id = rows[-1][0]
+
+    @staticmethod
+    def _url_batch(db, run_id, since_id):
+        return db.execute(
+            """
+            SELECT id, normalized_url, domain FROM urls
+            WHERE crawl_run_id = ? AND id > ?
+            ORDER BY id
+            LIMIT ?
+            """,
+            (run_id, since_id, ITER_BATCH_SIZE),
+        ).fetchall()
+
+    async def known_urls(self, run_id, normalized_urls):
+        rows = await self._call(
+            lambda db: db.execute(
+                """
+                SELECT normalized_url FROM urls
+                WHERE crawl_run_id = ? AND normalized_url IN (SELECT value FROM json_each(?))
+                """,
+                (run_id, json.dumps(normalized_urls)),
+            ).fetchall()
+        )
+        return {row[0] for row in rows}
+
+    async def max_url_id(self):
+        return await self._call(
+            lambda db: db.execute("SELECT coalesce(max(id), 0) FROM urls").fetchone()[0]
+        )
+
+    async def load_checkpoint(self, run_id, shard, shard_count):
+        row = await self._call(
+            lambda db: db.execute(
+                """
+                SELECT max_url_id, seen_filter, stats, created_at
+                FROM crawl_checkpoints
+                WHERE crawl_run_id = ? AND shard = ? AND shard_count = ?
+                """,
+                (run_id, shard, shard_count),
+            ).fetchone()
+        )
+        if row is None:
+            return None
+        return {**dict(row), "created_at": _datetime(row["created_at"])}
+
+    async def save_checkpoint(self, run_id, shard, shard_count, max_url_id, seen_filter, stats):
+        await self._call(
+            self._save_checkpoint,
+            (run_id, shard, shard_count, max_url_id, seen_filter, json.dumps(stats), time.time()),
+        )
+
+    @staticmethod
+    def _save_checkpoint(db, values):
+        with db:
+            db.execute(
+                """
+                INSERT INTO crawl_checkpoints
+                    (crawl_run_id, shard, shard_count, max_url_id, seen_filter, stats, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (crawl_run_id, shard) DO UPDATE SET
+                    shard_count = excluded.shard_count,
+                    max_url_id = excluded.max_url_id,
+                    seen_filter = excluded.seen_filter,
+                    stats = excluded.stats,
+                    created_at = excluded.created_at
+                """,
+                values,
+            )
+
+    async def queued_domains(self, run_id):
+        rows = await self._call(
+            lambda db: db.execute(
+                """
+                SELECT domain, count(*) FROM queue
+                WHERE crawl_run_id = ?
+                  AND (lease_expires_at IS NULL OR lease_expires_at < ?)
+                GROUP BY domain
+                """,
+                (run_id, time.time()),
+            ).fetchall()
+        )
+        return [(domain, queued) for domain, queued in rows]
+
+    async def lease_batch(self, run_id, domain, owner, limit, lease_seconds):
+        rows = await self._call(self._lease_batch, run_id, domain, owner, limit, lease_seconds)
+        return [_queue_item(row) for row in rows]
+
+    @staticmethod
+    def _lease_batch(db, run_id, domain, owner, limit, lease_seconds):
+        now = time.time()
+        with db:
+            rows = db.execute(
+                """
+                SELECT * FROM queue
+                WHERE crawl_run_id = ?
+                  AND domain = ?
+                  AND next_fetch_at <= ?
+                  AND (lease_expires_at IS NULL OR lease_expires_at < ?)
+                ORDER BY priority DESC, enqueued_at ASC, id ASC
+                LIMIT ?
+                """,
+                (run_id, domain, now, now, limit),
+            ).fetchall()
+            expires_at = now + lease_seconds
+            db.executemany(
+                "UPDATE queue SET lease_owner = ?, lease_expires_at = ? WHERE id = ?",
+                [(owner, expires_at, row["id"]) for row in rows],
+            )
+        return [{**dict(row), "lease_owner": owner, "lease_expires_at": expires_at} for row in rows]
+
+    async def next_due(self, run_id, domain):
+        return await self._call(
+            lambda db: db.execute(
+                """
+                SELECT min(next_fetch_at) - ?1 FROM queue
+                WHERE crawl_run_id = ?2
+                  AND domain = ?3
+                  AND (lease_expires_at IS NULL OR lease_expires_at < ?1)
+                """,
+                (time.time(), run_id, domain),
+            ).fetchone()[0]
+        )
+
+    async def count_leased(self, run_id, owner=None):
+        return await self._call(
+            lambda db: db.execute(
+                """
+                SELECT count(*) FROM queue
+                WHERE crawl_run_id = ?
+                  AND lease_owner = coalesce(?, lease_owner)
+                  AND lease_expires_at >= ?
+                """,
+                (run_id, owner, time.time()),
+            ).fetchone()[0]
+        )
+
+    async def heartbeat(self, owner, url_ids, lease_seconds):
+        return await self._call(self._heartbeat, owner, url_ids, lease_seconds)
+
+    @staticmethod
+    def _heartbeat(db, owner, url_ids, lease_seconds):
+        with db:
+            return db.execute(
+                """
+                UPDATE queue SET lease_expires_at = ?
+                WHERE lease_owner = ? AND url_id IN (SELECT value FROM json_each(?))
+                """,
+                (time.time() + lease_seconds, owner, json.dumps(url_ids)),
+            ).rowcount
+
+    async def reclaim_expired(self, run_id):
+        return await self._call(self._reclaim_expired, run_id)
+
+    @staticmethod
+    def _reclaim_expired(db, run_id):
+        with db:
+            rows = db.execute(
+                """
+                UPDATE queue
+                SET lease_owner = NULL, lease_expires_at = NULL
+                WHERE crawl_run_id = ?
+                  AND lease_owner IS NOT NULL
+                  AND lease_expires_at < ?
+                RETURNING domain
+                """,
+                (run_id, time.time()),
+            ).fetchall()
+        return [domain for domain, in rows]
+
+    async def release_leases(self, owner):
+        return await self._call(self._release_leases, owner)
+
+    @staticmethod
+    def _release_leases(db, owner):
+        with db:
+            return db.execute(
+                """
+                UPDATE queue SET lease_owner = NULL, lease_expires_at = NULL
+                WHERE lease_owner = ?
+                """,
+                (owner,),
+            ).rowcount
+
+    async def get_url(self, url_id):
+        return await self._call(
+            lambda db: db.execute("SELECT * FROM urls WHERE id = ?", (url_id,)).fetchone()
+        )
+
+    async def write_batch(self, run_id, owner, links, fetched, errors, stored_keys, acks, retries):
+        return await self._call(
+            self._write_batch, run_id, owner, links, fetched, errors, stored_keys, acks, retries
+        )
+
+    @staticmethod
+    def _write_batch(db, run_id, owner, links, fetched, errors, stored_keys, acks, retries):
+        now = time.time()
+        # One row per URL, queued if any of its links asked for it
+        unique = {}
+        for url, normalized, domain, enqueue in links:
+            if normalized in unique:
+                enqueue = enqueue or unique[normalized][2]
+                url, domain = unique[normalized][:2]
+            unique[normalized] = (url, domain, enqueue)
+
+        queued = []
+        acked = 0
+        with db:
+            for normalized, (url, domain, enqueue) in unique.items():
+                cursor = db.execute(
+                    """
+                    INSERT INTO urls
+                        (url, normalized_url, domain, crawl_run_id, first_seen, last_seen)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (crawl_run_id, normalized_url) DO NOTHING
+                    """,
+                    (url, normalized, domain, run_id, now, now),
+                )
+                if cursor.rowcount and enqueue:
+                    queued.append((cursor.lastrowid, domain))
+            db.executemany(
+                """
+                INSERT INTO queue
+                    (url_id, crawl_run_id, domain, priority, enqueued_at, next_fetch_at)
+                VALUES (?, ?, ?, 0, ?, ?)
+                ON CONFLICT (url_id) DO NOTHING
+                """,
+                [(url_id, run_id, domain, now, now) for url_id, domain in queued],
+            )
+
+            db.executemany(
+                """
+                UPDATE urls
+                SET status = ?,
+                    http_status = ?,
+                    fetch_attempts = fetch_attempts + 1,
+                    content_type = coalesce(?, content_type),
+                    content_size = coalesce(?, content_size),
+                    etag = coalesce(?, etag),
+                    last_modified = coalesce(?, last_modified),
+                    content_hash = coalesce(?, content_hash),
+                    stored_object_key = CASE
+                        WHEN coalesce(?, content_hash) IS NOT content_hash THEN NULL
+                        ELSE stored_object_key
+                    END,
+                    last_seen = ?
+                WHERE id = ?
+                """,
+                [(*row[1:], row[7], now, row[0]) for row in fetched],
+            )
+            db.executemany(
+                """
+                UPDATE urls
+                SET status = 'error', fetch_attempts = fetch_attempts + 1, last_seen = ?
+                WHERE id = ?
+                """,
+                [(now, url_id) for url_id, _, _ in errors],
+            )
+            db.executemany(
+                """
+                INSERT INTO fetch_errors (url_id, occurred_at, error_type, error_msg)
+                VALUES (?, ?, ?, ?)
+                """,
+                [(url_id, now, error_type, error_msg) for url_id, error_type, error_msg in errors],
+            )
+            db.executemany(
+                "UPDATE urls SET stored_object_key = ? WHERE id = ?",
+                [(key, url_id) for url_id, key in stored_keys],
+            )
+            if acks:
+                acked = db.execute(
+                    """
+                    DELETE FROM queue
+                    WHERE lease_owner = ? AND url_id IN (SELECT value FROM json_each(?))
+                    """,
+                    (owner, json.dumps(acks)),
+                ).rowcount
+
+            db.executemany(
+                """
+                UPDATE urls
+                SET http_status = ?, fetch_attempts = fetch_attempts + 1, last_seen = ?
+                WHERE id = ?
+                """,
+                [(row[1], now, row[0]) for row in retries],
+            )
+            db.executemany(
+                """
+                INSERT INTO fetch_errors (url_id, occurred_at, error_type, error_msg)
+                VALUES (?, ?, ?, ?)
+                """,
+                [(row[0], now, row[3], row[4]) for row in retries if row[3]],
+            )
+            for url_id, _, delay, _, _ in retries:
+                row = db.execute(
+                    """
+                    UPDATE queue
+                    SET next_fetch_at = ?, lease_owner = NULL, lease_expires_at = NULL
+                    WHERE url_id = ? AND lease_owner = ?
+                    RETURNING domain
+                    """,
+                    (now + delay, url_id, owner),
+                ).fetchone()
+                if row is not None:
+                    queued.append((url_id, row[0]))
+        return queued, acked
+
+    async def get_domains(self, domains):
+        return await self._call(
+            lambda db: db.execute(
+                """
+                SELECT domain, robots_txt, crawl_delay_seconds, ? - robots_fetched_at AS age
+                FROM domains
+                WHERE domain IN (SELECT value FROM json_each(?))
+                """,
+                (time.time(), json.dumps(domains)),
+            ).fetchall()
+        )
+
+    async def save_robots(self, domain, robots_txt):
+        await self._call(self._save_robots, domain, robots_txt)
+
+    @staticmethod
+    def _save_robots(db, domain, robots_txt):
+        with db:
+            db.execute(
+                """
+                INSERT INTO domains (domain, robots_txt, robots_fetched_at)
+                VALUES (?1, ?2, ?3)
+                ON CONFLICT (domain) DO UPDATE SET
+                    robots_txt = ?2,
+                    robots_fetched_at = ?3
+                """,
+                (domain, robots_txt, time.time()),
+            )
+
+    async def save_crawl_delay(self, domain, delay):
+        await self._call(self._save_crawl_delay, domain, delay)
+
+    @staticmethod
+    def _save_crawl_delay(db, domain, delay):
+        with db:
+            db.execute(
+                """
+                INSERT INTO domains (domain, crawl_delay_seconds)
+                VALUES (?1, ?2)
+                ON CONFLICT (domain) DO UPDATE SET
+                    crawl_delay_seconds = ?2
+                """,
+                (domain, delay),
+            )
+
+    async def write_report(self, run_id, out, format="json"):
+        # One read transaction, so pages and errors match the summary
+        await self._call(lambda db: db.execute("BEGIN"))
+        try:
+            run = await self._call(
+                lambda db: db.execute("SELECT * FROM crawl_runs WHERE id = ?", (run_id,)).fetchone()
+            )
+            if run is None:
+                return False
+            run = {
+                **dict(run),
+                "started_at": _datetime(run["started_at"]),
+                "finished_at": _datetime(run["finished_at"]),
+            }
+            writer = ReportWriter(out, format)
+            writer.header(run_fields(run, await self._call(self._summarize, run_id)))
+            await writer.section("pages", "page", self._report_rows(REPORT_PAGES, run_id))
+            await writer.section("errors", "error", self._report_rows(REPORT_ERRORS, run_id))
+            writer.close()
+            return True
+        finally:
+            await self._call(lambda db: db.rollback())
+
+    async def _report_rows(self, query, run_id):
+        cursor = await self._call(lambda db: db.execute(query, (run_id,)))
+        while True:
+            rows = await self._call(lambda db: cursor.fetchmany(REPORT_PREFETCH))
+            for row in rows:
+                row = dict(row)
+                if "occurred_at" in row:
+                    row["occurred_at"] = _datetime(row["occurred_at"])
+                yield row
+            if len(rows) < REPORT_PREFETCH:
+                return
+
+    @staticmethod
+    def _summarize(db, run_id):
+        totals = db.execute(
+            """
+            SELECT count(*) AS urls,
+                   count(DISTINCT domain) AS domains,
+                   coalesce(sum(content_size), 0) AS content_bytes,
+                   count(stored_object_key) AS stored
+            FROM urls
+            WHERE crawl_run_id = ?
+            """,
+            (run_id,),
+        ).fetchone()
+        by_status = db.execute(
+            """
+            SELECT status, count(*) FROM urls
+            WHERE crawl_run_id = ?
+            GROUP BY status
+            ORDER BY status
+            """,
+            (run_id,),
+        ).fetchall()
+        by_http_status = db.execute(
+            """
+            SELECT http_status, count(*) FROM urls
+            WHERE crawl_run_id = ? AND http_status IS NOT NULL
+            GROUP BY http_status
+            ORDER BY http_status
+            """,
+            (run_id,),
+        ).fetchall()
+        by_error = db.execute(
+            """
+            SELECT e.error_type, count(*)
+            FROM fetch_errors e
+            JOIN urls u ON u.id = e.url_id
+            WHERE u.crawl_run_id = ?
+            GROUP BY e.error_type
+            ORDER BY e.error_type
+            """,
+            (run_id,),
+        ).fetchall()
+        return {
+            **dict(totals),
+            "by_status": dict(by_status),
+            "by_http_status": {str(status): count for status, count in by_http_status},
+            "errors_by_type": dict(by_error),
+        }
@@ -1,13 +1,63 @@
 """MinIO storage for raw HTML content."""
+import asyncio
+import contextlib
+import gzip
 import hashlib
+from collections import OrderedDict
 import aioboto3
-from typing import Optional
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 import structlog
 
+from . import metrics
 from .config import settings
 
+try:
+    import zstandard
+except ImportError:  # optional, install the `zstd` extra
+    zstandard = None
+
 logger = structlog.get_logger()
 
+# Called with (url_id, object_key) once an upload has finished; the key is None if it failed
+StoredCallback = Callable[[int, Optional[str]], Awaitable[None]]
+
+
+def compression_encoding() -> Optional[str]:
+    """Content-Encoding used for stored bodies, falling back to gzip without zstandard."""
+    encoding = settings.storage_compression
+    if encoding == "none":
+        return None
+    if encoding == "zstd" and zstandard is None:
+        return "gzip"
+    return encoding
+
+
+def compress_html(content: bytes) -> bytes:
+    """Compress an HTML body with the configured encoding."""
+    encoding = compression_encoding()
+    level = settings.storage_compression_level
+    if encoding == "gzip":
+        # mtime=0 keeps the payload identical for identical bodies
+        return gzip.compress(content, compresslevel=level, mtime=0)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(content)
+    return content
+
+
+def object_key(digest: str) -> str:
+    """Content-addressed object key for a body with the given SHA-256."""
+    suffix = {"gzip": ".gz", "zstd": ".zst"}.get(compression_encoding(), "")
+    return f"html/{digest[:2]}/{digest}.html{suffix}"
+
+
+def create_storage():
+    """The storage backend chosen by ``storage_backend``."""
+    if settings.storage_backend == "warc":
+        from .warc import WarcStorage
+
+        return WarcStorage()
+    return Storage()
+
 
 class Storage:
     def __init__(self):
@@ -17,51 +67,182 @@ class Storage:
         self.access_key = settings.minio_access_key
         self.secret_key = settings.minio_secret_key
         self.bucket = settings.minio_bucket
+        self._client = None
+        self._exit_stack: Optional[contextlib.AsyncExitStack] = None
+        self._queue: Optional[asyncio.Queue[Tuple[int, str, bytes, Optional[str]]]] = None
+        self._workers: List[asyncio.Task] = []
+        self._on_stored: Optional[StoredCallback] = None
+        # Recently stored keys known to exist in the bucket (an LRU; keys
+        # that fell out are uploaded again, which the content-addressed key
+        # makes harmless), and uploads still in progress
+        self._stored_keys: "OrderedDict[str, None]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self.stats = {"uploaded": 0, "deduplicated": 0, "raw_bytes": 0, "stored_bytes": 0}
+
+    async def start(self, on_stored: Optional[StoredCallback] = None) -> None:
+        """
+        Open the shared S3 client, ensure the bucket and start the upload stage.
+
+        Uploads handed to submit() are performed by
+        ``storage_upload_concurrency`` background workers that all use
+        this one client. ``on_stored`` is awaited after each upload so the
+        caller can record the object key, or learn that the upload failed.
+        """
+        self._exit_stack = contextlib.AsyncExitStack()
+        self._client = await self._exit_stack.enter_async_context(
+            self.session.client(
+                "s3",
+                endpoint_url=str(self.endpoint),
+                aws_access_key_id=self.access_key,
+                aws_secret_access_key=self.secret_key,
+            )
+        )
+        await self.ensure_bucket()
+
+        self._on_stored = on_stored
+        self._queue = asyncio.Queue(maxsize=settings.storage_queue_size)
+        self._workers = [
+            asyncio.create_task(self._upload_worker())
+            for _ in range(settings.storage_upload_concurrency)
+        ]
+
+    async def close(self) -> None:
+        """Wait for queued uploads to finish, then stop workers and close the client."""
+        if self._queue is not None:
+            await self.flush()
+            for worker in self._workers:
+                worker.cancel()
+            await asyncio.gather(*self._workers, return_exceptions=True)
+            self._workers = []
+            self._queue = None
+            logger.info("storage_stats", **self.stats)
+        if self._exit_stack is not None:
+            await self._exit_stack.aclose()
+            self._exit_stack = None
+            self._client = None
+
+    async def flush(self) -> None:
+        """Wait for queued uploads to finish."""
+        if self._queue is not None:
+            await self._queue.join()
 
     async def ensure_bucket(self) -> None:
         """Create bucket if it doesn't exist."""
-        async with self.session.client(
-            "s3",
-            endpoint_url=str(self.endpoint),
-            aws_access_key_id=self.access_key,
-            aws_secret_access_key=self.secret_key,
-        ) as client:
+        try:
+            await self._client.head_bucket(Bucket=self.bucket)
+        except:
+            await self._client.create_bucket(Bucket=self.bucket)
+
+    async def submit(
+        self, url_id: int, url: str, content: bytes, digest: Optional[str] = None
+    ) -> None:
+        """
+        Hand HTML content to the upload stage and return without waiting for it.
+
+        Blocks only while the upload queue is full, which applies
+        backpressure to the crawl loop when storage falls behind.
+        """
+        await self._queue.put((url_id, url, content, digest))
+
+    async def _upload_worker(self) -> None:
+        """Upload queued pages and report their keys."""
+        while True:
+            url_id, url, content, digest = await self._queue.get()
             try:
-                await client.head_bucket(Bucket=self.bucket)
-            except:
-                await client.create_bucket(Bucket=self.bucket)
+                key = await self.store_html(url, content, digest)
+                if self._on_stored:
+                    await self._on_stored(url_id, key)
+            except Exception as e:
+                logger.error("store_callback_failed", url=url, error=str(e))
+            finally:
+                self._queue.task_done()
 
-    async def store_html(self, run_id: str, url: str, content: bytes) -> Optional[str]:
+    async def store_html(
+        self, url: str, content: bytes, digest: Optional[str] = None
+    ) -> Optional[str]:
         """
-        Store HTML content in MinIO.
-        
+        Store HTML content in MinIO under a content-addressed key.
+
+        Bodies are keyed by their SHA-256 and stored compressed, so
+        identical pages (mirrors, session-ID variants, boilerplate error
+        pages) share one object and only the first copy is uploaded.
+
         Args:
-            run_id: Crawl run ID
             url: Source URL
             content: Raw HTML bytes
-            
+            digest: Hex SHA-256 of content, if already computed
+
         Returns:
             Object key if stored successfully
         """
-        # Generate deterministic key from URL
-        url_hash = hashlib.sha256(url.encode()).hexdigest()
-        key = f"{run_id}/{url_hash}.html"
-        
-        try:
-            async with self.session.client(
-                "s3",
-                endpoint_url=str(self.endpoint),
-                aws_access_key_id=self.access_key,
-                aws_secret_access_key=self.secret_key,
-            ) as client:
-                await client.put_object(
-                    Bucket=self.bucket,
-                    Key=key,
-                    Body=content,
-                    ContentType="text/html",
-                )
+        if digest is None:
+            digest = hashlib.sha256(content).hexdigest()
+        key = object_key(digest)
+
+        if key in self._stored_keys:
+            self._stored_keys.move_to_end(key)
+            self.stats["deduplicated"] += 1
+            metrics.UPLOADS.inc("deduplicated")
+            return key
+
+        # Another worker is uploading the same body; share its result
+        pending = self._pending.get(key)
+        if pending is not None:
+            if await pending:
+                self.stats["deduplicated"] += 1
+                metrics.UPLOADS.inc("deduplicated")
                 return key
-                
+            return None
+
+        pending = self._pending[key] = asyncio.get_running_loop().create_future()
+        stored = False
+        try:
+            with metrics.UPLOAD_SECONDS.time():
+                stored = await self._put(key, digest, url, content)
+        finally:
+            pending.set_result(stored)
+            del self._pending[key]
+        if stored:
+            self._remember(key)
+            return key
+        return None
+
+    def _remember(self, key: str) -> None:
+        self._stored_keys[key] = None
+        self._stored_keys.move_to_end(key)
+        while len(self._stored_keys) > settings.storage_known_keys:
+            self._stored_keys.popitem(last=False)
+
+    async def _put(self, key: str, digest: str, url: str, content: bytes) -> bool:
+        """
+        Upload a compressed body.
+
+        The key is the body's hash, so a PUT over an object an earlier run
+        stored rewrites the same bytes; that is cheaper than a HEAD per page.
+        """
+        try:
+            # zlib and zstd release the GIL, so compress off the event loop
+            payload = await asyncio.to_thread(compress_html, content)
+
+            extra = {}
+            encoding = compression_encoding()
+            if encoding:
+                extra["ContentEncoding"] = encoding
+            await self._client.put_object(
+                Bucket=self.bucket,
+                Key=key,
+                Body=payload,
+                ContentType="text/html",
+                Metadata={"sha256": digest, "original-size": str(len(content))},
+                **extra,
+            )
+            self.stats["uploaded"] += 1
+            self.stats["raw_bytes"] += len(content)
+            self.stats["stored_bytes"] += len(payload)
+            metrics.UPLOADS.inc("uploaded")
+            return True
+
         except Exception as e:
             logger.error("store_failed", url=url, error=str(e))
-            return None
\ No newline at end of file
+            metrics.UPLOADS.inc("failed")
+            return False
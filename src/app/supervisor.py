@@ -0,0 +1,339 @@
+"""Multi-process crawling with hosts sharded across worker processes."""
+
+import asyncio
+import hashlib
+import multiprocessing
+import queue
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import structlog
+
+from . import metrics
+from .config import settings
+from .db import close_pool, get_connection
+from .persistence import LinkRow
+from .queue import create_run, finish_run, resume_run
+
+logger = structlog.get_logger()
+
+LinksHandler = Callable[[List[LinkRow]], Awaitable[None]]
+HostsHandler = Callable[[List[str]], None]
+MessageHandler = Callable[[], None]
+
+
+def shard_for(domain: str, shards: int) -> int:
+    """Shard owning a host; stable across processes, unlike hash()."""
+    digest = hashlib.blake2b(domain.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % shards
+
+
+class ShardLink:
+    """
+    A worker's connection to its siblings and the supervisor.
+
+    Each worker has an inbox. Links discovered for hosts another shard
+    owns are sent to that shard's inbox, so only the owner writes, dedups
+    and fetches a host's URLs. Workers report their progress, including
+    how many messages they sent and handled, which the supervisor uses to
+    tell when the whole run has finished.
+    """
+
+    def __init__(
+        self,
+        index: int,
+        count: int,
+        inboxes: List[multiprocessing.Queue],
+        progress: multiprocessing.Queue,
+    ):
+        self.index = index
+        self.count = count
+        self._inboxes = inboxes
+        self._progress = progress
+        self.sent = 0
+        self.received = 0
+        # Messages handled as of the last progress report
+        self._reported = 0
+        self._reader: Optional[asyncio.Task] = None
+        self._mail: Optional[asyncio.Event] = None
+        self._stopped: Optional[asyncio.Event] = None
+
+    def owns(self, domain: str) -> bool:
+        """True if this shard crawls ``domain``."""
+        return shard_for(domain, self.count) == self.index
+
+    def start(
+        self,
+        on_links: LinksHandler,
+        on_hosts: HostsHandler,
+        on_message: Optional[MessageHandler] = None,
+    ) -> None:
+        """
+        Start handling messages from other shards and the supervisor.
+
+        ``on_message`` is called as each message arrives, before it is handled.
+        """
+        self._mail = asyncio.Event()
+        self._stopped = asyncio.Event()
+        self._reader = asyncio.create_task(self._read(on_links, on_hosts, on_message))
+
+    async def close(self) -> None:
+        """Stop reading the inbox."""
+        if self._reader is not None:
+            if not self._reader.done():
+                # Unblock the reader thread
+                self._inboxes[self.index].put(("stop", None))
+            await asyncio.gather(self._reader, return_exceptions=True)
+            self._reader = None
+
+    def route_links(self, links: List[LinkRow]) -> List[LinkRow]:
+        """Send links to the shards owning their hosts. Returns the ones this shard owns."""
+        return self._route("links", links, lambda link: link[2])
+
+    def route_hosts(self, domains: List[str]) -> List[str]:
+        """Tell owning shards that hosts have queued URLs. Returns the ones this shard owns."""
+        return self._route("hosts", domains, lambda domain: domain)
+
+    def _route(self, kind: str, items: list, domain_of: Callable[[Any], str]) -> list:
+        own = []
+        others: Dict[int, list] = defaultdict(list)
+        for item in items:
+            shard = shard_for(domain_of(item), self.count)
+            if shard == self.index:
+                own.append(item)
+            else:
+                others[shard].append(item)
+        for shard, batch in others.items():
+            self._inboxes[shard].put((kind, batch))
+            self.sent += 1
+        return own
+
+    async def _read(
+        self,
+        on_links: LinksHandler,
+        on_hosts: HostsHandler,
+        on_message: Optional[MessageHandler],
+    ) -> None:
+        inbox = self._inboxes[self.index]
+        while True:
+            kind, payload = await asyncio.to_thread(inbox.get)
+            if kind == "stop":
+                self._stopped.set()
+                self._mail.set()
+                return
+            try:
+                if on_message is not None:
+                    on_message()
+                if kind == "links":
+                    await on_links(payload)
+                elif kind == "hosts":
+                    on_hosts(payload)
+            except Exception as e:
+                logger.error("shard_message_failed", kind=kind, error=str(e))
+            self.received += 1
+            self._mail.set()
+
+    def report(self, idle: bool, **stats: Any) -> None:
+        """Send this worker's progress to the supervisor."""
+        self._reported = self.received
+        self._progress.put(
+            {
+                "shard": self.index,
+                "idle": idle,
+                "sent": self.sent,
+                "received": self.received,
+                **stats,
+            }
+        )
+
+    async def wait_for_work(self, timeout: float) -> bool:
+        """
+        Wait up to ``timeout`` for messages while idle.
+
+        Returns at once if messages were handled since the last report,
+        which then may not have counted their work. Returns False once
+        the supervisor has stopped the run.
+        """
+        if not self._stopped.is_set() and self.received == self._reported:
+            self._mail.clear()
+            try:
+                await asyncio.wait_for(self._mail.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return not self._stopped.is_set()
+
+
+def _run_worker(
+    run_id: str,
+    seed_url: Optional[str],
+    index: int,
+    count: int,
+    inboxes: List[multiprocessing.Queue],
+    progress: multiprocessing.Queue,
+    overrides: Dict[str, Any],
+) -> None:
+    """Entry point of a worker process."""
+    from .runner import Runner
+
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    shard = ShardLink(index, count, inboxes, progress)
+    asyncio.run(Runner(run_id, seed_url, shard=shard).start())
+
+
+class Supervisor:
+    """
+    Runs one crawl across ``workers`` processes.
+
+    Hosts are partitioned by a stable hash of the domain, and each worker
+    runs a Runner that only fetches its own hosts, so per-host politeness
+    needs no coordination between processes. The supervisor creates the
+    run, starts the workers, logs aggregated progress every
+    ``progress_interval`` seconds and stops the workers once all of them
+    are idle with no messages in flight. With ``resume`` an existing run
+    that stopped is continued instead. Workers share the run through
+    Postgres, so the sqlite frontier cannot be used.
+    """
+
+    def __init__(
+        self,
+        run_id: str,
+        seed_url: Optional[str],
+        workers: int,
+        recrawl_of: Optional[str] = None,
+        resume: bool = False,
+    ):
+        if settings.frontier != "postgres":
+            raise ValueError("Runs with several workers need FRONTIER=postgres")
+        self.run_id = run_id
+        self.seed_url = seed_url
+        self.workers = workers
+        self.recrawl_of = recrawl_of
+        self.resume = resume
+        self._context = multiprocessing.get_context("spawn")
+        self._progress = self._context.Queue()
+        self._inboxes = [self._context.Queue() for _ in range(workers)]
+        self._processes: List[multiprocessing.Process] = []
+        self._latest: Dict[int, Dict[str, Any]] = {}
+        self._metrics_server = None
+
+    def run(self) -> None:
+        """Crawl the run to completion."""
+
+        async def prepare(conn) -> None:
+            if self.resume:
+                await resume_run(conn, self.run_id)
+            else:
+                await create_run(conn, self.run_id, self.seed_url, self.recrawl_of)
+
+        async def finish(conn) -> None:
+            await finish_run(conn, self.run_id, self._metrics())
+
+        asyncio.run(self._with_connection(prepare))
+
+        # Split the page-parsing and database budgets between workers
+        overrides = {
+            "parse_workers": settings.parse_workers // self.workers,
+            "db_pool_max_size": max(
+                settings.db_pool_min_size, settings.db_pool_max_size // self.workers
+            ),
+        }
+        if settings.metrics_port:
+            self._metrics_server = metrics.start_server(
+                settings.metrics_host, settings.metrics_port, self._render_metrics
+            )
+        for index in range(self.workers):
+            process = self._context.Process(
+                target=_run_worker,
+                args=(
+                    self.run_id,
+                    self.seed_url,
+                    index,
+                    self.workers,
+                    self._inboxes,
+                    self._progress,
+                    overrides,
+                ),
+                name=f"crawler-shard-{index}",
+            )
+            process.start()
+            self._processes.append(process)
+
+        try:
+            self._supervise()
+        finally:
+            self._stop()
+            if self._metrics_server is not None:
+                self._metrics_server.shutdown()
+                self._metrics_server.server_close()
+
+        asyncio.run(self._with_connection(finish))
+        logger.info("run_finished", run_id=self.run_id, **self._totals())
+
+    async def _with_connection(self, fn: Callable[[Any], Awaitable[None]]) -> None:
+        try:
+            async with get_connection() as conn:
+                await fn(conn)
+        finally:
+            await close_pool()
+
+    def _supervise(self) -> None:
+        last_check: Optional[Tuple] = None
+        next_log = time.monotonic() + settings.progress_interval
+        while True:
+            deadline = time.monotonic() + settings.queue_poll_interval
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    report = self._progress.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                self._latest[report["shard"]] = report
+
+            failed = [p for p in self._processes if p.exitcode not in (None, 0)]
+            if failed:
+                raise RuntimeError(f"{failed[0].name} exited with code {failed[0].exitcode}")
+
+            if time.monotonic() >= next_log:
+                logger.info("run_progress", run_id=self.run_id, **self._totals())
+                next_log = time.monotonic() + settings.progress_interval
+
+            # Done when every worker is idle, every message sent was handled,
+            # and nothing changed since the previous check
+            snapshot = tuple(
+                (r["idle"], r["sent"], r["received"]) for _, r in sorted(self._latest.items())
+            )
+            if (
+                len(self._latest) == self.workers
+                and all(r["idle"] for r in self._latest.values())
+                and sum(r["sent"] for r in self._latest.values())
+                == sum(r["received"] for r in self._latest.values())
+                and snapshot == last_check
+            ):
+                return
+            last_check = snapshot
+
+    def _stop(self) -> None:
+        for inbox in self._inboxes:
+            inbox.put(("stop", None))
+        for process in self._processes:
+            process.join(timeout=settings.queue_lease_seconds)
+            if process.is_alive():
+                logger.error("worker_did_not_stop", worker=process.name)
+                process.terminate()
+                process.join()
+
+    def _metrics(self) -> metrics.Snapshot:
+        """Metrics summed over the workers' latest reports."""
+        return metrics.merge([r["metrics"] for r in list(self._latest.values()) if "metrics" in r])
+
+    def _render_metrics(self) -> str:
+        return metrics.render(self._metrics())
+
+    def _totals(self) -> Dict[str, int]:
+        totals: Dict[str, int] = defaultdict(int)
+        for report in self._latest.values():
+            for key, value in report.items():
+                if key not in ("shard", "idle") and isinstance(value, int):
+                    totals[key] += value
+        totals["workers_idle"] = sum(1 for r in self._latest.values() if r["idle"])
+        return dict(totals)
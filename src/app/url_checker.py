@@ -1,79 +1,217 @@
 """URL checker for robots.txt compliance."""
-from datetime import datetime, timezone
+import asyncio
+import re
+import time
 import httpx
 import urllib.robotparser
-from typing import Optional, Dict
-import asyncpg
+from urllib.parse import quote, unquote, urlparse, urlunparse
+from typing import List, Optional, Dict, Tuple
+import structlog
 
 from .config import settings
+from .frontier import Frontier, PostgresFrontier
 from .models import Domain
 
+logger = structlog.get_logger()
+
+
+class RobotsRules:
+    """
+    robots.txt rules for our user agent, compiled into one regex.
+
+    The file is parsed by urllib.robotparser, so parsing and agent
+    matching are unchanged, but the group that applies to our user agent
+    is picked once and its rules are joined into a single alternation.
+    Alternatives are tried in file order, so the first matching rule
+    still wins, as in RobotFileParser.can_fetch, without a Python-level
+    scan over every rule for every URL.
+
+    ``unavailable`` rules stand in for a robots.txt that could not be
+    fetched: nothing may be fetched, but only until it is tried again.
+    """
+
+    def __init__(
+        self,
+        pattern: Optional["re.Pattern[str]"] = None,
+        allowances: Tuple[bool, ...] = (),
+        crawl_delay: Optional[float] = None,
+        allow_all: bool = False,
+        disallow_all: bool = False,
+        unavailable: bool = False,
+    ):
+        self._pattern = pattern
+        self._allowances = allowances
+        self.crawl_delay = crawl_delay
+        self.allow_all = allow_all
+        self.disallow_all = disallow_all
+        self.unavailable = unavailable
+
+    @classmethod
+    def parse(cls, robots_txt: str, useragent: str) -> "RobotsRules":
+        """Compile the rules of a robots.txt body that apply to ``useragent``."""
+        parser = urllib.robotparser.RobotFileParser()
+        parser.parse(robots_txt.splitlines())
+
+        entry = next((e for e in parser.entries if e.applies_to(useragent)), None)
+        if entry is None:
+            entry = parser.default_entry
+        if entry is None:
+            return cls(allow_all=True)
+
+        groups = [
+            "()" if line.path == "*" else f"({re.escape(line.path)})" for line in entry.rulelines
+        ]
+        pattern = re.compile("|".join(groups)) if groups else None
+        allowances = tuple(line.allowance for line in entry.rulelines)
+        return cls(pattern, allowances, entry.delay)
+
+    def can_fetch(self, url: str) -> bool:
+        """Check a URL the same way RobotFileParser.can_fetch does."""
+        if self.disallow_all or self.unavailable:
+            return False
+        if self.allow_all or self._pattern is None:
+            return True
+        parsed = urlparse(unquote(url))
+        path = quote(
+            urlunparse(("", "", parsed.path, parsed.params, parsed.query, parsed.fragment))
+        )
+        match = self._pattern.match(path or "/")
+        if match is None:
+            return True
+        return self._allowances[match.lastindex - 1]
+
 
 class RobotsCache:
-    def __init__(self):
-        self._cache: Dict[str, urllib.robotparser.RobotFileParser] = {}
+    """
+    Per-domain robots.txt rules with TTL-based refresh.
+
+    Rules are loaded from the frontier's ``domains`` while still fresh, and
+    fetched otherwise. A 4xx (other than 401/403) means no restrictions;
+    401/403 disallow the whole site. Server errors and network failures
+    are cached negatively, as unavailable rules for ``robots_error_ttl``,
+    so a failing host is not asked again for every URL; its URLs wait
+    for the next attempt instead of being treated as disallowed. Crawl
+    delays are only written when they change.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, frontier: Optional[Frontier] = None):
+        self.client = client
+        self.frontier = frontier or PostgresFrontier()
+        self._cache: Dict[str, Tuple[RobotsRules, float]] = {}  # domain -> (rules, expires_at)
+        self._loading: Dict[str, asyncio.Task] = {}
+        self._crawl_delays: Dict[str, float] = {}  # last delay written to domains
+        self._fetch_slots = asyncio.Semaphore(settings.robots_max_concurrent_fetches)
+
+    async def fetch_robots_txt(self, domain: str) -> Tuple[RobotsRules, float, Optional[str]]:
+        """
+        Fetch robots.txt for a domain.
 
-    async def fetch_robots_txt(self, domain: str, conn: asyncpg.Connection) -> Optional[str]:
-        """Fetch robots.txt for a domain and store in database."""
+        Returns:
+            Tuple of (rules, seconds to cache them, body to persist or None)
+        """
+        url = f"http://{domain}/robots.txt"
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                url = f"http://{domain}/robots.txt"
-                resp = await client.get(url)
-                if resp.status_code == 200:
-                    robots_txt = resp.text
-                    await conn.execute(
-                        """
-                        INSERT INTO domains (domain, robots_txt, robots_fetched_at)
-                        VALUES ($1, $2, now())
-                        ON CONFLICT (domain) DO UPDATE SET
-                            robots_txt = $2,
-                            robots_fetched_at = now()
-                        """,
-                        domain,
-                        robots_txt,
-                    )
-                    return robots_txt
-        except Exception:
-            pass
-        return None
-
-    async def get_parser(self, domain: str, conn: asyncpg.Connection) -> urllib.robotparser.RobotFileParser:
-        """Get RobotFileParser for domain, fetching robots.txt if needed."""
-        if domain not in self._cache:
-            row = await conn.fetchrow("SELECT * FROM domains WHERE domain = $1", domain)
-            if not row or not row["robots_txt"]:
-                robots_txt = await self.fetch_robots_txt(domain, conn)
-            else:
-                robots_txt = row["robots_txt"]
+            resp = await self.client.get(url, timeout=settings.robots_timeout)
+        except httpx.HTTPError as e:
+            logger.warning("robots_fetch_failed", domain=domain, error=str(e))
+            return RobotsRules(unavailable=True), settings.robots_error_ttl, None
+
+        if resp.status_code == 200:
+            robots_txt = resp.text
+            rules = RobotsRules.parse(robots_txt, settings.user_agent)
+            return rules, settings.robots_ttl, robots_txt
+        if resp.status_code in (401, 403):
+            return RobotsRules(disallow_all=True), settings.robots_ttl, None
+        if 400 <= resp.status_code < 500:
+            # No robots.txt: everything is allowed
+            return RobotsRules(allow_all=True), settings.robots_ttl, ""
+
+        logger.warning("robots_fetch_failed", domain=domain, status=resp.status_code)
+        return RobotsRules(unavailable=True), settings.robots_error_ttl, None
+
+    async def get_rules(self, domain: str) -> RobotsRules:
+        """Get the rules for a domain, loading them if missing or expired."""
+        cached = self._cache.get(domain)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+        return await asyncio.shield(self._start_loading(domain))
+
+    def expires_in(self, domain: str) -> float:
+        """Seconds until a domain's cached rules are loaded again, 0 if not cached."""
+        cached = self._cache.get(domain)
+        return max(cached[1] - time.monotonic(), 0.0) if cached else 0.0
+
+    async def warm(self, domains: List[str]) -> int:
+        """
+        Load still-fresh rules for many domains from the frontier in one query.
+
+        Used when resuming a run, so its queued hosts need no robots.txt
+        lookup per host. Returns the number of domains loaded.
+        """
+        if not domains:
+            return 0
+        rows = await self.frontier.get_domains(domains)
+        now = time.monotonic()
+        loaded = 0
+        for row in rows:
+            domain = row["domain"]
+            self._crawl_delays.setdefault(domain, row["crawl_delay_seconds"])
+            if row["age"] is not None and row["age"] < settings.robots_ttl:
+                rules = RobotsRules.parse(row["robots_txt"] or "", settings.user_agent)
+                self._cache[domain] = (rules, now + settings.robots_ttl - float(row["age"]))
+                loaded += 1
+        return loaded
 
-            parser = urllib.robotparser.RobotFileParser()
-            if robots_txt:
-                parser.parse(robots_txt.splitlines())
-            self._cache[domain] = parser
+    def prefetch(self, domain: str) -> None:
+        """Load a newly discovered domain's rules in the background."""
+        cached = self._cache.get(domain)
+        if not (cached and cached[1] > time.monotonic()):
+            self._start_loading(domain)
 
-        return self._cache[domain]
+    def _start_loading(self, domain: str) -> asyncio.Task:
+        task = self._loading.get(domain)
+        if task is None:
+            task = self._loading[domain] = asyncio.create_task(self._load(domain))
+            task.add_done_callback(lambda t: self._loaded(domain, t))
+        return task
 
-    async def allowed_to_fetch(self, domain: str, url: str, conn: asyncpg.Connection) -> bool:
+    def _loaded(self, domain: str, task: asyncio.Task) -> None:
+        self._loading.pop(domain, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("robots_load_failed", domain=domain, error=str(task.exception()))
+
+    async def _load(self, domain: str) -> RobotsRules:
+        async with self._fetch_slots:
+            rows = await self.frontier.get_domains([domain])
+            row = rows[0] if rows else None
+            if row:
+                self._crawl_delays.setdefault(domain, row["crawl_delay_seconds"])
+
+            if row and row["age"] is not None and row["age"] < settings.robots_ttl:
+                rules = RobotsRules.parse(row["robots_txt"] or "", settings.user_agent)
+                ttl = settings.robots_ttl - float(row["age"])
+            else:
+                rules, ttl, robots_txt = await self.fetch_robots_txt(domain)
+                if robots_txt is not None:
+                    await self.frontier.save_robots(domain, robots_txt)
+
+        self._cache[domain] = (rules, time.monotonic() + ttl)
+        return rules
+
+    async def allowed_to_fetch(self, domain: str, url: str) -> bool:
         """Check if URL is allowed by robots.txt."""
-        parser = await self.get_parser(domain, conn)
-        return parser.can_fetch(settings.user_agent, url)
+        rules = await self.get_rules(domain)
+        return rules.can_fetch(url)
 
-    async def get_crawl_delay(self, domain: str, conn: asyncpg.Connection) -> float:
+    async def get_crawl_delay(self, domain: str) -> float:
         """Get crawl delay for domain from robots.txt or use default."""
-        parser = await self.get_parser(domain, conn)
-        delay = parser.crawl_delay(settings.user_agent)
+        rules = await self.get_rules(domain)
+        delay = rules.crawl_delay
         if delay is None:
             delay = settings.default_crawl_delay
-        
-        # Update domain crawl delay
-        await conn.execute(
-            """
-            INSERT INTO domains (domain, crawl_delay_seconds)
-            VALUES ($1, $2)
-            ON CONFLICT (domain) DO UPDATE SET
-                crawl_delay_seconds = $2
-            """,
-            domain,
-            delay,
-        )
-        return delay
\ No newline at end of file
+
+        # Update domain crawl delay only when it changed
+        if self._crawl_delays.get(domain) != delay:
+            self._crawl_delays[domain] = delay
+            await self.frontier.save_crawl_delay(domain, delay)
+        return delay
@@ -0,0 +1,386 @@
+"""Append-only storage of raw HTML in rolling WARC segments."""
+
+import asyncio
+import contextlib
+import gzip
+import hashlib
+import itertools
+import os
+import socket
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Set, Tuple
+
+import aioboto3
+import structlog
+
+from . import metrics
+from .config import settings
+from .storage import StoredCallback
+
+logger = structlog.get_logger()
+
+SEGMENT_SUFFIX = ".warc.gz"
+
+
+def warc_record(record_type: str, headers: Dict[str, str], payload: bytes) -> bytes:
+    """Serialize one WARC/1.1 record."""
+    lines = [
+        "WARC/1.1",
+        f"WARC-Type: {record_type}",
+        f"WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>",
+        f"WARC-Date: {datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}",
+    ]
+    for name, value in headers.items():
+        # Header values are single lines
+        lines.append(f"{name}: {' '.join(str(value).split())}")
+    lines.append(f"Content-Length: {len(payload)}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode() + payload + b"\r\n\r\n"
+
+
+def parse_record(data: bytes) -> Tuple[Dict[str, str], bytes]:
+    """Headers and payload of one serialized WARC record."""
+    head, _, rest = data.partition(b"\r\n\r\n")
+    lines = head.decode().split("\r\n")
+    if not lines[0].startswith("WARC/"):
+        raise ValueError("not a WARC record")
+    headers = dict(line.split(": ", 1) for line in lines[1:])
+    return headers, rest[: int(headers["Content-Length"])]
+
+
+def record_key(segment: str, offset: int, length: int) -> str:
+    """Storage key of a record: its segment and byte range within it."""
+    return f"{segment}#{offset}:{length}"
+
+
+def parse_key(key: str) -> Tuple[str, int, int]:
+    """(segment, offset, length) of a record key."""
+    segment, _, span = key.rpartition("#")
+    offset, _, length = span.partition(":")
+    if not segment or not offset.isdigit() or not length.isdigit():
+        raise ValueError(f"not a WARC record key: {key!r}")
+    return segment, int(offset), int(length)
+
+
+def _encode(url: str, content: bytes, digest: str) -> bytes:
+    """A resource record for a page, as its own gzip member so it can be read alone."""
+    record = warc_record(
+        "resource",
+        {
+            "WARC-Target-URI": url,
+            "WARC-Payload-Digest": f"sha256:{digest}",
+            "Content-Type": "text/html",
+        },
+        content,
+    )
+    return gzip.compress(record, compresslevel=settings.storage_compression_level, mtime=0)
+
+
+def _read_range(path: Path, offset: int, length: int) -> bytes:
+    with path.open("rb") as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+class _Segment:
+    """A segment being written, spooled to a local file until it is sealed."""
+
+    def __init__(self, name: str, path: Path):
+        self.name = name
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.file: BinaryIO = path.open("wb")
+        self.size = 0
+        self.opened_at = time.monotonic()
+        # Pages to report once the segment is sealed, and the records it holds
+        self.pending: List[Tuple[int, str]] = []
+        self.digests: Dict[str, str] = {}
+
+    def append(self, data: bytes) -> int:
+        offset = self.size
+        self.file.write(data)
+        self.size += len(data)
+        return offset
+
+    def close(self) -> None:
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+
+class WarcStorage:
+    """
+    Storage backend appending pages to rolling, gzip-compressed WARC segments.
+
+    Each page is one ``resource`` record compressed as its own gzip
+    member, so the key ``<segment>#<offset>:<length>`` is enough to read
+    a single page back with a range read. Segments are written
+    sequentially to a local spool file and sealed once they reach
+    ``warc_segment_size_mb`` or ``warc_segment_max_seconds``: fsynced and
+    renamed into ``warc_dir``, or uploaded to the bucket as a multipart
+    upload. ``on_stored`` is awaited for a segment's pages only after it
+    is sealed, so a URL is never acked for a body that could still be
+    lost. Bodies already written by this process are not written again.
+    """
+
+    def __init__(self):
+        self.target = settings.warc_target
+        self.directory = Path(settings.warc_dir)
+        self.bucket = settings.minio_bucket
+        self.session = aioboto3.Session()
+        self._client = None
+        self._exit_stack: Optional[contextlib.AsyncExitStack] = None
+        self._on_stored: Optional[StoredCallback] = None
+        self._segment: Optional[_Segment] = None
+        # Segment names are unique per storage instance
+        self._token = uuid.uuid4().hex[:8]
+        self._seq = itertools.count()
+        self._lock = asyncio.Lock()
+        self._sealing: Set[asyncio.Task] = set()
+        self._seal_slots = asyncio.Semaphore(2)  # segments sealing before appends wait
+        self._roller: Optional[asyncio.Task] = None
+        # Records in sealed segments, by body SHA-256; an LRU of at most
+        # ``storage_known_keys``, so bodies that fell out are written again
+        self._digests: "OrderedDict[str, str]" = OrderedDict()
+        self.stats = {
+            "records": 0,
+            "deduplicated": 0,
+            "segments": 0,
+            "raw_bytes": 0,
+            "stored_bytes": 0,
+        }
+
+    async def start(self, on_stored: Optional[StoredCallback] = None) -> None:
+        """Open the S3 client if segments are uploaded, and start rolling segments by age."""
+        if self.target == "s3":
+            self._exit_stack = contextlib.AsyncExitStack()
+            self._client = await self._exit_stack.enter_async_context(
+                self.session.client(
+                    "s3",
+                    endpoint_url=str(settings.minio_endpoint),
+                    aws_access_key_id=settings.minio_access_key,
+                    aws_secret_access_key=settings.minio_secret_key,
+                )
+            )
+            try:
+                await self._client.head_bucket(Bucket=self.bucket)
+            except Exception:
+                await self._client.create_bucket(Bucket=self.bucket)
+        self._on_stored = on_stored
+        self._roller = asyncio.create_task(self._roll_by_age())
+
+    async def close(self) -> None:
+        """Seal the open segment and wait for every segment to be stored."""
+        if self._roller is None:
+            return
+        self._roller.cancel()
+        await asyncio.gather(self._roller, return_exceptions=True)
+        self._roller = None
+        await self.flush()
+        logger.info("storage_stats", **self.stats)
+        if self._exit_stack is not None:
+            await self._exit_stack.aclose()
+            self._exit_stack = None
+            self._client = None
+
+    async def flush(self) -> None:
+        """
+        Seal the open segment now and wait for every segment to be stored.
+
+        Called when the crawl runs out of work, so the last pages are acked
+        without waiting for their segment to reach its size or age limit.
+        """
+        async with self._lock:
+            await self._roll()
+        await asyncio.gather(*self._sealing, return_exceptions=True)
+
+    async def submit(
+        self, url_id: int, url: str, content: bytes, digest: Optional[str] = None
+    ) -> None:
+        """
+        Append a page to the open segment.
+
+        Compression runs off the event loop; the append itself is a small
+        sequential write. Blocks while two sealed segments are still
+        being stored, which applies backpressure to the crawl loop.
+        """
+        if digest is None:
+            digest = hashlib.sha256(content).hexdigest()
+        key = self._known(digest)
+        if key is not None:
+            await self._deduplicated(url_id, key)
+            return
+
+        record = await asyncio.to_thread(_encode, url, content, digest)
+        async with self._lock:
+            key = self._known(digest)
+            if key is None:
+                segment = self._segment
+                if segment is not None and digest in segment.digests:
+                    # Same body earlier in the open segment; reported with it once sealed
+                    segment.pending.append((url_id, segment.digests[digest]))
+                    self.stats["deduplicated"] += 1
+                    metrics.UPLOADS.inc("deduplicated")
+                else:
+                    await self._append(url_id, len(content), digest, record)
+                return
+        await self._deduplicated(url_id, key)
+
+    async def _append(self, url_id: int, raw_size: int, digest: str, record: bytes) -> None:
+        """Write a record to the open segment; call with the lock held."""
+        segment = self._segment or self._open_segment()
+        offset = segment.append(record)
+        key = record_key(segment.name, offset, len(record))
+        segment.digests[digest] = key
+        segment.pending.append((url_id, key))
+        self.stats["records"] += 1
+        self.stats["raw_bytes"] += raw_size
+        self.stats["stored_bytes"] += len(record)
+        if segment.size >= settings.warc_segment_size_mb * 1024 * 1024:
+            await self._roll()
+
+    async def read(self, key: str) -> bytes:
+        """Read one page's body back by its key, with a range read."""
+        segment, offset, length = parse_key(key)
+        if self.target == "s3":
+            response = await self._client.get_object(
+                Bucket=self.bucket, Key=segment, Range=f"bytes={offset}-{offset + length - 1}"
+            )
+            data = await response["Body"].read()
+        else:
+            data = await asyncio.to_thread(_read_range, self.directory / segment, offset, length)
+        return parse_record(gzip.decompress(data))[1]
+
+    def _known(self, digest: str) -> Optional[str]:
+        """Key of a stored record with this body, if one is remembered."""
+        key = self._digests.get(digest)
+        if key is not None:
+            self._digests.move_to_end(digest)
+        return key
+
+    async def _deduplicated(self, url_id: int, key: str) -> None:
+        self.stats["deduplicated"] += 1
+        metrics.UPLOADS.inc("deduplicated")
+        if self._on_stored:
+            await self._on_stored(url_id, key)
+
+    def _open_segment(self) -> _Segment:
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+        name = (
+            f"{settings.warc_prefix}/{stamp}-{socket.gethostname()}-{self._token}"
+            f"-{next(self._seq):05d}{SEGMENT_SUFFIX}"
+        )
+        segment = self._segment = _Segment(name, self.directory / f"{name}.open")
+        segment.append(
+            gzip.compress(
+                warc_record(
+                    "warcinfo",
+                    {"WARC-Filename": Path(name).name, "Content-Type": "application/warc-fields"},
+                    f"software: {settings.user_agent}\r\nformat: WARC File Format 1.1\r\n".encode(),
+                ),
+                mtime=0,
+            )
+        )
+        return segment
+
+    async def _roll(self) -> None:
+        """Close the open segment and start storing it; call with the lock held."""
+        segment, self._segment = self._segment, None
+        if segment is None:
+            return
+        if not segment.pending:
+            segment.file.close()
+            segment.path.unlink(missing_ok=True)
+            return
+        await self._seal_slots.acquire()
+        task = asyncio.create_task(self._seal(segment))
+        self._sealing.add(task)
+        task.add_done_callback(self._sealing.discard)
+
+    async def _roll_by_age(self) -> None:
+        while True:
+            await asyncio.sleep(1.0)
+            segment = self._segment
+            if (
+                segment is not None
+                and segment.pending
+                and time.monotonic() - segment.opened_at >= settings.warc_segment_max_seconds
+            ):
+                async with self._lock:
+                    if self._segment is segment:
+                        await self._roll()
+
+    async def _seal(self, segment: _Segment) -> None:
+        stored = False
+        try:
+            with metrics.UPLOAD_SECONDS.time():
+                await asyncio.to_thread(segment.close)
+                if self.target == "s3":
+                    await self._upload(segment)
+                    await asyncio.to_thread(segment.path.unlink)
+                else:
+                    await asyncio.to_thread(os.replace, segment.path, self.directory / segment.name)
+            stored = True
+            for digest, key in segment.digests.items():
+                self._digests[digest] = key
+                self._digests.move_to_end(digest)
+            while len(self._digests) > settings.storage_known_keys:
+                self._digests.popitem(last=False)
+            self.stats["segments"] += 1
+            logger.info(
+                "warc_segment_stored",
+                segment=segment.name,
+                size=segment.size,
+                records=len(segment.digests),
+            )
+        except Exception as e:
+            logger.error(
+                "warc_segment_failed", segment=segment.name, path=str(segment.path), error=str(e)
+            )
+        finally:
+            self._seal_slots.release()
+
+        metrics.UPLOADS.inc("uploaded" if stored else "failed", amount=len(segment.digests))
+        for url_id, key in segment.pending:
+            try:
+                if self._on_stored:
+                    await self._on_stored(url_id, key if stored else None)
+            except Exception as e:
+                logger.error("store_callback_failed", url_id=url_id, error=str(e))
+
+    async def _upload(self, segment: _Segment) -> None:
+        """Upload a sealed segment to the bucket in ``warc_part_size_mb`` parts."""
+        upload = await self._client.create_multipart_upload(
+            Bucket=self.bucket, Key=segment.name, ContentType="application/warc"
+        )
+        upload_id = upload["UploadId"]
+        part_size = settings.warc_part_size_mb * 1024 * 1024
+        parts = []
+        try:
+            with segment.path.open("rb") as f:
+                for number in itertools.count(1):
+                    chunk = await asyncio.to_thread(f.read, part_size)
+                    if not chunk:
+                        break
+                    response = await self._client.upload_part(
+                        Bucket=self.bucket,
+                        Key=segment.name,
+                        PartNumber=number,
+                        UploadId=upload_id,
+                        Body=chunk,
+                    )
+                    parts.append({"ETag": response["ETag"], "PartNumber": number})
+            await self._client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=segment.name,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        except BaseException:
+            await self._client.abort_multipart_upload(
+                Bucket=self.bucket, Key=segment.name, UploadId=upload_id
+            )
+            raise
@@ -1,11 +1,14 @@
 """CLI interface."""
 from pathlib import Path
-import json
+from typing import Optional
 import typer
 import asyncio
 
 from app.runner import Runner
-from app.db import get_connection
+from app.supervisor import Supervisor
+from app.db import close_pool
+from app.frontier import create_frontier
+from app.report import open_output
 
 app = typer.Typer()
 
@@ -14,68 +17,87 @@ app = typer.Typer()
 def run(
     seed: str = typer.Option(..., "--seed", help="Seed URL to start crawling from"),
     run_id: str = typer.Option(..., "--run-id", help="Unique identifier for this crawl run"),
+    workers: int = typer.Option(
+        1, "--workers", min=1, help="Worker processes, each crawling a hash partition of hosts"
+    ),
+    recrawl_of: str = typer.Option(
+        None, "--recrawl-of", help="Earlier run to re-crawl with conditional requests"
+    ),
 ):
     """Start a new crawl run."""
-    runner = Runner(run_id=run_id, seed_url=seed)
-    asyncio.run(runner.start())
+    try:
+        if workers > 1:
+            Supervisor(run_id=run_id, seed_url=seed, workers=workers, recrawl_of=recrawl_of).run()
+            return
+        runner = Runner(run_id=run_id, seed_url=seed, recrawl_of=recrawl_of)
+        asyncio.run(runner.start())
+    except ValueError as e:
+        typer.echo(str(e))
+        raise typer.Exit(1)
+
+
+@app.command()
+def resume(
+    run_id: str = typer.Option(..., "--run-id", help="Crawl run to continue"),
+    workers: int = typer.Option(
+        1, "--workers", min=1, help="Worker processes, each crawling a hash partition of hosts"
+    ),
+):
+    """Continue a crawl run that stopped or crashed."""
+    try:
+        if workers > 1:
+            Supervisor(run_id=run_id, seed_url=None, workers=workers, resume=True).run()
+            return
+        runner = Runner(run_id=run_id, seed_url=None, resume=True)
+        asyncio.run(runner.start())
+    except ValueError as e:
+        typer.echo(str(e))
+        raise typer.Exit(1)
+
+
+@app.command()
+def join(
+    run_id: str = typer.Option(..., "--run-id", help="Crawl run in progress to help crawl"),
+):
+    """Crawl a running crawl run alongside its other crawlers, sharing its queue."""
+    try:
+        runner = Runner(run_id=run_id, seed_url=None, join=True)
+        asyncio.run(runner.start())
+    except ValueError as e:
+        typer.echo(str(e))
+        raise typer.Exit(1)
 
 
 @app.command()
 def report(
     run_id: str = typer.Option(..., "--run-id", help="Crawl run ID to generate report for"),
-    out: Path = typer.Option(..., "--out", help="Output JSON file path"),
+    out: Path = typer.Option(..., "--out", help="Output file path"),
+    format: str = typer.Option(
+        "json", "--format", help="json (one document) or ndjson (one record per line)"
+    ),
+    compress: Optional[bool] = typer.Option(
+        None, "--gzip/--no-gzip", help="Compress the output; default is on for .gz paths"
+    ),
 ):
     """Generate a crawl run report."""
-    async def _generate():
-        async with await get_connection() as conn:
-            # Get run info
-            run = await conn.fetchrow(
-                "SELECT * FROM crawl_runs WHERE id = $1",
-                run_id,
-            )
-            if not run:
-                typer.echo(f"Run {run_id} not found")
-                raise typer.Exit(1)
-                
-            # Get pages and errors
-            pages = await conn.fetch(
-                """
-                SELECT url, status, http_status, content_type, content_size, stored_object_key
-                FROM urls
-                WHERE crawl_run_id = $1
-                ORDER BY id
-                """,
-                run_id,
-            )
-            
-            errors = await conn.fetch(
-                """
-                SELECT u.url, e.error_type, e.error_msg, e.occurred_at
-                FROM fetch_errors e
-                JOIN urls u ON u.id = e.url_id
-                WHERE u.crawl_run_id = $1
-                ORDER BY e.occurred_at
-                """,
-                run_id,
-            )
-            
-            # Build report
-            report = {
-                "run_id": run["id"],
-                "seed_domain": run["seed_domain"],
-                "started_at": run["started_at"].isoformat(),
-                "finished_at": run["finished_at"].isoformat() if run["finished_at"] else None,
-                "total_fetched": run["total_fetched"],
-                "total_discovered": run["total_discovered"],
-                "pages": [dict(p) for p in pages],
-                "errors": [dict(e) for e in errors],
-            }
-            
-            # Write JSON
-            out.write_text(json.dumps(report, indent=2))
-            typer.echo(f"Report written to {out}")
-            
-    asyncio.run(_generate())
+    if format not in ("json", "ndjson"):
+        typer.echo(f"Unknown format {format}; use json or ndjson")
+        raise typer.Exit(1)
+
+    async def _generate() -> bool:
+        frontier = create_frontier()
+        try:
+            with open_output(out, compress) as f:
+                return await frontier.write_report(run_id, f, format)
+        finally:
+            await frontier.close()
+            await close_pool()
+
+    if not asyncio.run(_generate()):
+        out.unlink(missing_ok=True)
+        typer.echo(f"Run {run_id} not found")
+        raise typer.Exit(1)
+    typer.echo(f"Report written to {out}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,52 @@
+"""Fixtures for tests against Postgres."""
+
+import uuid
+
+import pytest
+import pytest_asyncio
+
+import app.db as db
+
+
+@pytest_asyncio.fixture
+async def conn():
+    """Connection to a migrated database, or skip without Postgres."""
+    try:
+        pool = await db.get_pool()
+    except Exception as e:
+        pytest.skip(f"Postgres not available: {e}")
+    async with pool.acquire() as conn:
+        await db.init_db(conn)
+        yield conn
+    await pool.close()
+    db._pool = None
+
+
+@pytest.fixture
+def make_run(conn):
+    """Create a run with ``pages`` URLs on each domain; returns (run_id, url_ids)."""
+
+    async def make(domains, pages):
+        run_id = f"queue-{uuid.uuid4()}"
+        await conn.execute(
+            "INSERT INTO crawl_runs (id, seed_domain) VALUES ($1, $2)", run_id, domains[0]
+        )
+        url_ids = []
+        for domain in domains:
+            for i in range(pages):
+                url = f"http://{domain}/{run_id}/{i}"
+                url_ids.append(
+                    await conn.fetchval(
+                        """
+                        INSERT INTO urls (url, normalized_url, domain, crawl_run_id)
+                        VALUES ($1, $1, $2, $3)
+                        RETURNING id
+                        """,
+                        url,
+                        domain,
+                        run_id,
+                    )
+                )
+        return run_id, url_ids
+
+    return make
@@ -0,0 +1,143 @@
+"""Several crawler processes sharing one run's queue through leases."""
+
+import json
+import os
+import subprocess
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+from app.queue import create_run, enqueue_if_new
+
+SRC = Path(__file__).resolve().parents[2] / "src"
+
+# Leases batches until the run's queue is empty, "fetching" each URL
+# (recording its id) and acking it. With --crash it leases one batch and
+# exits without acking, like a process that died mid-fetch.
+WORKER = """
+import asyncio, json, sys
+import app.db as db
+from app.queue import ack, count_leased, get_queued_domains, lease_batch
+
+async def main(run_id, owner, crash):
+    fetched = []
+    async with db.get_connection() as conn:
+        while True:
+            domains = [d for d, _ in await get_queued_domains(conn, run_id)]
+            if not domains:
+                if not await count_leased(conn, run_id):
+                    break
+                await asyncio.sleep(0.2)
+                continue
+            for domain in domains:
+                batch = await lease_batch(conn, run_id, domain, owner, 5, 2 if crash else 30)
+                if crash and batch:
+                    return []
+                for item in batch:
+                    await asyncio.sleep(0.01)
+                    fetched.append(item.url_id)
+                await ack(conn, owner, [item.url_id for item in batch])
+    return fetched
+
+run_id, owner, crash = sys.argv[1], sys.argv[2], sys.argv[3] == "crash"
+print(json.dumps(asyncio.run(main(run_id, owner, crash))))
+"""
+
+
+def _spawn(run_id, owner, mode):
+    env = {**os.environ, "PYTHONPATH": str(SRC)}
+    return subprocess.Popen(
+        [sys.executable, "-c", WORKER, run_id, owner, mode],
+        env=env,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+
+
+@pytest.mark.asyncio
+async def test_workers_share_queue_without_duplicates(conn, make_run):
+    run_id, url_ids = await make_run([f"host{i}.test" for i in range(4)], 25)
+    for url_id in url_ids:
+        await enqueue_if_new(conn, url_id, run_id)
+
+    crashed = _spawn(run_id, "crashed", "crash")
+    assert crashed.wait(timeout=60) == 0
+    workers = [_spawn(run_id, f"worker-{i}-{uuid.uuid4().hex[:6]}", "run") for i in range(3)]
+    results = [json.loads(worker.communicate(timeout=120)[0]) for worker in workers]
+
+    fetched = [url_id for result in results for url_id in result]
+    # Every URL fetched exactly once, including the crashed worker's expired batch
+    assert sorted(fetched) == sorted(url_ids)
+    assert sum(1 for result in results if result) > 1
+    assert await conn.fetchval("SELECT count(*) FROM queue WHERE crawl_run_id = $1", run_id) == 0
+
+
+# Joins a run with a Runner crawling a synthetic site of HOSTS hosts, each
+# with a home page linking to PAGES pages and to every other home page
+RUNNER = """
+import asyncio, json, sys
+import httpx
+from app.runner import Runner
+
+HOSTS, PAGES = 8, 10
+
+async def site(request):
+    await asyncio.sleep(0.02)
+    if request.url.path == "/robots.txt":
+        return httpx.Response(404)
+    links = []
+    if request.url.path == "/":
+        links = [f"/p{i}" for i in range(PAGES)]
+        links += [f"http://site{i}.test/" for i in range(HOSTS)]
+    body = "".join(f'<a href="{link}">x</a>' for link in links)
+    return httpx.Response(200, html=f"<html><body>{request.url.path}{body}</body></html>")
+
+async def main(run_id):
+    runner = Runner(run_id, None, join=True)
+    await runner.http_client.aclose()
+    runner.http_client = httpx.AsyncClient(transport=httpx.MockTransport(site))
+    runner.robots_cache.client = runner.http_client
+    await runner.start()
+    return runner.stats["fetched"]
+
+print(json.dumps(asyncio.run(main(sys.argv[1]))))
+"""
+
+
+@pytest.mark.asyncio
+async def test_runners_join_a_run_and_share_its_queue(conn, tmp_path):
+    run_id = f"join-{uuid.uuid4()}"
+    await create_run(conn, run_id, "http://site0.test/")
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(SRC),
+        "FOLLOW_EXTERNAL_LINKS": "true",
+        "STORAGE_BACKEND": "warc",
+        "WARC_TARGET": "local",
+        "WARC_DIR": str(tmp_path),
+        "DEFAULT_CRAWL_DELAY": "0",
+        "QUEUE_POLL_INTERVAL": "0.1",
+        "CHECKPOINT_INTERVAL": "0",
+        "PARSE_WORKERS": "0",
+        "METRICS_PORT": "0",
+    }
+    runners = [
+        subprocess.Popen(
+            [sys.executable, "-c", RUNNER, run_id], env=env, stdout=subprocess.PIPE, text=True
+        )
+        for _ in range(2)
+    ]
+    fetched = [json.loads(r.communicate(timeout=120)[0].splitlines()[-1]) for r in runners]
+
+    # Both crawled, and every page was fetched once, by one of them
+    assert all(fetched) and sum(fetched) == 8 * 11
+    rows = await conn.fetch(
+        "SELECT status, fetch_attempts FROM urls WHERE crawl_run_id = $1", run_id
+    )
+    assert len(rows) == 8 * 11
+    assert {(row["status"], row["fetch_attempts"]) for row in rows} == {("fetched", 1)}
+    assert await conn.fetchval("SELECT count(*) FROM queue WHERE crawl_run_id = $1", run_id) == 0
+    finished = await conn.fetchval("SELECT finished_at FROM crawl_runs WHERE id = $1", run_id)
+    assert finished is not None
@@ -0,0 +1,97 @@
+"""Test the run-scoped queue against Postgres."""
+
+import pytest
+
+from app.queue import (
+    ack,
+    defer,
+    enqueue_if_new,
+    get_queued_domains,
+    heartbeat,
+    lease_batch,
+    next_due,
+    reclaim_expired,
+    release_leases,
+)
+
+
+@pytest.mark.asyncio
+async def test_enqueue_is_idempotent(conn, make_run):
+    run_id, url_ids = await make_run(["a.test"], 1)
+    assert await enqueue_if_new(conn, url_ids[0], run_id) is not None
+    assert await enqueue_if_new(conn, url_ids[0], run_id) is None
+    assert await get_queued_domains(conn, run_id) == [("a.test", 1)]
+
+
+@pytest.mark.asyncio
+async def test_lease_batch_is_scoped_to_run_and_domain(conn, make_run):
+    run_id, url_ids = await make_run(["a.test", "b.test"], 5)
+    other_run, other_ids = await make_run(["a.test"], 5)
+    for url_id in url_ids:
+        await enqueue_if_new(conn, url_id, run_id, priority=10 if url_id == url_ids[4] else 0)
+    for url_id in other_ids:
+        await enqueue_if_new(conn, url_id, other_run)
+
+    batch = await lease_batch(conn, run_id, "a.test", "w1", 3, 60)
+    assert all(item.crawl_run_id == run_id and item.domain == "a.test" for item in batch)
+    assert all(item.lease_owner == "w1" for item in batch)
+    # Highest priority first, then oldest
+    assert [item.url_id for item in batch] == [url_ids[4], url_ids[0], url_ids[1]]
+
+    # Leased rows are invisible to other owners
+    rest = await lease_batch(conn, run_id, "a.test", "w2", 10, 60)
+    assert [item.url_id for item in rest] == url_ids[2:4]
+    assert await lease_batch(conn, run_id, "a.test", "w3", 10, 60) == []
+    assert dict(await get_queued_domains(conn, run_id)) == {"b.test": 5}
+    assert dict(await get_queued_domains(conn, other_run)) == {"a.test": 5}
+
+
+@pytest.mark.asyncio
+async def test_ack_heartbeat_and_release(conn, make_run):
+    run_id, url_ids = await make_run(["a.test"], 4)
+    for url_id in url_ids:
+        await enqueue_if_new(conn, url_id, run_id)
+    leased = [item.url_id for item in await lease_batch(conn, run_id, "a.test", "w1", 4, 60)]
+
+    # Only the owner can ack or renew
+    assert await ack(conn, "w2", leased[:1]) == 0
+    assert await heartbeat(conn, "w2", leased, 60) == 0
+    assert await heartbeat(conn, "w1", leased, 60) == 4
+    assert await ack(conn, "w1", leased[:2]) == 2
+
+    assert await release_leases(conn, "w1") == 2
+    again = await lease_batch(conn, run_id, "a.test", "w2", 10, 60)
+    assert sorted(item.url_id for item in again) == sorted(leased[2:])
+
+
+@pytest.mark.asyncio
+async def test_expired_leases_are_taken_over(conn, make_run):
+    run_id, url_ids = await make_run(["a.test"], 2)
+    for url_id in url_ids:
+        await enqueue_if_new(conn, url_id, run_id)
+    await lease_batch(conn, run_id, "a.test", "dead", 1, 0)
+    await lease_batch(conn, run_id, "a.test", "alive", 1, 60)
+
+    assert await reclaim_expired(conn, run_id) == ["a.test"]
+    taken = await lease_batch(conn, run_id, "a.test", "w2", 10, 60)
+    assert [item.url_id for item in taken] == url_ids[:1]
+
+
+@pytest.mark.asyncio
+async def test_deferred_urls_wait_until_due(conn, make_run):
+    run_id, url_ids = await make_run(["a.test"], 2)
+    for url_id in url_ids:
+        await enqueue_if_new(conn, url_id, run_id)
+    leased = [item.url_id for item in await lease_batch(conn, run_id, "a.test", "w1", 2, 60)]
+    assert await next_due(conn, run_id, "a.test") is None
+
+    # Only the owner can put a URL back
+    assert await defer(conn, "w2", leased, [60.0, 0.0]) == []
+    put_back = await defer(conn, "w1", leased, [60.0, 0.0])
+    assert set(put_back) == {(leased[0], "a.test"), (leased[1], "a.test")}
+    assert await get_queued_domains(conn, run_id) == [("a.test", 2)]
+    assert await next_due(conn, run_id, "a.test") <= 0
+
+    again = await lease_batch(conn, run_id, "a.test", "w2", 10, 60)
+    assert [item.url_id for item in again] == leased[1:]
+    assert 59 < await next_due(conn, run_id, "a.test") <= 60
@@ -0,0 +1,58 @@
+"""Test re-crawl seeding and unchanged pages against Postgres."""
+
+import uuid
+
+import pytest
+
+from app.frontier import PostgresFrontier
+from app.persistence import Persistence
+from app.queue import create_run, get_queued_domains
+
+
+@pytest.mark.asyncio
+async def test_recrawl_copies_urls_and_validators(conn):
+    first = f"first-{uuid.uuid4()}"
+    await create_run(conn, first, "http://a.test/")
+    page = await conn.fetchval(
+        """
+        INSERT INTO urls (url, normalized_url, domain, crawl_run_id, status, etag, content_hash)
+        VALUES ('http://a.test/p', 'http://a.test/p', 'a.test', $1, 'fetched', '"v1"', 'abc')
+        RETURNING id
+        """,
+        first,
+    )
+    await conn.execute(
+        """
+        INSERT INTO urls (url, normalized_url, domain, crawl_run_id)
+        VALUES ('http://b.test/', 'http://b.test/', 'b.test', $1)
+        """,
+        first,
+    )
+    await conn.execute(
+        "UPDATE urls SET status = 'fetched' WHERE crawl_run_id = $1 AND url = 'http://a.test/'",
+        first,
+    )
+
+    second = f"second-{uuid.uuid4()}"
+    await create_run(conn, second, "http://a.test/", recrawl_of=first)
+
+    rows = {
+        r["normalized_url"]: r
+        for r in await conn.fetch("SELECT * FROM urls WHERE crawl_run_id = $1", second)
+    }
+    # Same URLs as the first run, each with its own row
+    assert set(rows) == {"http://a.test/", "http://a.test/p", "http://b.test/"}
+    assert rows["http://a.test/p"]["id"] != page
+    assert rows["http://a.test/p"]["etag"] == '"v1"'
+    assert rows["http://a.test/p"]["status"] == "new"
+    # Only URLs the first run fetched are queued again
+    assert dict(await get_queued_domains(conn, second)) == {"a.test": 2}
+
+    persistence = Persistence(second, PostgresFrontier())
+    await persistence.record_unchanged(rows["http://a.test/p"]["id"], 304, etag='"v2"')
+    await persistence.flush()
+    row = await conn.fetchrow("SELECT * FROM urls WHERE id = $1", rows["http://a.test/p"]["id"])
+    assert row["status"] == "unchanged"
+    assert row["http_status"] == 304
+    assert row["etag"] == '"v2"'
+    assert row["content_hash"] == "abc"
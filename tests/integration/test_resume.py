@@ -0,0 +1,55 @@
+"""Test resuming a stopped run against Postgres."""
+
+import pytest
+
+from app.checkpoint import delete_checkpoints, load_checkpoint, save_checkpoint
+from app.queue import enqueue_if_new, get_queued_domains, lease_batch, requeue_unfinished
+from app.seen import SeenFilter
+
+
+@pytest.mark.asyncio
+async def test_requeue_unfinished_releases_leases_and_drops_finished(conn, make_run):
+    run_id, url_ids = await make_run(["a.test"], 5)
+    for url_id in url_ids:
+        await enqueue_if_new(conn, url_id, run_id)
+    await lease_batch(conn, run_id, "a.test", "crashed", 5, 600)
+
+    # Results written but never acked: a non-HTML page, an HTML page
+    # whose body was stored and one whose upload never finished
+    await conn.execute("UPDATE urls SET status = 'fetched' WHERE id = $1", url_ids[0])
+    await conn.execute(
+        """
+        UPDATE urls SET status = 'fetched', content_hash = 'abc', stored_object_key = 'k'
+        WHERE id = $1
+        """,
+        url_ids[1],
+    )
+    await conn.execute(
+        "UPDATE urls SET status = 'fetched', content_hash = 'abc' WHERE id = $1", url_ids[2]
+    )
+
+    released, dropped = await requeue_unfinished(conn, run_id)
+    assert (released, dropped) == (3, 2)
+    assert await get_queued_domains(conn, run_id) == [("a.test", 3)]
+
+    batch = await lease_batch(conn, run_id, "a.test", "resumed", 10, 60)
+    assert sorted(item.url_id for item in batch) == url_ids[2:]
+
+
+@pytest.mark.asyncio
+async def test_checkpoint_round_trip(conn, make_run):
+    run_id, _ = await make_run(["a.test"], 1)
+    seen = SeenFilter(1024 * 1024, 0.01)
+    seen.add("http://a.test/")
+
+    await save_checkpoint(conn, run_id, 0, 2, 41, seen.to_bytes(), {"fetched": 1})
+    await save_checkpoint(conn, run_id, 0, 2, 42, seen.to_bytes(), {"fetched": 3})
+    checkpoint = await load_checkpoint(conn, run_id, 0, 2)
+    assert checkpoint["max_url_id"] == 42
+    assert "http://a.test/" in SeenFilter.from_bytes(checkpoint["seen_filter"])
+
+    # A different shard count partitions hosts differently
+    assert await load_checkpoint(conn, run_id, 0, 3) is None
+
+    await delete_checkpoints(conn, run_id)
+    assert await load_checkpoint(conn, run_id, 0, 2) is None
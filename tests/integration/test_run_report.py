@@ -0,0 +1,44 @@
+"""Test report generation against Postgres."""
+
+import io
+import json
+
+import pytest
+
+from app.report import write_report
+
+
+@pytest.mark.asyncio
+async def test_report_streams_pages_and_summary(conn, make_run):
+    run_id, url_ids = await make_run(["a.test", "b.test"], 3)
+    await conn.execute(
+        """
+        UPDATE urls SET status = 'fetched', http_status = 200, content_size = 100
+        WHERE id = ANY($1::int[])
+        """,
+        url_ids[:2],
+    )
+    await conn.execute(
+        "INSERT INTO fetch_errors (url_id, error_type, error_msg) VALUES ($1, 'timeout', 'slow')",
+        url_ids[2],
+    )
+
+    out = io.StringIO()
+    assert await write_report(conn, run_id, out, "json")
+    report = json.loads(out.getvalue())
+    assert [page["url"] for page in report["pages"]] == [
+        f"http://{domain}/{run_id}/{i}" for domain in ("a.test", "b.test") for i in range(3)
+    ]
+    assert report["errors"][0]["error_type"] == "timeout"
+    summary = report["summary"]
+    assert summary["urls"] == 6
+    assert summary["domains"] == 2
+    assert summary["content_bytes"] == 200
+    assert summary["by_status"] == {"fetched": 2, "new": 4}
+    assert summary["by_http_status"] == {"200": 2}
+    assert summary["errors_by_type"] == {"timeout": 1}
+
+
+@pytest.mark.asyncio
+async def test_report_of_unknown_run(conn):
+    assert not await write_report(conn, "no-such-run", io.StringIO())
@@ -0,0 +1,23 @@
+"""Reference URL normalizer shared by the parser tests and benchmarks."""
+
+from urllib.parse import parse_qs, urlencode, urlparse, urlunparse
+
+
+def normalize_url_reference(url: str) -> str:
+    """Original uncached app.parser.normalize_url, the oracle for tests and benchmarks."""
+    parsed = urlparse(url)
+    scheme = parsed.scheme.lower()
+    netloc = parsed.netloc.lower()
+    if netloc.endswith(":80") and scheme == "http":
+        netloc = netloc[:-3]
+    elif netloc.endswith(":443") and scheme == "https":
+        netloc = netloc[:-4]
+    if parsed.query:
+        params = parse_qs(parsed.query)
+        query = urlencode(sorted(params.items()), doseq=True)
+    else:
+        query = ""
+    path = parsed.path
+    if path != "/" and path.endswith("/"):
+        path = path[:-1]
+    return urlunparse((scheme, netloc, path, "", query, ""))
@@ -25,9 +25,8 @@ async def test_crawl_against_static_server():
     for _ in range(30):
         try:
             conn = await asyncpg.connect(dsn)
-            with open(ROOT / "migrations/V001_init.sql") as f:
-                sql = f.read()
-            await conn.execute(sql)
+            for migration in sorted((ROOT / "migrations").glob("V*.sql")):
+                await conn.execute(migration.read_text())
             await conn.close()
             break
         except Exception:
@@ -0,0 +1,124 @@
+"""Test the DNS cache and its use by the shared HTTP client."""
+
+import asyncio
+import socket
+
+import httpcore
+import httpx
+import pytest
+
+from app.config import settings
+from app.dns_cache import DnsCache
+from app.http_client import create_client
+
+
+class StubResolver:
+    """Local resolver answering from a dict, counting lookups per host."""
+
+    def __init__(self, answers, delay=0.0):
+        self.answers = answers
+        self.delay = delay
+        self.lookups = {}
+
+    async def __call__(self, host):
+        self.lookups[host] = self.lookups.get(host, 0) + 1
+        await asyncio.sleep(self.delay)
+        answer = self.answers.get(host)
+        if answer is None:
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        return answer
+
+
+@pytest.mark.asyncio
+async def test_answers_are_cached_for_their_ttl(monkeypatch):
+    monkeypatch.setattr(settings, "dns_min_ttl", 0.0)
+    resolver = StubResolver(
+        {"a.test": (["10.0.0.1", "10.0.0.2"], 0.05), "b.test": (["10.0.0.3"], None)}
+    )
+    cache = DnsCache(resolver)
+
+    results = await asyncio.gather(*(cache.resolve("a.test") for _ in range(5)))
+    assert results == [["10.0.0.1", "10.0.0.2"]] * 5
+    assert await cache.resolve("A.TEST") == ["10.0.0.1", "10.0.0.2"]
+    assert resolver.lookups == {"a.test": 1}
+
+    # No TTL from the resolver: kept for dns_ttl
+    await cache.resolve("b.test")
+    await asyncio.sleep(0.06)
+    await cache.resolve("a.test")
+    await cache.resolve("b.test")
+    assert resolver.lookups == {"a.test": 2, "b.test": 1}
+
+    assert await cache.resolve("192.0.2.7") == ["192.0.2.7"]
+    assert await cache.resolve("::1") == ["::1"]
+
+
+@pytest.mark.asyncio
+async def test_failures_are_cached_negatively(monkeypatch):
+    monkeypatch.setattr(settings, "dns_error_ttl", 0.05)
+    resolver = StubResolver({})
+    cache = DnsCache(resolver)
+
+    for _ in range(3):
+        with pytest.raises(httpcore.ConnectError):
+            await cache.resolve("gone.test")
+    assert resolver.lookups == {"gone.test": 1}
+
+    resolver.answers["gone.test"] = (["10.0.0.9"], 60)
+    await asyncio.sleep(0.06)
+    assert await cache.resolve("gone.test") == ["10.0.0.9"]
+
+
+@pytest.mark.asyncio
+async def test_slow_lookups_time_out(monkeypatch):
+    monkeypatch.setattr(settings, "dns_timeout", 0.01)
+    cache = DnsCache(StubResolver({"slow.test": (["10.0.0.1"], 60)}, delay=1))
+    with pytest.raises(httpcore.ConnectError, match="timed out"):
+        await cache.resolve("slow.test")
+
+
+@pytest.mark.asyncio
+async def test_prefetch_and_eviction(monkeypatch):
+    monkeypatch.setattr(settings, "dns_cache_size", 2)
+    resolver = StubResolver({f"h{i}.test": ([f"10.0.0.{i}"], 60) for i in range(3)})
+    cache = DnsCache(resolver)
+
+    cache.prefetch("h0.test:8080")
+    cache.prefetch("h0.test")
+    cache.prefetch("h1.test")
+    cache.prefetch("nowhere.test")
+    await asyncio.sleep(0.01)
+    assert resolver.lookups == {"h0.test": 1, "h1.test": 1, "nowhere.test": 1}
+    assert cache.stats["prefetched"] == 3
+
+    await cache.resolve("h2.test")
+    assert len(cache) == 2
+    await cache.resolve("h2.test")
+    assert resolver.lookups["h2.test"] == 1
+
+
+@pytest.mark.asyncio
+async def test_client_connects_through_the_cache():
+    async def serve(reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(serve, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    # The first address refuses connections, so the next one is tried
+    resolver = StubResolver({"site.test": (["127.0.0.2", "127.0.0.1"], 60)})
+    cache = DnsCache(resolver)
+    client = create_client(cache)
+    try:
+        for _ in range(2):
+            response = await client.get(f"http://site.test:{port}/")
+            assert response.text == "ok"
+        with pytest.raises(httpx.ConnectError):
+            await client.get(f"http://unknown.test:{port}/")
+    finally:
+        await client.aclose()
+        server.close()
+        await server.wait_closed()
+    assert resolver.lookups == {"site.test": 1, "unknown.test": 1}
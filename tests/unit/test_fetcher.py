@@ -0,0 +1,196 @@
+"""Test streaming fetch behavior."""
+
+import socket
+import ssl
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.fetcher import FetchResult, classify_error, fetch_url, parse_retry_after
+
+
+class _ChunkStream(httpx.AsyncByteStream):
+    """Endless body that records how many chunks were pulled."""
+
+    def __init__(self, chunk: bytes):
+        self.chunk = chunk
+        self.sent = 0
+
+    async def __aiter__(self):
+        while True:
+            self.sent += 1
+            yield self.chunk
+
+
+def _client(handler):
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+@pytest.mark.asyncio
+async def test_fetch_html():
+    body = b"<html><a href='/x'>x</a></html>"
+
+    def handler(request):
+        return httpx.Response(200, headers={"content-type": "text/html"}, content=body)
+
+    async with _client(handler) as client:
+        assert await fetch_url("http://a.test/", client) == FetchResult(200, body, "text/html")
+
+
+@pytest.mark.asyncio
+async def test_fetch_aborts_non_html_before_body():
+    stream = _ChunkStream(b"\0" * 1024)
+
+    def handler(request):
+        return httpx.Response(200, headers={"content-type": "video/mp4"}, stream=stream)
+
+    async with _client(handler) as client:
+        result = await fetch_url("http://a.test/v.mp4", client)
+
+    assert result == FetchResult(200, None, "video/mp4")
+    assert stream.sent == 0
+
+
+@pytest.mark.asyncio
+async def test_fetch_aborts_on_declared_length(monkeypatch):
+    monkeypatch.setattr(settings, "max_body_size", 1024)
+    stream = _ChunkStream(b"a" * 1024)
+
+    def handler(request):
+        headers = {"content-type": "text/html", "content-length": str(10 * 1024 * 1024)}
+        return httpx.Response(200, headers=headers, stream=stream)
+
+    async with _client(handler) as client:
+        assert await fetch_url("http://a.test/", client) == FetchResult(200, None, "text/html")
+    assert stream.sent == 0
+
+
+@pytest.mark.asyncio
+async def test_fetch_aborts_once_body_exceeds_limit(monkeypatch):
+    monkeypatch.setattr(settings, "max_body_size", 4096)
+    monkeypatch.setattr(settings, "fetch_chunk_size", 1024)
+    stream = _ChunkStream(b"a" * 1024)
+
+    def handler(request):
+        return httpx.Response(200, headers={"content-type": "text/html"}, stream=stream)
+
+    async with _client(handler) as client:
+        assert await fetch_url("http://a.test/", client) == FetchResult(200, None, "text/html")
+    assert stream.sent == 5
+
+
+@pytest.mark.asyncio
+async def test_conditional_fetch_returns_304_without_body():
+    stream = _ChunkStream(b"a" * 1024)
+    seen_headers = {}
+
+    def handler(request):
+        seen_headers.update(request.headers)
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304, headers={"etag": '"v1"'}, stream=stream)
+        return httpx.Response(200, headers={"content-type": "text/html"}, content=b"<html>")
+
+    async with _client(handler) as client:
+        result = await fetch_url(
+            "http://a.test/", client, etag='"v1"', last_modified="Mon, 01 Jan 2024 00:00:00 GMT"
+        )
+
+    assert result.not_modified
+    assert result == FetchResult(304, etag='"v1"')
+    assert seen_headers["if-modified-since"] == "Mon, 01 Jan 2024 00:00:00 GMT"
+    assert stream.sent == 0
+
+
+@pytest.mark.asyncio
+async def test_fetch_returns_validators():
+    headers = {
+        "content-type": "text/html",
+        "etag": '"v2"',
+        "last-modified": "Tue, 02 Jan 2024 00:00:00 GMT",
+    }
+
+    def handler(request):
+        assert "if-none-match" not in request.headers
+        return httpx.Response(200, headers=headers, content=b"<html>")
+
+    async with _client(handler) as client:
+        result = await fetch_url("http://a.test/", client)
+
+    assert result.etag == '"v2"'
+    assert result.last_modified == "Tue, 02 Jan 2024 00:00:00 GMT"
+    assert result.content == b"<html>"
+
+
+@pytest.mark.asyncio
+async def test_throttled_response_carries_retry_after():
+    def handler(request):
+        if request.url.path == "/busy":
+            return httpx.Response(429, headers={"retry-after": "7"})
+        return httpx.Response(503)
+
+    async with _client(handler) as client:
+        busy = await fetch_url("http://a.test/busy", client)
+        down = await fetch_url("http://a.test/down", client)
+
+    assert busy.throttled and busy.retry_after == 7
+    assert down.throttled and down.retry_after is None
+    assert busy.seconds >= 0
+
+
+def test_parse_retry_after(monkeypatch):
+    monkeypatch.setattr(settings, "retry_after_max", 600)
+    assert parse_retry_after("120") == 120
+    assert parse_retry_after("86400") == 600
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+
+    later = datetime.now(timezone.utc) + timedelta(seconds=60)
+    assert 55 < parse_retry_after(format_datetime(later, usegmt=True)) <= 60
+    earlier = datetime.now(timezone.utc) - timedelta(seconds=60)
+    assert parse_retry_after(format_datetime(earlier, usegmt=True)) == 0
+
+
+def _caused(exc, cause):
+    try:
+        raise exc from cause
+    except httpx.RequestError as e:
+        return e
+
+
+@pytest.mark.parametrize(
+    "exc, error",
+    [
+        (httpx.ConnectTimeout("timed out"), "connect_timeout"),
+        (httpx.ReadTimeout("timed out"), "read_timeout"),
+        (httpx.PoolTimeout("timed out"), "timeout"),
+        (_caused(httpx.ConnectError("x"), socket.gaierror(-2, "Name unknown")), "dns"),
+        (httpx.ConnectError("DNS lookup of a.test failed: timed out"), "dns"),
+        (_caused(httpx.ConnectError("x"), ssl.SSLCertVerificationError()), "tls"),
+        (_caused(httpx.ConnectError("x"), ConnectionRefusedError()), "connection_refused"),
+        (httpx.ConnectError("All connection attempts failed"), "connect_error"),
+        (httpx.ReadError("Connection reset by peer"), "connection_reset"),
+        (httpx.RemoteProtocolError("Server disconnected"), "protocol_error"),
+        (httpx.TooManyRedirects("too many"), "too_many_redirects"),
+        (httpx.UnsupportedProtocol("ftp"), "invalid_url"),
+    ],
+)
+def test_classify_error(exc, error):
+    assert classify_error(exc) == error
+
+
+@pytest.mark.asyncio
+async def test_failed_fetch_reports_error_type():
+    # Nothing listens on a port the OS just handed out and released
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    async with httpx.AsyncClient() as client:
+        result = await fetch_url(f"http://127.0.0.1:{port}/", client)
+
+    assert result.status_code == 0
+    assert result.error == "connection_refused"
+    assert result.error_msg
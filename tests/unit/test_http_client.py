@@ -0,0 +1,47 @@
+"""Test the shared HTTP client transport."""
+
+import asyncio
+
+import httpx
+import pytest
+
+from app.http_client import HostLimitedTransport
+
+
+@pytest.mark.asyncio
+async def test_host_limited_transport_caps_per_host():
+    active = {}
+    peak = {}
+
+    async def handler(request):
+        host = request.url.host
+        active[host] = active.get(host, 0) + 1
+        peak[host] = max(peak.get(host, 0), active[host])
+        await asyncio.sleep(0.01)
+        active[host] -= 1
+        # Stream the body like a real transport so the slot is freed on close
+        return httpx.Response(200, stream=httpx.ByteStream(b"ok"))
+
+    transport = HostLimitedTransport(httpx.MockTransport(handler), max_per_host=2)
+    async with httpx.AsyncClient(transport=transport) as client:
+        urls = [f"http://a.test/{i}" for i in range(6)] + [f"http://b.test/{i}" for i in range(6)]
+        responses = await asyncio.gather(*(client.get(u) for u in urls))
+
+    assert all(r.status_code == 200 for r in responses)
+    assert peak == {"a.test": 2, "b.test": 2}
+    # Idle hosts are forgotten once their responses are closed
+    assert transport._slots == {}
+
+
+@pytest.mark.asyncio
+async def test_host_limited_transport_releases_on_error():
+    def handler(request):
+        raise httpx.ConnectError("refused", request=request)
+
+    transport = HostLimitedTransport(httpx.MockTransport(handler), max_per_host=1)
+    async with httpx.AsyncClient(transport=transport) as client:
+        for _ in range(3):
+            with pytest.raises(httpx.ConnectError):
+                await client.get("http://a.test/")
+
+    assert transport._slots == {}
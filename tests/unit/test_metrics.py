@@ -0,0 +1,67 @@
+"""Test counters, histograms and their Prometheus export."""
+
+import urllib.request
+
+from app.metrics import Counter, Gauge, Histogram, Registry, merge, render, start_server
+
+
+def make_registry():
+    registry = Registry()
+    pages = registry.register(Counter("pages_total", "Pages", ["outcome"]))
+    latency = registry.register(Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0)))
+    depth = registry.register(Gauge("depth", "Depth"))
+    return registry, pages, latency, depth
+
+
+def test_renders_prometheus_text():
+    registry, pages, latency, depth = make_registry()
+    pages.inc("fetched")
+    pages.inc("fetched", amount=2)
+    pages.inc('we"ird')
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value)
+    depth.set_function(lambda: 7)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE pages_total counter" in lines
+    assert 'pages_total{outcome="fetched"} 3' in lines
+    assert 'pages_total{outcome="we\\"ird"} 1' in lines
+    # Buckets are cumulative and inclusive of their upper bound
+    assert 'latency_seconds_bucket{le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{le="1.0"} 3' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 4' in lines
+    assert "latency_seconds_sum 3.65" in lines
+    assert "latency_seconds_count 4" in lines
+    assert "depth 7" in lines
+
+
+def test_merges_snapshots_from_several_processes():
+    first, pages, latency, _ = make_registry()
+    pages.inc("fetched")
+    latency.observe(0.5)
+    second, pages, latency, _ = make_registry()
+    pages.inc("fetched")
+    pages.inc("error")
+    latency.observe(0.05)
+
+    merged = merge([first.snapshot(), second.snapshot()])
+    text = render(merged)
+    assert 'pages_total{outcome="fetched"} 2' in text
+    assert 'pages_total{outcome="error"} 1' in text
+    assert "latency_seconds_count 2" in text
+    # Inputs are left untouched
+    assert first.snapshot()["pages_total"]["samples"][0]["value"] == 1
+
+
+def test_serves_metrics_over_http():
+    registry, pages, _, _ = make_registry()
+    pages.inc("fetched")
+    server = start_server("127.0.0.1", 0, registry.render)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert 'pages_total{outcome="fetched"} 1' in response.read().decode()
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -1,6 +1,9 @@
 """Test URL normalization."""
 import pytest
-from app.parser import normalize_url
+from hypothesis import given, settings, strategies as st
+
+from app.parser import normalize_cache_stats, normalize_url
+from normalize_reference import normalize_url_reference
 
 
 @pytest.mark.parametrize("input_url,expected", [
@@ -40,4 +43,55 @@ from app.parser import normalize_url
     ),
 ])
 def test_normalize_url(input_url, expected):
-    assert normalize_url(input_url) == expected
\ No newline at end of file
+    assert normalize_url(input_url) == expected
+
+_QUERY_CHARS = "abcAB019_.-~+%=&;/ é"
+_PATH_CHARS = "abcAB019_.-~%;/:@ é"
+
+query_parts = st.lists(
+    st.tuples(st.text(_QUERY_CHARS, max_size=6), st.text(_QUERY_CHARS, max_size=6)),
+    max_size=5,
+)
+
+
+@st.composite
+def urls(draw):
+    scheme = draw(st.sampled_from(["http", "https", "HTTP", "Https"]))
+    host = draw(st.sampled_from(["example.com", "Example.COM", "a.b.test", "[::1]"]))
+    port = draw(st.sampled_from(["", ":80", ":443", ":8080"]))
+    path = draw(st.text(_PATH_CHARS, max_size=20))
+    pairs = draw(query_parts)
+    if draw(st.booleans()):
+        pairs = sorted(pairs)
+    query = "&".join(f"{k}={v}" if draw(st.booleans()) else k for k, v in pairs)
+    fragment = draw(st.sampled_from(["", "#", "#frag"]))
+    return f"{scheme}://{host}{port}/{path}{'?' + query if query else ''}{fragment}"
+
+
+@given(urls())
+@settings(max_examples=500)
+def test_normalize_url_matches_reference(url):
+    assert normalize_url(url) == normalize_url_reference(url)
+    # Cached results are identical too
+    assert normalize_url(url) == normalize_url_reference(url)
+
+
+@given(st.text(max_size=60))
+def test_normalize_url_matches_reference_on_arbitrary_text(text):
+    try:
+        expected = normalize_url_reference(text)
+    except ValueError:
+        with pytest.raises(ValueError):
+            normalize_url(text)
+        return
+    assert normalize_url(text) == expected
+
+
+def test_normalize_cache_stats():
+    normalize_url.cache_clear()
+    for _ in range(3):
+        normalize_url("http://example.com/cached?a=1&b=2")
+    stats = normalize_cache_stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == pytest.approx(2 / 3)
@@ -1,4 +1,6 @@
 """Test HTML parsing and link extraction."""
+from pathlib import Path
+
 import pytest
 from app.parser import parse_and_extract_links
 
@@ -28,4 +30,42 @@ def test_extract_links_invalid_html():
     base_url = "http://example.com"
     links = parse_and_extract_links(html, base_url)
     
-    assert len(links) == 0
\ No newline at end of file
+    assert len(links) == 0
+
+TRICKY_HTML = [
+    '<a href="x" href="y">',
+    '<A HREF=" /Upper ">',
+    "<a href>",
+    '<a href="/q?b=2&amp;a=1#frag">',
+    '<script><a href="/in-script"></script><a href="/after">',
+    '<style><a href="/in-style"></style>',
+    '<!-- <a href="/commented"> -->',
+    '<a href="/unterminated"',
+    "<a href=/unquoted/>",
+    '<a href="/a"/><a href="/b">',
+    '<textarea><a href="/in-textarea"></textarea>',
+    '<a href="&#x2F;charref">',
+    '<svg><a href="/svg"/></svg>',
+    "<a data-href=\"/no\" href='/single'>",
+    '<a/href="/slash">',
+    '<a href="https://other.example.com:443/x/">',
+    '<a href="javascript:void(0)"><a href="ftp://x/"><a href="//proto.example.com/rel">',
+    "<html><not-closed>",
+]
+
+
+@pytest.mark.parametrize("html", TRICKY_HTML)
+def test_fast_engine_matches_bs4(html):
+    base_url = "http://example.com/dir/page.html"
+    assert parse_and_extract_links(html, base_url, engine="fast") == parse_and_extract_links(
+        html, base_url, engine="bs4"
+    )
+
+
+def test_fast_engine_matches_bs4_on_fixtures():
+    for path in (Path(__file__).parents[1] / "fixtures").glob("*.html"):
+        html = path.read_text()
+        base_url = f"http://localhost:8000/{path.name}"
+        assert parse_and_extract_links(html, base_url, engine="fast") == parse_and_extract_links(
+            html, base_url, engine="bs4"
+        )
@@ -0,0 +1,44 @@
+"""Test page processing and the process pool."""
+
+import asyncio
+import hashlib
+
+import pytest
+
+from app.config import settings
+from app.processing import PagePool, process_page
+
+HTML = b'<html><a href="/a">A</a><a href="http://other.test/b?y=2&x=1">B</a></html>'
+
+
+def test_process_page():
+    result = process_page(HTML, "http://example.com/", "fast")
+    assert sorted(result.links) == [
+        ("http://example.com/a", "http://example.com/a", "example.com"),
+        ("http://other.test/b?x=1&y=2", "http://other.test/b?x=1&y=2", "other.test"),
+    ]
+    assert result.content_hash == hashlib.sha256(HTML).hexdigest()
+
+
+def test_process_page_tolerates_invalid_utf8():
+    result = process_page(b'<a href="/caf\xe9">x</a>', "http://example.com/", "fast")
+    assert len(result.links) == 1
+
+
+@pytest.mark.asyncio
+async def test_pool_matches_inline(monkeypatch):
+    monkeypatch.setattr(settings, "parse_workers", 2)
+    monkeypatch.setattr(settings, "parse_batch_size", 4)
+    pages = [(HTML + f'<a href="/p{i}">'.encode(), f"http://example.com/{i}") for i in range(10)]
+
+    pool = PagePool()
+    pool.start()
+    try:
+        results = await asyncio.gather(*(pool.process(content, url) for content, url in pages))
+    finally:
+        await pool.close()
+
+    expected = [process_page(content, url, settings.link_extractor) for content, url in pages]
+    # Link order follows set iteration, which differs between processes
+    assert [sorted(r.links) for r in results] == [sorted(e.links) for e in expected]
+    assert [r.content_hash for r in results] == [e.content_hash for e in expected]
@@ -0,0 +1,69 @@
+"""Test adaptive per-host crawl delays."""
+
+import pytest
+
+from app.config import settings
+from app.fetcher import FetchResult
+from app.rate_control import RateController
+
+
+@pytest.fixture(autouse=True)
+def rate_settings(monkeypatch):
+    for name, value in {
+        "rate_control": True,
+        "default_crawl_delay": 1.0,
+        "rate_min_delay": 0.25,
+        "rate_max_delay": 10.0,
+        "rate_increase": 1.0,
+        "rate_backoff_factor": 2.0,
+        "rate_slow_seconds": 2.0,
+    }.items():
+        monkeypatch.setattr(settings, name, value)
+
+
+def _ok(seconds=0.1):
+    return FetchResult(200, seconds=seconds)
+
+
+def test_fast_healthy_host_speeds_up_to_the_floor():
+    controller = RateController()
+    # 1 page/s, then 2, 3 and 4, which is rate_min_delay
+    delays = [controller.update("a.com", _ok(), None) for _ in range(5)]
+    assert delays == pytest.approx([0.5, 1 / 3, 0.25, 0.25, 0.25])
+
+    # A 404 is a healthy answer too
+    assert controller.update("a.com", FetchResult(404), None) == 0.25
+
+
+def test_slow_or_failing_host_backs_off():
+    controller = RateController()
+    assert controller.update("a.com", _ok(seconds=3), None) == 2
+    assert controller.update("a.com", FetchResult(500), None) == 4
+    assert controller.update("a.com", FetchResult(0), None) == 8
+    assert controller.update("a.com", FetchResult(502), None) == 10
+    # Recovers additively
+    assert controller.update("a.com", _ok(), None) == pytest.approx(1 / 1.1)
+    assert len(controller) == 1
+
+
+def test_throttling_honours_retry_after():
+    controller = RateController()
+    assert controller.update("a.com", FetchResult(429, retry_after=30), None) == 30
+    # The Retry-After is one-off; the host continues from its backed-off delay
+    assert controller.update("a.com", _ok(), None) == pytest.approx(2 / 3)
+    assert controller.update("b.com", FetchResult(503), None) == 2
+
+
+def test_robots_crawl_delay_is_a_floor():
+    controller = RateController()
+    assert controller.update("a.com", _ok(), 5.0) == 5.0
+    assert len(controller) == 0
+    assert controller.update("a.com", FetchResult(500), 5.0) == 10.0
+
+
+def test_disabled_keeps_the_configured_delay(monkeypatch):
+    monkeypatch.setattr(settings, "rate_control", False)
+    controller = RateController()
+    assert controller.update("a.com", _ok(), None) == 1.0
+    assert controller.update("a.com", FetchResult(500), 3.0) == 3.0
+    assert controller.update("a.com", FetchResult(429, retry_after=30), None) == 30
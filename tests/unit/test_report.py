@@ -0,0 +1,67 @@
+"""Test streaming report output."""
+
+import gzip
+import io
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from app.report import ReportWriter, open_output
+
+
+async def rows(items):
+    for item in items:
+        yield item
+
+
+HEADER = {"run_id": "r1", "started_at": datetime(2024, 1, 2, tzinfo=timezone.utc)}
+PAGES = [
+    {"url": "http://a.test/", "status": "fetched"},
+    {"url": "http://a.test/x", "status": "new"},
+]
+
+
+@pytest.mark.asyncio
+async def test_json_report_is_one_document():
+    out = io.StringIO()
+    writer = ReportWriter(out, "json")
+    writer.header(HEADER)
+    assert await writer.section("pages", "page", rows(PAGES)) == 2
+    assert await writer.section("errors", "error", rows([])) == 0
+    writer.close()
+
+    report = json.loads(out.getvalue())
+    assert report["run_id"] == "r1"
+    assert report["started_at"] == "2024-01-02T00:00:00+00:00"
+    assert report["pages"] == PAGES
+    assert report["errors"] == []
+
+
+@pytest.mark.asyncio
+async def test_ndjson_report_has_one_record_per_line():
+    out = io.StringIO()
+    writer = ReportWriter(out, "ndjson")
+    writer.header(HEADER)
+    await writer.section("pages", "page", rows(PAGES))
+    await writer.section("errors", "error", rows([{"url": "http://a.test/x"}]))
+    writer.close()
+
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [r["type"] for r in records] == ["run", "page", "page", "error"]
+    assert records[1]["url"] == "http://a.test/"
+
+
+def test_gz_paths_are_compressed(tmp_path):
+    for name, compress, compressed in (
+        ("r.json.gz", None, True),
+        ("r.json", None, False),
+        ("r.json", True, True),
+    ):
+        path = tmp_path / name
+        with open_output(path, compress) as f:
+            f.write('{"a": 1}\n')
+        data = path.read_bytes()
+        if compressed:
+            data = gzip.decompress(data)
+        assert json.loads(data) == {"a": 1}
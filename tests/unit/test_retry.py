@@ -0,0 +1,29 @@
+"""Test the retry policy for failed fetches."""
+
+import pytest
+
+from app.config import settings
+from app.fetcher import FetchResult
+from app.retry import backoff_delay, is_transient
+
+
+def test_transient_failures():
+    assert is_transient(FetchResult(0, error="read_timeout"))
+    assert is_transient(FetchResult(0, error="dns"))
+    assert is_transient(FetchResult(503))
+    assert is_transient(FetchResult(429))
+    assert not is_transient(FetchResult(0, error="tls"))
+    assert not is_transient(FetchResult(0, error="too_many_redirects"))
+    assert not is_transient(FetchResult(500))
+    assert not is_transient(FetchResult(404))
+    assert not is_transient(FetchResult(200))
+
+
+def test_backoff_doubles_with_jitter_up_to_the_cap(monkeypatch):
+    monkeypatch.setattr(settings, "retry_base_delay", 10.0)
+    monkeypatch.setattr(settings, "retry_max_delay", 60.0)
+    for attempt, ceiling in [(1, 10), (2, 20), (3, 40), (4, 60), (10, 60)]:
+        delays = [backoff_delay(attempt) for _ in range(200)]
+        assert all(ceiling / 2 <= delay <= ceiling for delay in delays)
+        assert len(set(delays)) > 1
+    assert min(backoff_delay(4) for _ in range(200)) == pytest.approx(30, abs=3)
@@ -0,0 +1,95 @@
+"""Test the in-memory host scheduler."""
+
+import asyncio
+
+import pytest
+
+from app.scheduler import HostScheduler
+
+
+@pytest.mark.asyncio
+async def test_hands_out_each_host_once_at_a_time():
+    scheduler = HostScheduler()
+    scheduler.add("a.com", 2)
+    scheduler.add("b.com")
+    assert len(scheduler) == 2
+    assert scheduler.pending == 3
+
+    first = await scheduler.next_host()
+    second = await scheduler.next_host()
+    assert {first, second} == {"a.com", "b.com"}
+
+    # Both hosts are in flight, so nothing is ready until one is released
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(scheduler.next_host(), 0.05)
+
+    scheduler.release("a.com")
+    assert await scheduler.next_host() == "a.com"
+
+
+@pytest.mark.asyncio
+async def test_finished_once_all_work_is_released():
+    scheduler = HostScheduler()
+    assert scheduler.finished
+    assert await scheduler.next_host() is None
+
+    scheduler.add("a.com")
+    assert not scheduler.finished
+    host = await scheduler.next_host()
+    assert not scheduler.finished  # still in flight
+    scheduler.release(host)
+    assert scheduler.finished
+    assert len(scheduler) == 0
+
+
+@pytest.mark.asyncio
+async def test_release_without_fetch_drops_host():
+    scheduler = HostScheduler()
+    scheduler.add("a.com", 5)
+    host = await scheduler.next_host()
+    scheduler.release(host, fetched=False)
+    assert scheduler.finished
+    assert scheduler.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_postpone_keeps_host_until_its_urls_are_due():
+    scheduler = HostScheduler()
+    scheduler.add("a.com", 2)
+    host = await scheduler.next_host()
+    scheduler.postpone(host, 0.1)
+    assert not scheduler.finished
+    assert scheduler.pending == 2
+
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(scheduler.next_host(), 0.05)
+    assert await asyncio.wait_for(scheduler.next_host(), 0.2) == "a.com"
+
+
+@pytest.mark.asyncio
+async def test_delay_orders_hosts_by_next_fetch_time():
+    scheduler = HostScheduler()
+    scheduler.add("slow.com", 2)
+    assert await scheduler.next_host() == "slow.com"
+    scheduler.release("slow.com", delay=0.2)
+    scheduler.add("fast.com")
+
+    assert await scheduler.next_host() == "fast.com"
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    assert await scheduler.next_host() == "slow.com"
+    assert loop.time() - started >= 0.1
+
+
+@pytest.mark.asyncio
+async def test_adding_work_wakes_a_waiting_caller():
+    scheduler = HostScheduler()
+    scheduler.add("a.com")
+    host = await scheduler.next_host()
+    waiter = asyncio.create_task(scheduler.next_host())
+    await asyncio.sleep(0.01)
+    assert not waiter.done()
+
+    scheduler.add("b.com")
+    assert await asyncio.wait_for(waiter, 1) == "b.com"
+    scheduler.release(host)
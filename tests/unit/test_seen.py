@@ -0,0 +1,72 @@
+"""Test the seen-URL filter."""
+
+from app.seen import SeenFilter
+
+
+def test_exact_mode_has_no_false_positives():
+    seen = SeenFilter(memory_bytes=1024 * 1024, fp_rate=0.01)
+    assert seen.add("http://example.com/a")
+    assert not seen.add("http://example.com/a")
+    assert "http://example.com/a" in seen
+    assert "http://example.com/b" not in seen
+    stats = seen.stats()
+    assert stats["mode"] == "exact"
+    assert stats["urls"] == 1
+    assert stats["false_positive_rate"] == 0.0
+    assert stats["memory_bytes"] == 72
+
+
+def test_switches_to_bloom_within_budget():
+    seen = SeenFilter(memory_bytes=64 * 1024, fp_rate=0.001)
+    urls = [f"http://example.com/page/{i}" for i in range(5000)]
+    for url in urls:
+        seen.add(url)
+
+    stats = seen.stats()
+    assert stats["mode"] == "bloom"
+    assert stats["memory_bytes"] <= 64 * 1024
+    # Every URL added so far is still known
+    assert all(url in seen for url in urls)
+    # The most recent ones are confirmed exactly; older ones need the database
+    assert all(seen.add(url) is False for url in urls[-seen.recent_size :])
+    assert seen.add(urls[0]) is None
+
+    unseen = [f"http://example.com/other/{i}" for i in range(20000)]
+    false_positives = sum(url in seen for url in unseen)
+    assert false_positives / len(unseen) < 10 * max(stats["false_positive_rate"], 0.001)
+
+
+def test_round_trips_through_bytes():
+    for memory_bytes in (1024 * 1024, 4 * 1024):  # exact, then bloom
+        seen = SeenFilter(memory_bytes=memory_bytes, fp_rate=0.01)
+        urls = [f"http://example.com/page/{i}" for i in range(500)]
+        for url in urls:
+            seen.add(url)
+
+        restored = SeenFilter.from_bytes(seen.copy().to_bytes())
+        for key in ("mode", "urls", "false_positive_rate"):
+            assert restored.stats()[key] == seen.stats()[key]
+        assert all(url in restored for url in urls)
+        assert restored.add("http://example.com/new")
+
+
+def test_bloom_hits_need_confirmation_to_drop_a_url():
+    seen = SeenFilter(memory_bytes=4096, fp_rate=0.5, recent_size=5)
+    urls = [f"http://example.com/page/{i}" for i in range(80000)]
+    for url in urls:
+        seen.add(url)
+    assert seen.stats()["mode"] == "bloom"
+
+    # A tiny, overfull filter answers "seen" for nearly everything ...
+    unseen = [f"http://example.com/other/{i}" for i in range(200)]
+    assert sum(url in seen for url in unseen) > 150
+    # ... but without an exact confirmation no new URL is reported as known
+    before = seen.stats()["unconfirmed_hits"]
+    added = [seen.add(url) for url in unseen]
+    assert False not in added
+    assert added.count(None) == seen.stats()["unconfirmed_hits"] - before > 150
+
+    # Recently seen URLs are confirmed exactly and dropped
+    assert not any(seen.add(url) for url in unseen[-5:])
+    assert seen.stats()["recent_urls"] == 5
+    assert seen.stats()["memory_bytes"] <= 4096
@@ -0,0 +1,446 @@
+"""Test the SQLite frontier and a crawl that uses it instead of Postgres."""
+
+import io
+import json
+
+import httpx
+import pytest
+import pytest_asyncio
+
+from app.config import settings
+from app.frontier import create_frontier
+from app.runner import Runner
+from app.seen import SeenFilter
+from app.sqlite_frontier import SqliteFrontier
+
+RUN = "run-1"
+OWNER = "owner-1"
+
+
+@pytest_asyncio.fixture
+async def frontier(tmp_path):
+    frontier = SqliteFrontier(str(tmp_path / "crawler.db"))
+    await frontier.create_run(RUN, "http://example.com/")
+    yield frontier
+    await frontier.close()
+
+
+def _link(path, domain="example.com", enqueue=True):
+    url = f"http://{domain}{path}"
+    return url, url, domain, enqueue
+
+
+async def _lease_all(frontier, domain="example.com"):
+    return await frontier.lease_batch(RUN, domain, OWNER, 100, 60)
+
+
+@pytest.mark.asyncio
+async def test_links_are_queued_once_and_leased_in_order(frontier):
+    links = [_link("/a"), _link("/b"), _link("/a"), _link("/x", "other.com", enqueue=False)]
+    queued, _ = await frontier.write_batch(RUN, OWNER, links, [], [], [], [], [])
+    assert [domain for _, domain in queued] == ["example.com", "example.com"]
+
+    links = [_link("/b"), _link("/c")]
+    again, _ = await frontier.write_batch(RUN, OWNER, links, [], [], [], [], [])
+    assert len(again) == 1
+    assert await frontier.queued_domains(RUN) == [("example.com", 4)]
+
+    items = await _lease_all(frontier)
+    urls = [(await frontier.get_url(item.url_id))["url"] for item in items]
+    assert urls == [
+        "http://example.com/",
+        "http://example.com/a",
+        "http://example.com/b",
+        "http://example.com/c",
+    ]
+    assert all(item.lease_owner == OWNER for item in items)
+    assert await frontier.queued_domains(RUN) == []
+    assert await frontier.count_leased(RUN) == 4
+    assert await frontier.count_leased(RUN, "someone-else") == 0
+
+
+@pytest.mark.asyncio
+async def test_batch_records_results_and_acks(frontier):
+    (seed,) = await _lease_all(frontier)
+    fetched = [(seed.url_id, "fetched", 200, "text/html", 10, '"v1"', None, "abc")]
+    _, acked = await frontier.write_batch(
+        RUN, OWNER, [], fetched, [], [(seed.url_id, "k")], [seed.url_id], []
+    )
+    assert acked == 1
+
+    row = await frontier.get_url(seed.url_id)
+    assert (row["status"], row["http_status"], row["etag"], row["stored_object_key"]) == (
+        "fetched",
+        200,
+        '"v1"',
+        "k",
+    )
+    assert row["fetch_attempts"] == 1
+    assert await frontier.count_leased(RUN) == 0
+
+    await frontier.write_batch(RUN, OWNER, [_link("/broken")], [], [], [], [], [])
+    (item,) = await _lease_all(frontier)
+    _, acked = await frontier.write_batch(
+        RUN,
+        "not-the-owner",
+        [],
+        [],
+        [(item.url_id, "timeout", "Timed out")],
+        [],
+        [item.url_id],
+        [],
+    )
+    assert acked == 0
+    assert (await frontier.get_url(item.url_id))["status"] == "error"
+
+
+@pytest.mark.asyncio
+async def test_retries_return_to_queue_when_due(frontier):
+    (seed,) = await _lease_all(frontier)
+    assert await frontier.next_due(RUN, "example.com") is None
+
+    retries = [(seed.url_id, None, 60, "read_timeout", "timed out")]
+    queued, _ = await frontier.write_batch(RUN, OWNER, [], [], [], [], [], retries)
+    assert queued == [(seed.url_id, "example.com")]
+    row = await frontier.get_url(seed.url_id)
+    assert (row["status"], row["http_status"], row["fetch_attempts"]) == ("new", None, 1)
+    errors = await frontier._call(
+        lambda db: db.execute("SELECT url_id, error_type FROM fetch_errors").fetchall()
+    )
+    assert [tuple(error) for error in errors] == [(seed.url_id, "read_timeout")]
+
+    # Queued but not due: not leased, and the host knows how long to wait
+    assert await frontier.queued_domains(RUN) == [("example.com", 1)]
+    assert await _lease_all(frontier) == []
+    assert 59 < await frontier.next_due(RUN, "example.com") <= 60
+
+    # Only the lease owner puts a URL back
+    await frontier.write_batch(RUN, OWNER, [_link("/a")], [], [], [], [], [])
+    (item,) = await _lease_all(frontier)
+    queued, _ = await frontier.write_batch(
+        RUN, "not-the-owner", [], [], [], [], [], [(item.url_id, 503, 0, None, None)]
+    )
+    assert queued == []
+
+
+@pytest.mark.asyncio
+async def test_expired_and_released_leases_return_to_queue(frontier):
+    await frontier.write_batch(RUN, OWNER, [_link("/a")], [], [], [], [], [])
+    first, _ = await frontier.lease_batch(RUN, "example.com", OWNER, 2, -1)
+    assert await frontier.count_leased(RUN) == 0
+    assert await frontier.heartbeat(OWNER, [first.url_id], 60) == 1
+    assert await frontier.reclaim_expired(RUN) == ["example.com"]
+    assert await frontier.queued_domains(RUN) == [("example.com", 1)]
+
+    assert await frontier.release_leases(OWNER) == 1
+    assert await frontier.queued_domains(RUN) == [("example.com", 2)]
+
+
+@pytest.mark.asyncio
+async def test_resume_drops_finished_urls_and_clears_leases(frontier):
+    await frontier.write_batch(RUN, OWNER, [_link("/a")], [], [], [], [], [])
+    seed, other = await _lease_all(frontier)
+    # Results written, ack lost in the crash
+    fetched = [(seed.url_id, "fetched", 200, "text/plain", 1, None, None, None)]
+    await frontier.write_batch(RUN, OWNER, [], fetched, [], [], [], [])
+
+    await frontier.resume_run(RUN)
+    items = await _lease_all(frontier)
+    assert [item.url_id for item in items] == [other.url_id]
+
+    with pytest.raises(ValueError):
+        await frontier.resume_run("missing")
+
+
+@pytest.mark.asyncio
+async def test_recrawl_drops_the_key_of_a_changed_page(frontier):
+    await frontier.write_batch(RUN, OWNER, [_link("/a")], [], [], [], [], [])
+    seed, page = await _lease_all(frontier)
+    fetched = [
+        (item.url_id, "fetched", 200, "text/html", 10, None, None, f"old-{i}")
+        for i, item in enumerate((seed, page))
+    ]
+    stored = [(seed.url_id, "k-seed"), (page.url_id, "k-page")]
+    await frontier.write_batch(RUN, OWNER, [], fetched, [], stored, [seed.url_id, page.url_id], [])
+
+    await frontier.create_run("run-2", "http://example.com/", recrawl_of=RUN)
+    seed, page = await frontier.lease_batch("run-2", "example.com", OWNER, 100, 60)
+    # The seed is unchanged; the page changed and its upload failed before the ack
+    fetched = [
+        (seed.url_id, "unchanged", 304, None, None, None, None, None),
+        (page.url_id, "fetched", 200, "text/html", 12, None, None, "new"),
+    ]
+    await frontier.write_batch("run-2", OWNER, [], fetched, [], [], [seed.url_id], [])
+    assert (await frontier.get_url(seed.url_id))["stored_object_key"] == "k-seed"
+    row = await frontier.get_url(page.url_id)
+    assert (row["content_hash"], row["stored_object_key"]) == ("new", None)
+
+    # So a resume fetches it again instead of taking it for finished
+    await frontier.resume_run("run-2")
+    items = await frontier.lease_batch("run-2", "example.com", OWNER, 100, 60)
+    assert [item.url_id for item in items] == [page.url_id]
+
+
+@pytest.mark.asyncio
+async def test_checkpoints_and_finish(frontier):
+    await frontier.write_batch(RUN, OWNER, [_link("/a"), _link("/b")], [], [], [], [], [])
+    seen = SeenFilter(1024 * 1024, 0.001)
+    seen.add("http://example.com/a")
+    max_url_id = await frontier.max_url_id()
+    await frontier.save_checkpoint(RUN, 0, 1, max_url_id, seen.to_bytes(), {"fetched": 3})
+
+    checkpoint = await frontier.load_checkpoint(RUN, 0, 1)
+    assert checkpoint["max_url_id"] == max_url_id
+    assert json.loads(checkpoint["stats"]) == {"fetched": 3}
+    assert "http://example.com/a" in SeenFilter.from_bytes(checkpoint["seen_filter"])
+    assert checkpoint["created_at"].tzinfo is not None
+    assert await frontier.load_checkpoint(RUN, 0, 2) is None
+
+    await frontier.write_batch(RUN, OWNER, [_link("/c")], [], [], [], [], [])
+    assert [url async for url, _ in frontier.iter_urls(RUN, max_url_id)] == ["http://example.com/c"]
+
+    await frontier.finish_run(RUN, {"m": 1})
+    assert await frontier.load_checkpoint(RUN, 0, 1) is None
+
+
+@pytest.mark.asyncio
+async def test_domains(frontier):
+    assert await frontier.get_domains(["example.com"]) == []
+    await frontier.save_crawl_delay("example.com", 2.5)
+    (row,) = await frontier.get_domains(["example.com"])
+    assert row["crawl_delay_seconds"] == 2.5
+    assert row["age"] is None
+
+    await frontier.save_robots("example.com", "User-agent: *\nDisallow: /private")
+    (row,) = await frontier.get_domains(["example.com", "other.com"])
+    assert row["robots_txt"].endswith("/private")
+    assert 0 <= row["age"] < 5
+    assert row["crawl_delay_seconds"] == 2.5
+
+
+@pytest.mark.asyncio
+async def test_report(frontier):
+    (seed,) = await _lease_all(frontier)
+    links = [_link("/a"), _link("/b"), _link("/", "other.com")]
+    fetched = [(seed.url_id, "fetched", 200, "text/html", 100, None, None, "abc")]
+    await frontier.write_batch(RUN, OWNER, links, fetched, [], [(seed.url_id, "k")], [], [])
+    items = await _lease_all(frontier)
+    errors = [(items[0].url_id, "timeout", "slow")]
+    await frontier.write_batch(RUN, OWNER, [], [], errors, [], [], [])
+    await frontier.finish_run(RUN, {"m": 1})
+
+    out = io.StringIO()
+    assert await frontier.write_report(RUN, out, "json")
+    report = json.loads(out.getvalue())
+    assert report["run_id"] == RUN
+    assert report["seed_domain"] == "example.com"
+    assert report["finished_at"].endswith("+00:00")
+    assert report["metrics"] == {"m": 1}
+    assert [page["url"] for page in report["pages"]] == [
+        "http://example.com/",
+        "http://example.com/a",
+        "http://example.com/b",
+        "http://other.com/",
+    ]
+    assert report["pages"][0]["stored_object_key"] == "k"
+    assert report["errors"][0]["error_type"] == "timeout"
+    assert report["summary"] == {
+        "urls": 4,
+        "domains": 2,
+        "content_bytes": 100,
+        "stored": 1,
+        "by_status": {"error": 1, "fetched": 1, "new": 2},
+        "by_http_status": {"200": 1},
+        "errors_by_type": {"timeout": 1},
+    }
+
+    out = io.StringIO()
+    assert await frontier.write_report(RUN, out, "ndjson")
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [r["type"] for r in records] == ["run"] + ["page"] * 4 + ["error"]
+    assert not await frontier.write_report("no-such-run", io.StringIO())
+
+
+@pytest.mark.asyncio
+async def test_report_through_the_configured_frontier(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "frontier", "sqlite")
+    monkeypatch.setattr(settings, "sqlite_path", str(tmp_path / "crawler.db"))
+    frontier = create_frontier()
+    try:
+        await frontier.create_run(RUN, "http://example.com/")
+        out = io.StringIO()
+        assert await frontier.write_report(RUN, out)
+    finally:
+        await frontier.close()
+    assert json.loads(out.getvalue())["pages"][0]["status"] == "new"
+
+
+PAGES = {
+    "/": '<a href="/a">a</a> <a href="/b">b</a> <a href="http://other.com/">x</a>',
+    "/a": '<a href="/b">b</a> <a href="/private/c">c</a>',
+    "/b": '<a href="/">home</a>',
+}
+
+
+def _site(request):
+    if request.url.path == "/robots.txt":
+        return httpx.Response(200, text="User-agent: *\nDisallow: /private")
+    body = PAGES.get(request.url.path)
+    if body is None:
+        return httpx.Response(404)
+    return httpx.Response(200, html=f"<html><body>{body}</body></html>")
+
+
+def _crawl_settings(tmp_path, monkeypatch):
+    for name, value in {
+        "frontier": "sqlite",
+        "sqlite_path": str(tmp_path / "crawler.db"),
+        "storage_backend": "warc",
+        "warc_target": "local",
+        "warc_dir": str(tmp_path / "warc"),
+        # Segments are sealed when the crawl runs out of work, not by age
+        "warc_segment_max_seconds": 3600.0,
+        "parse_workers": 0,
+        "default_crawl_delay": 0.0,
+        "queue_poll_interval": 0.05,
+        "checkpoint_interval": 0.0,
+        "metrics_port": 0,
+        "dns_cache_size": 0,
+    }.items():
+        monkeypatch.setattr(settings, name, value)
+
+
+@pytest.mark.asyncio
+async def test_runner_crawls_with_sqlite_frontier(tmp_path, monkeypatch):
+    _crawl_settings(tmp_path, monkeypatch)
+
+    runner = Runner("crawl-1", "http://example.com/")
+    await runner.http_client.aclose()
+    runner.http_client = httpx.AsyncClient(transport=httpx.MockTransport(_site))
+    runner.robots_cache.client = runner.http_client
+    await runner.start()
+
+    assert runner.stats["fetched"] == 3
+    frontier = SqliteFrontier(settings.sqlite_path)
+    try:
+        rows = await frontier._call(
+            lambda db: db.execute("SELECT url, status, stored_object_key FROM urls").fetchall()
+        )
+        run = await frontier._call(lambda db: db.execute("SELECT * FROM crawl_runs").fetchone())
+    finally:
+        await frontier.close()
+    statuses = {url: status for url, status, _ in rows}
+    assert statuses == {
+        "http://example.com/": "fetched",
+        "http://example.com/a": "fetched",
+        "http://example.com/b": "fetched",
+        "http://other.com/": "new",
+        "http://example.com/private/c": "new",
+    }
+    assert all(key for url, status, key in rows if status == "fetched")
+    assert (run["total_fetched"], run["total_discovered"]) == (3, 5)
+    assert run["finished_at"] is not None
+
+
+@pytest.mark.asyncio
+async def test_transient_failures_are_retried_later(tmp_path, monkeypatch):
+    _crawl_settings(tmp_path, monkeypatch)
+    monkeypatch.setattr(settings, "rate_backoff_factor", 0.05)
+    monkeypatch.setattr(settings, "retry_base_delay", 0.05)
+    requests = []
+
+    def site(request):
+        requests.append(request.url.path)
+        if request.url.path == "/a" and requests.count("/a") < 3:
+            return httpx.Response(429, headers={"retry-after": "0"})
+        if request.url.path == "/b" and requests.count("/b") < 2:
+            raise httpx.ReadTimeout("timed out", request=request)
+        return _site(request)
+
+    runner = Runner("crawl-1", "http://example.com/")
+    await runner.http_client.aclose()
+    runner.http_client = httpx.AsyncClient(transport=httpx.MockTransport(site))
+    runner.robots_cache.client = runner.http_client
+    await runner.start()
+
+    assert (requests.count("/a"), requests.count("/b")) == (3, 2)
+    assert (runner.stats["fetched"], runner.stats["retried"]) == (3, 3)
+    frontier = SqliteFrontier(settings.sqlite_path)
+    try:
+        rows = await frontier._call(
+            lambda db: db.execute(
+                "SELECT url, status, http_status, fetch_attempts FROM urls"
+            ).fetchall()
+        )
+        errors = await frontier._call(
+            lambda db: db.execute(
+                "SELECT url, error_type FROM fetch_errors JOIN urls ON urls.id = url_id"
+            ).fetchall()
+        )
+    finally:
+        await frontier.close()
+    urls = {url: tuple(rest) for url, *rest in rows}
+    assert urls["http://example.com/a"] == ("fetched", 200, 3)
+    assert urls["http://example.com/b"] == ("fetched", 200, 2)
+    assert [tuple(error) for error in errors] == [("http://example.com/b", "read_timeout")]
+
+
+@pytest.mark.asyncio
+async def test_recrawl_finds_identical_bodies_unchanged(tmp_path, monkeypatch):
+    _crawl_settings(tmp_path, monkeypatch)
+
+    for run_id, recrawl_of in (("crawl-1", None), ("crawl-2", "crawl-1")):
+        runner = Runner(run_id, "http://example.com/", recrawl_of=recrawl_of)
+        await runner.http_client.aclose()
+        runner.http_client = httpx.AsyncClient(transport=httpx.MockTransport(_site))
+        runner.robots_cache.client = runner.http_client
+        await runner.start()
+
+    # The site sends no validators, so only the body hashes tell the pages are the same
+    assert (runner.stats["fetched"], runner.stats["unchanged"]) == (0, 3)
+
+
+@pytest.mark.asyncio
+async def test_urls_wait_for_robots_txt_that_failed(tmp_path, monkeypatch):
+    _crawl_settings(tmp_path, monkeypatch)
+    monkeypatch.setattr(settings, "robots_error_ttl", 0.1)
+    requests = []
+
+    def site(request):
+        requests.append(request.url.path)
+        if request.url.path == "/robots.txt" and requests.count("/robots.txt") == 1:
+            raise httpx.ConnectTimeout("timed out", request=request)
+        return _site(request)
+
+    runner = Runner("crawl-1", "http://example.com/")
+    await runner.http_client.aclose()
+    runner.http_client = httpx.AsyncClient(transport=httpx.MockTransport(site))
+    runner.robots_cache.client = runner.http_client
+    await runner.start()
+
+    # The seed waited for robots.txt instead of being dropped as disallowed
+    assert requests[:3] == ["/robots.txt", "/robots.txt", "/"]
+    assert (runner.stats["fetched"], runner.stats["retried"]) == (3, 1)
+
+
+@pytest.mark.asyncio
+async def test_bloom_hits_are_confirmed_against_the_frontier(tmp_path, monkeypatch):
+    _crawl_settings(tmp_path, monkeypatch)
+    runner = Runner("crawl-1", "http://example.com/")
+    try:
+        await runner.frontier.create_run("crawl-1", "http://example.com/")
+        runner.seen_urls = SeenFilter(memory_bytes=4096, fp_rate=0.01, recent_size=5)
+        known = [_link(f"/known/{i}") for i in range(200)]
+        await runner._add_links(known)
+        await runner.persistence.flush()
+        assert runner.seen_urls.stats()["mode"] == "bloom"
+
+        # Long evicted from the recent set, the known links are Bloom hits
+        # that the frontier confirms; only the new links are kept
+        new = [_link(f"/new/{i}") for i in range(10)]
+        await runner._add_links(known + new)
+        assert runner.seen_urls.stats()["unconfirmed_hits"] >= len(known) - 5
+        assert runner.persistence._links == new
+    finally:
+        await runner.frontier.close()
+        await runner.http_client.aclose()
@@ -0,0 +1,135 @@
+"""Test the background HTML upload stage."""
+
+import asyncio
+import contextlib
+import gzip
+
+import pytest
+
+from app.config import settings
+from app.storage import Storage
+
+
+class FakeS3:
+    """In-memory stand-in for the aioboto3 S3 client."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.objects = {}
+        self.in_flight = 0
+        self.peak = 0
+
+    async def head_bucket(self, Bucket):
+        pass
+
+    async def put_object(self, Bucket, Key, Body, **kwargs):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        self.objects[Key] = (Body, kwargs)
+
+
+@pytest.fixture
+def fake_s3(monkeypatch):
+    s3 = FakeS3(delay=0.01)
+
+    @contextlib.asynccontextmanager
+    async def client(*args, **kwargs):
+        yield s3
+
+    storage = Storage()
+    monkeypatch.setattr(storage.session, "client", client)
+    return storage, s3
+
+
+@pytest.mark.asyncio
+async def test_uploads_drain_on_close(fake_s3, monkeypatch):
+    monkeypatch.setattr(settings, "storage_upload_concurrency", 3)
+    monkeypatch.setattr(settings, "storage_queue_size", 2)
+    storage, s3 = fake_s3
+    stored = {}
+
+    async def on_stored(url_id, key):
+        stored[url_id] = key
+
+    await storage.start(on_stored=on_stored)
+    for i in range(10):
+        await storage.submit(i, f"http://a.test/{i}", b"<html></html>")
+    await storage.close()
+
+    # Identical bodies share one content-addressed object
+    assert len(s3.objects) == 1
+    assert set(stored) == set(range(10))
+    assert set(stored.values()) == set(s3.objects)
+    assert s3.peak <= 3
+
+
+@pytest.mark.asyncio
+async def test_bodies_stored_compressed_by_content_hash(fake_s3):
+    storage, s3 = fake_s3
+    await storage.start()
+    body = b"<html>" + b"<p>hello</p>" * 100 + b"</html>"
+    key = await storage.store_html("http://a.test/", body)
+    again = await storage.store_html("http://mirror.test/", body)
+    other = await storage.store_html("http://a.test/other", b"<html>other</html>")
+    await storage.close()
+
+    assert key == again != other
+    assert key.startswith("html/") and key.endswith(".html.gz")
+    payload, extra = s3.objects[key]
+    assert gzip.decompress(payload) == body
+    assert len(payload) < len(body)
+    assert extra["ContentEncoding"] == "gzip"
+    assert extra["Metadata"]["original-size"] == str(len(body))
+    assert storage.stats["uploaded"] == 2
+    assert storage.stats["deduplicated"] == 1
+
+
+@pytest.mark.asyncio
+async def test_later_run_rewrites_the_same_object(fake_s3):
+    storage, s3 = fake_s3
+    await storage.start()
+    key = await storage.store_html("http://a.test/", b"<html></html>")
+    await storage.close()
+
+    # A later run starts with an empty in-memory index
+    storage._stored_keys.clear()
+    await storage.start()
+    assert await storage.store_html("http://b.test/", b"<html></html>") == key
+    await storage.close()
+    # No HEAD first: the PUT lands on the same content-addressed object
+    assert storage.stats["uploaded"] == 2
+    assert list(s3.objects) == [key]
+
+
+@pytest.mark.asyncio
+async def test_known_keys_are_bounded(fake_s3, monkeypatch):
+    monkeypatch.setattr(settings, "storage_known_keys", 2)
+    storage, s3 = fake_s3
+    await storage.start()
+    keys = [await storage.store_html(f"http://a.test/{i}", b"page %d" % i) for i in range(3)]
+    assert list(storage._stored_keys) == keys[1:]
+
+    # An evicted key is uploaded again over the same object
+    assert await storage.store_html("http://b.test/", b"page 0") == keys[0]
+    await storage.close()
+    assert storage.stats["uploaded"] == 4
+    assert len(s3.objects) == 3
+    assert len(storage._stored_keys) == 2
+
+
+@pytest.mark.asyncio
+async def test_submit_blocks_when_queue_full(fake_s3, monkeypatch):
+    monkeypatch.setattr(settings, "storage_upload_concurrency", 1)
+    monkeypatch.setattr(settings, "storage_queue_size", 1)
+    storage, s3 = fake_s3
+    s3.delay = 0.2
+
+    await storage.start()
+    await storage.submit(1, "http://a.test/1", b"a")  # taken by the worker
+    await asyncio.sleep(0)
+    await storage.submit(2, "http://a.test/2", b"b")  # fills the queue
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(storage.submit(3, "http://a.test/3", b"c"), 0.05)
+    await storage.close()
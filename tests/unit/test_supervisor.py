@@ -0,0 +1,110 @@
+"""Test host sharding, link routing and run termination."""
+
+import asyncio
+import multiprocessing
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+from app.config import settings
+from app.supervisor import ShardLink, Supervisor, shard_for
+
+
+def test_shard_for_is_stable_and_spreads_hosts():
+    hosts = [f"host{i}.example.com" for i in range(4000)]
+    shards = [shard_for(host, 4) for host in hosts]
+    assert shards == [shard_for(host, 4) for host in hosts]
+    counts = Counter(shards)
+    assert set(counts) == {0, 1, 2, 3}
+    assert min(counts.values()) > 800
+
+
+def _links(domains):
+    return [(f"http://{d}/", f"http://{d}/", d, True) for d in domains]
+
+
+@pytest.mark.asyncio
+async def test_links_are_routed_to_owning_shard():
+    inboxes = [multiprocessing.Queue() for _ in range(3)]
+    progress = multiprocessing.Queue()
+    sender = ShardLink(0, 3, inboxes, progress)
+    receiver = ShardLink(1, 3, inboxes, progress)
+
+    domains = [f"h{i}.test" for i in range(50)]
+    own = sender.route_links(_links(domains))
+    assert {link[2] for link in own} == {d for d in domains if shard_for(d, 3) == 0}
+    assert sender.sent == 2
+
+    received = []
+
+    async def on_links(links):
+        received.extend(links)
+
+    receiver.start(on_links=on_links, on_hosts=lambda hosts: None)
+    while receiver.received < 1:
+        assert await receiver.wait_for_work(1)
+    assert {link[2] for link in received} == {d for d in domains if shard_for(d, 3) == 1}
+
+    receiver.report(True, fetched=3)
+    report = progress.get(timeout=1)
+    assert report == {"shard": 1, "idle": True, "sent": 0, "received": 1, "fetched": 3}
+
+    inboxes[1].put(("stop", None))
+    assert not await receiver.wait_for_work(1)
+    await receiver.close()
+
+
+@pytest.mark.asyncio
+async def test_messages_handled_since_the_last_report_are_not_missed():
+    inboxes = [multiprocessing.Queue() for _ in range(2)]
+    progress = multiprocessing.Queue()
+    receiver = ShardLink(1, 2, inboxes, progress)
+    events = []
+
+    async def on_links(links):
+        events.append("links")
+
+    receiver.start(
+        on_links=on_links, on_hosts=lambda hosts: None, on_message=lambda: events.append("message")
+    )
+    receiver.report(True)
+    inboxes[1].put(("links", _links(["a.test"])))
+    while receiver.received < 1:
+        await asyncio.sleep(0.01)
+    assert events == ["message", "links"]
+
+    # The last report predates the message, so there is no waiting for more
+    started = time.monotonic()
+    assert await receiver.wait_for_work(5)
+    assert time.monotonic() - started < 1
+
+    receiver.report(True)
+    started = time.monotonic()
+    assert await receiver.wait_for_work(0.2)
+    assert time.monotonic() - started >= 0.2
+    await receiver.close()
+
+
+def _supervise_in_thread(supervisor):
+    thread = threading.Thread(target=supervisor._supervise, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_supervisor_waits_for_in_flight_messages(monkeypatch):
+    monkeypatch.setattr(settings, "queue_poll_interval", 0.05)
+    supervisor = Supervisor("run", "http://a.test/", workers=2)
+
+    # Both idle, but one message sent and not yet handled
+    supervisor._progress.put({"shard": 0, "idle": True, "sent": 1, "received": 0, "fetched": 2})
+    supervisor._progress.put({"shard": 1, "idle": True, "sent": 0, "received": 0, "fetched": 0})
+    thread = _supervise_in_thread(supervisor)
+    thread.join(0.5)
+    assert thread.is_alive()
+
+    supervisor._progress.put({"shard": 1, "idle": True, "sent": 0, "received": 1, "fetched": 1})
+    thread.join(2)
+    assert not thread.is_alive()
+    assert supervisor._totals()["fetched"] == 3
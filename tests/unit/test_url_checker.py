@@ -0,0 +1,98 @@
+"""Test robots.txt rules and fetching."""
+
+import urllib.robotparser
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.url_checker import RobotsCache, RobotsRules
+
+AGENT = "ModularWebCrawler/0.1.0"
+
+ROBOTS_FILES = [
+    "",
+    "User-agent: *\nDisallow: /",
+    "User-agent: *\nDisallow:",
+    "User-agent: *\nDisallow: /private\nAllow: /private/open\nCrawl-delay: 2.5",
+    "User-agent: *\nAllow: /private/open\nDisallow: /private\n",
+    "User-agent: googlebot\nDisallow: /\n\nUser-agent: modularwebcrawler\nDisallow: /only-us\n"
+    "Crawl-delay: 5\n\nUser-agent: *\nDisallow: /everyone",
+    "User-agent: other\nDisallow: /\n",
+    "User-agent: *\nDisallow: /a%20b\nDisallow: /caf%C3%A9\nDisallow: /q?x=1\nDisallow: /*\n",
+    "# comment\nUser-agent: *\nDisallow: /tmp/ # trailing\nDisallow: /cgi-bin\n",
+]
+
+URLS = [
+    "http://example.com/",
+    "http://example.com/private",
+    "http://example.com/private/open/page",
+    "http://example.com/private/x",
+    "http://example.com/only-us/a",
+    "http://example.com/everyone",
+    "http://example.com/a b",
+    "http://example.com/a%20b/c",
+    "http://example.com/café",
+    "http://example.com/q?x=1&y=2",
+    "http://example.com/tmp/file",
+    "http://example.com/cgi-bin/run",
+    "http://example.com/*literal",
+    "http://example.com",
+]
+
+
+@pytest.mark.parametrize("robots_txt", ROBOTS_FILES)
+def test_rules_match_robotparser(robots_txt):
+    reference = urllib.robotparser.RobotFileParser()
+    reference.parse(robots_txt.splitlines())
+    rules = RobotsRules.parse(robots_txt, AGENT)
+
+    for url in URLS:
+        assert rules.can_fetch(url) == reference.can_fetch(AGENT, url), url
+    assert rules.crawl_delay == reference.crawl_delay(AGENT)
+
+
+def _cache(handler):
+    return RobotsCache(httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "status,allowed,ttl,persisted",
+    [
+        (404, True, "robots_ttl", ""),
+        (403, False, "robots_ttl", None),
+        (503, False, "robots_error_ttl", None),
+    ],
+)
+async def test_fetch_status_handling(status, allowed, ttl, persisted):
+    cache = _cache(lambda request: httpx.Response(status))
+    rules, cache_for, robots_txt = await cache.fetch_robots_txt("example.com")
+    assert rules.can_fetch("http://example.com/page") is allowed
+    assert rules.unavailable is (status >= 500)
+    assert cache_for == getattr(settings, ttl)
+    assert robots_txt == persisted
+
+
+@pytest.mark.asyncio
+async def test_fetch_timeout_is_cached_negatively():
+    def handler(request):
+        raise httpx.ReadTimeout("timed out", request=request)
+
+    rules, cache_for, robots_txt = await _cache(handler).fetch_robots_txt("example.com")
+    # Unavailable, not disallowed: nothing is fetched until robots.txt is tried again
+    assert rules.unavailable and not rules.disallow_all
+    assert not rules.can_fetch("http://example.com/page")
+    assert cache_for == settings.robots_error_ttl
+    assert robots_txt is None
+
+
+@pytest.mark.asyncio
+async def test_fetch_parses_body():
+    body = "User-agent: *\nDisallow: /private\nCrawl-delay: 3"
+    cache = _cache(lambda request: httpx.Response(200, text=body))
+    rules, cache_for, robots_txt = await cache.fetch_robots_txt("example.com")
+    assert not rules.can_fetch("http://example.com/private/x")
+    assert rules.can_fetch("http://example.com/public")
+    assert rules.crawl_delay == 3
+    assert robots_txt == body
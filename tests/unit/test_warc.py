@@ -0,0 +1,183 @@
+"""Test the WARC segment storage backend."""
+
+import asyncio
+import contextlib
+import gzip
+
+import pytest
+
+from app.config import settings
+from app.warc import WarcStorage, parse_key, parse_record
+
+
+def page(i: int) -> bytes:
+    return f"<html><body>page {i}</body></html>".encode()
+
+
+@pytest.fixture
+def local_warc(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "warc_target", "local")
+    monkeypatch.setattr(settings, "warc_dir", str(tmp_path))
+    return tmp_path
+
+
+async def start(storage):
+    stored = {}
+
+    async def on_stored(url_id, key):
+        stored[url_id] = key
+
+    await storage.start(on_stored=on_stored)
+    return stored
+
+
+@pytest.mark.asyncio
+async def test_pages_are_read_back_by_range(local_warc):
+    storage = WarcStorage()
+    stored = await start(storage)
+    for i in range(5):
+        await storage.submit(i, f"http://a.test/{i}", page(i))
+    # Nothing is reported before the segment is sealed
+    assert stored == {}
+    await storage.close()
+
+    assert sorted(stored) == list(range(5))
+    segments = {parse_key(key)[0] for key in stored.values()}
+    assert len(segments) == 1
+    assert not list(local_warc.rglob("*.open"))
+    for i, key in stored.items():
+        assert await storage.read(key) == page(i)
+
+    # The whole segment is a valid multi-member gzip WARC file
+    data = gzip.decompress((local_warc / segments.pop()).read_bytes())
+    assert data.count(b"WARC/1.1\r\n") == 6  # warcinfo plus one record per page
+    headers, _ = parse_record(data[data.index(b"WARC/1.1", 10) :])
+    assert headers["WARC-Type"] == "resource"
+
+
+@pytest.mark.asyncio
+async def test_identical_bodies_share_a_record(local_warc):
+    storage = WarcStorage()
+    stored = await start(storage)
+    await storage.submit(1, "http://a.test/1", page(0))
+    await storage.submit(2, "http://a.test/2", page(0))
+    await storage.close()
+    assert stored[1] == stored[2]
+    assert storage.stats["records"] == 1
+    assert storage.stats["deduplicated"] == 1
+
+
+@pytest.mark.asyncio
+async def test_segments_roll_by_size_and_age(local_warc, monkeypatch):
+    monkeypatch.setattr(settings, "warc_segment_size_mb", 0)
+    storage = WarcStorage()
+    stored = await start(storage)
+    await storage.submit(1, "http://a.test/1", page(1))
+    await storage.submit(2, "http://a.test/2", page(2))
+    await asyncio.sleep(0.05)
+    # Every record fills a segment, which is sealed and reported right away
+    assert len({parse_key(key)[0] for key in stored.values()}) == 2
+    await storage.close()
+
+    monkeypatch.setattr(settings, "warc_segment_size_mb", 256)
+    monkeypatch.setattr(settings, "warc_segment_max_seconds", 0.0)
+    storage = WarcStorage()
+    stored = await start(storage)
+    await storage.submit(3, "http://a.test/3", page(3))
+    await asyncio.sleep(1.2)
+    assert 3 in stored
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_flush_seals_the_open_segment(local_warc):
+    storage = WarcStorage()
+    stored = await start(storage)
+    await storage.submit(1, "http://a.test/1", page(1))
+    await storage.flush()
+    assert 1 in stored
+    assert not list(local_warc.rglob("*.open"))
+
+    # Later pages go to a new segment
+    await storage.submit(2, "http://a.test/2", page(2))
+    await storage.close()
+    assert parse_key(stored[1])[0] != parse_key(stored[2])[0]
+
+
+@pytest.mark.asyncio
+async def test_known_digests_are_bounded(local_warc, monkeypatch):
+    monkeypatch.setattr(settings, "storage_known_keys", 2)
+    storage = WarcStorage()
+    stored = await start(storage)
+    for i in range(3):
+        await storage.submit(i, f"http://a.test/{i}", page(i))
+    await storage.flush()
+    assert len(storage._digests) == 2
+
+    # A body still remembered is not written again; one that fell out is
+    await storage.submit(10, "http://a.test/10", page(2))
+    await storage.submit(11, "http://a.test/11", page(0))
+    await storage.close()
+    assert stored[10] == stored[2]
+    assert stored[11] != stored[0]
+    assert storage.stats["records"] == 4
+
+
+class FakeMultipartS3:
+    """In-memory stand-in for the multipart calls of the aioboto3 S3 client."""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+
+    async def head_bucket(self, Bucket):
+        pass
+
+    async def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self.uploads[Key] = []
+        return {"UploadId": Key}
+
+    async def upload_part(self, Bucket, Key, PartNumber, UploadId, Body):
+        self.uploads[Key].append(Body)
+        return {"ETag": str(PartNumber)}
+
+    async def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        assert len(MultipartUpload["Parts"]) == len(self.uploads[Key])
+        self.objects[Key] = b"".join(self.uploads.pop(Key))
+
+    async def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(Key, None)
+
+    async def get_object(self, Bucket, Key, Range):
+        start, end = (int(n) for n in Range.removeprefix("bytes=").split("-"))
+        body = self.objects[Key][start : end + 1]
+
+        class Body:
+            async def read(self):
+                return body
+
+        return {"Body": Body()}
+
+
+@pytest.mark.asyncio
+async def test_segments_upload_as_multipart(local_warc, monkeypatch):
+    monkeypatch.setattr(settings, "warc_target", "s3")
+    s3 = FakeMultipartS3()
+
+    @contextlib.asynccontextmanager
+    async def client(*args, **kwargs):
+        yield s3
+
+    storage = WarcStorage()
+    monkeypatch.setattr(storage.session, "client", client)
+    stored = await start(storage)
+    for i in range(3):
+        await storage.submit(i, f"http://a.test/{i}", page(i))
+    await storage.close()
+
+    assert len(s3.objects) == 1
+    # The spool file is removed once uploaded
+    assert not [p for p in local_warc.rglob("*") if p.is_file()]
+    storage._client = s3
+    for i, key in stored.items():
+        assert await storage.read(key) == page(i)